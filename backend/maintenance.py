@@ -0,0 +1,144 @@
+"""Maintenance jobs for the QuizVoice backend.
+
+Run from the backend directory with the same environment as the server:
+
+    python maintenance.py rebuild-summaries
+    python maintenance.py rebuild-summaries --user user_abc123
+    python maintenance.py backfill-rollups
+    python maintenance.py migrate-memberships
+    python maintenance.py backfill-progress-content
+    python maintenance.py backfill-leaderboards
+    python maintenance.py import-report --top 20
+    python maintenance.py mongo-status
+
+To try analytics read routing locally, run a single-node replica set
+(`mongod --replSet rs0`, then `rs.initiate()` in mongosh) and set
+MONGO_URL=mongodb://localhost:27017/?replicaSet=rs0 with
+ANALYTICS_MONGO_READ_PREFERENCE=secondaryPreferred; mongo-status shows
+where each client's reads go (only exports follow that setting).
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+import server
+
+
+async def rebuild_summaries(args):
+    if args.user:
+        await server.rebuild_student_summary(args.user)
+        return f"Rebuilt summary for {args.user}"
+    count = await server.rebuild_all_student_summaries()
+    return f"Rebuilt {count} student summaries"
+
+
+async def backfill_rollups(args):
+    count = await server.backfill_rollups()
+    return f"Replayed {count} answers into daily rollups"
+
+
+async def migrate_memberships(args):
+    count = await server.migrate_class_memberships()
+    return f"Migrated {count} classes to class_memberships"
+
+
+async def backfill_progress_content(args):
+    count = await server.backfill_progress_content_fields()
+    return f"Copied attributes of {count} content items onto student_progress"
+
+
+async def backfill_leaderboards(args):
+    count = await server.backfill_rewards_grades()
+    return f"Copied grades of {count} students onto rewards"
+
+
+async def import_report(args):
+    # A fresh interpreter, so nothing is already imported
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, "-X", "importtime", "-c", "import server",
+        cwd=Path(__file__).parent,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    _, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise SystemExit(stderr.decode(errors="replace"))
+
+    # Lines look like "import time:       412 |       9120 |   fastapi"
+    modules = []
+    for line in stderr.decode().splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules.append((int(cumulative), name.rstrip()))
+    total = next(us for us, name in modules if name.strip() == "server")
+    # Nesting is shown by indentation: server has one leading space, its direct imports three
+    direct = sorted(
+        ((us, name.strip()) for us, name in modules if len(name) - len(name.lstrip()) == 3),
+        reverse=True,
+    )
+
+    lines = [f"{'module':<40}{'cumulative ms':>14}"]
+    lines += [f"{name:<40}{us / 1000:>14.1f}" for us, name in direct[:args.top]]
+    budget_ms = server.IMPORT_BUDGET_SECONDS * 1000
+    verdict = "over" if total / 1000 > budget_ms else "within"
+    lines.append(f"\nimport server: {total / 1000:.0f}ms, {verdict} the {budget_ms:.0f}ms budget (IMPORT_BUDGET_SECONDS)")
+    return "\n".join(lines)
+
+
+async def mongo_status(args):
+    lines = []
+    for label, database in (("app", server.db), ("analytics", server.analytics_db), ("exports", server.export_db)):
+        hello = await database.command("hello")
+        mongo = database.client
+        pool = mongo.options.pool_options
+        lines.append(
+            f"{label}: {database.read_preference.mongos_mode} reads, "
+            f"pool {pool.min_pool_size}-{pool.max_pool_size}, "
+            f"replica set {hello.get('setName', '-')} "
+            f"({', '.join(hello.get('hosts', [])) or 'standalone'})"
+        )
+    lines.append(f"analytics query budget: {server.ANALYTICS_MAX_TIME_MS}ms (ANALYTICS_MAX_TIME_MS)")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QuizVoice maintenance jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    rebuild = subparsers.add_parser("rebuild-summaries", help="Recompute student_summary documents")
+    rebuild.add_argument("--user", help="Only rebuild this user_id")
+    rebuild.set_defaults(job=rebuild_summaries)
+
+    rollups = subparsers.add_parser("backfill-rollups", help="Rebuild daily analytics rollups before today from quiz_answers")
+    rollups.set_defaults(job=backfill_rollups)
+
+    memberships = subparsers.add_parser("migrate-memberships", help="Move Class.student_ids into class_memberships")
+    memberships.set_defaults(job=migrate_memberships)
+
+    progress_content = subparsers.add_parser(
+        "backfill-progress-content",
+        help="Copy topic/difficulty/grade/term onto student_progress (runs once by itself at startup)"
+    )
+    progress_content.set_defaults(job=backfill_progress_content)
+
+    boards = subparsers.add_parser("backfill-leaderboards", help="Copy student grades onto rewards for grade leaderboards")
+    boards.set_defaults(job=backfill_leaderboards)
+
+    imports = subparsers.add_parser("import-report", help="Break down the time taken to import server")
+    imports.add_argument("--top", type=int, default=15, help="Number of modules to list")
+    imports.set_defaults(job=import_report)
+
+    status = subparsers.add_parser("mongo-status", help="Show pool and read routing for the app and analytics clients")
+    status.set_defaults(job=mongo_status)
+
+    args = parser.parse_args()
+    try:
+        print(asyncio.run(args.job(args)))
+    finally:
+        server.close_mongo_client()
+
+
+if __name__ == "__main__":
+    main()
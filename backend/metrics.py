@@ -0,0 +1,239 @@
+"""Minimal Prometheus text-format metrics for the QuizVoice backend."""
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def header(self) -> str:
+        return f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.kind}\n"
+
+    def render(self) -> str:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> str:
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + "".join(
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}\n"
+            for labels, value in items
+        )
+
+
+class Gauge(Metric):
+    """A settable gauge, or one read from `function` at scrape time"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[tuple, float] = {}
+        self.function = function
+
+    def set(self, value: float, *labels: str):
+        with self.lock:
+            self.values[labels] = value
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def get(self, *labels: str) -> float:
+        with self.lock:
+            return self.values.get(labels, 0)
+
+    def render(self) -> str:
+        if self.function is not None:
+            return self.header() + f"{self.name} {format_value(self.function())}\n"
+        with self.lock:
+            items = sorted(self.values.items())
+        return self.header() + "".join(
+            f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}\n"
+            for labels, value in items
+        )
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # labels -> [per-bucket counts..., count, sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels: str):
+        with self.lock:
+            series = self.values.get(labels)
+            if series is None:
+                series = self.values[labels] = [0] * len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> str:
+        with self.lock:
+            items = sorted((labels, list(series)) for labels, series in self.values.items())
+        lines = [self.header()]
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = format_labels(self.labelnames, labels, f'le="{format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{le} {cumulative}\n")
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_count{label_text} {series[-2]}\n")
+            lines.append(f"{self.name}_sum{label_text} {format_value(series[-1])}\n")
+        return "".join(lines)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self.metrics.values())
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames=()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames=(), function=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, function))
+
+
+def histogram(name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+class RequestTrace:
+    """Database and external-call time accumulated while serving one request"""
+    __slots__ = ("request_id", "db_ops", "db_seconds", "external_seconds")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        # (collection, command, outcome, seconds) in completion order
+        self.db_ops: List[Tuple[str, str, str, float]] = []
+        self.db_seconds = 0.0
+        self.external_seconds = 0.0
+
+    def record_db(self, collection: str, command: str, outcome: str, seconds: float):
+        self.db_ops.append((collection, command, outcome, seconds))
+        self.db_seconds += seconds
+
+
+# Motor runs PyMongo calls under a copy of the caller's context, so command
+# events see the trace of the request that issued them
+current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+
+mongo_command_seconds = histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command latency by collection, command and outcome",
+    ("collection", "command", "outcome"),
+)
+mongo_commands_in_flight = gauge("mongo_commands_in_flight", "MongoDB commands sent but not yet answered")
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """PyMongo command listener feeding mongo_command_duration_seconds."""
+
+    EWMA_WEIGHT = 0.1
+    # An average older than this says nothing about the database right now
+    EWMA_MAX_AGE_SECONDS = 10.0
+
+    def __init__(self):
+        self.pending: Dict[tuple, str] = {}
+        self.lock = threading.Lock()
+        self.latency_ewma = 0.0
+        self.latency_updated = 0.0
+
+    def recent_latency(self) -> float:
+        if time.monotonic() - self.latency_updated > self.EWMA_MAX_AGE_SECONDS:
+            return 0.0
+        return self.latency_ewma
+
+    def started(self, event):
+        # getMore carries the cursor id under its own name and the collection separately
+        field = "collection" if event.command_name == "getMore" else event.command_name
+        collection = event.command.get(field)
+        if not isinstance(collection, str):
+            collection = ""
+        with self.lock:
+            self.pending[(event.connection_id, event.request_id)] = collection
+        mongo_commands_in_flight.inc()
+
+    def _finish(self, event, outcome: str):
+        seconds = event.duration_micros / 1_000_000
+        with self.lock:
+            collection = self.pending.pop((event.connection_id, event.request_id), "")
+            self.latency_ewma += self.EWMA_WEIGHT * (seconds - self.latency_ewma)
+            self.latency_updated = time.monotonic()
+        mongo_commands_in_flight.dec()
+        mongo_command_seconds.observe(seconds, collection, event.command_name, outcome)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.record_db(collection, event.command_name, outcome, seconds)
+
+    def succeeded(self, event):
+        self._finish(event, "ok")
+
+    def failed(self, event):
+        self._finish(event, "error")
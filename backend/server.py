@@ -1,11 +1,19 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Response, Depends
-from fastapi.responses import StreamingResponse
+import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request, Response, Depends, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse, ORJSONResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders, UploadFile as FormFile
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne, UpdateMany, ReturnDocument, ReadPreference
+from pymongo.errors import ExecutionTimeout
 import os
+import sys
 import logging
 from pathlib import Path
+from urllib.parse import urlsplit
 from pydantic import BaseModel, Field, ConfigDict
 from typing import List, Optional, Dict, Any
 import uuid
@@ -13,29 +21,150 @@ from datetime import datetime, timezone, timedelta
 import csv
 import io
 import re
-from emergentintegrations.llm.openai import OpenAITextToSpeech, OpenAISpeechToText
+import json
+import zlib
+import gzip
+import asyncio
+import bisect
+import math
+import random
+import cProfile
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import brotli
 import base64
-import aiohttp
+import hmac
+import ipaddress
+
+import metrics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+# MongoDB connections, opened on first use so importing the app needs no database config.
+# Pool, timeout, compression and read settings come from <prefix><SUFFIX> env vars
+# (MONGO_MAX_POOL_SIZE, ANALYTICS_MONGO_READ_PREFERENCE, ...); unset ones keep
+# the driver defaults.
+MONGO_CLIENT_OPTIONS = {
+    "MAX_POOL_SIZE": ("maxPoolSize", int),
+    "MIN_POOL_SIZE": ("minPoolSize", int),
+    "MAX_IDLE_TIME_MS": ("maxIdleTimeMS", int),
+    "WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", int),
+    "CONNECT_TIMEOUT_MS": ("connectTimeoutMS", int),
+    "SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", int),
+    "SOCKET_TIMEOUT_MS": ("socketTimeoutMS", int),
+    "COMPRESSORS": ("compressors", str),  # e.g. "zstd,snappy,zlib"
+    "READ_PREFERENCE": ("readPreference", str),
+    "MAX_STALENESS_SECONDS": ("maxStalenessSeconds", int),
+}
+# Teacher analytics run on their own, smaller pool so a slow report cannot
+# take the connections quiz writes need. Cached and ETagged reports always read
+# the primary: they are tagged with data versions read from the primary, and a
+# lagging secondary would cache an old result as current. Only uncached exports
+# follow ANALYTICS_MONGO_READ_PREFERENCE, and may lag by the replication delay.
+ANALYTICS_MONGO_DEFAULTS = {"maxPoolSize": 20}
+ANALYTICS_MAX_TIME_MS = int(os.environ.get('ANALYTICS_MAX_TIME_MS', '5000'))
+
+mongo_command_metrics = metrics.MongoCommandMetrics()
+client: Optional[AsyncIOMotorClient] = None
+analytics_client: Optional[AsyncIOMotorClient] = None
+
+def mongo_client_options(prefix: str) -> Dict[str, Any]:
+    options = {}
+    for suffix, (option, parse) in MONGO_CLIENT_OPTIONS.items():
+        value = os.environ.get(f"{prefix}{suffix}")
+        if value:
+            options[option] = parse(value)
+    return options
+
+def mongo_client() -> AsyncIOMotorClient:
+    global client
+    if client is None:
+        client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            event_listeners=[mongo_command_metrics],
+            appname="quizvoice",
+            **mongo_client_options("MONGO_")
+        )
+    return client
+
+def analytics_mongo_client() -> AsyncIOMotorClient:
+    global analytics_client
+    if analytics_client is None:
+        analytics_client = AsyncIOMotorClient(
+            os.environ.get('ANALYTICS_MONGO_URL') or os.environ['MONGO_URL'],
+            event_listeners=[mongo_command_metrics],
+            appname="quizvoice-analytics",
+            **{**ANALYTICS_MONGO_DEFAULTS, **mongo_client_options("ANALYTICS_MONGO_")}
+        )
+    return analytics_client
+
+def close_mongo_client():
+    for mongo in (client, analytics_client):
+        if mongo is not None:
+            mongo.close()
+
+class LazyDatabase:
+    """The app database on a given client, resolved from DB_NAME on first use"""
+    
+    def __init__(self, client_factory=mongo_client, read_preference=None):
+        self._client_factory = client_factory
+        self._read_preference = read_preference
+        self._database = None
+    
+    def _resolve(self):
+        if self._database is None:
+            self._database = self._client_factory().get_database(
+                os.environ['DB_NAME'], read_preference=self._read_preference
+            )
+        return self._database
+    
+    def __getattr__(self, name):
+        return getattr(self._resolve(), name)
+    
+    def __getitem__(self, name):
+        return self._resolve()[name]
+
+db = LazyDatabase()
+analytics_db = LazyDatabase(analytics_mongo_client, read_preference=ReadPreference.PRIMARY)
+export_db = LazyDatabase(analytics_mongo_client)
 
-# Initialize voice services
-tts = OpenAITextToSpeech(api_key=os.getenv("EMERGENT_LLM_KEY"))
-stt = OpenAISpeechToText(api_key=os.getenv("EMERGENT_LLM_KEY"))
+# Voice services, created on first use: the integration import is heavy and
+# a missing key should only fail the voice routes, not startup
+tts = None
+stt = None
+
+def get_tts():
+    global tts
+    if tts is None:
+        from emergentintegrations.llm.openai import OpenAITextToSpeech
+        tts = OpenAITextToSpeech(api_key=os.getenv("EMERGENT_LLM_KEY"))
+    return tts
+
+def get_stt():
+    global stt
+    if stt is None:
+        from emergentintegrations.llm.openai import OpenAISpeechToText
+        stt = OpenAISpeechToText(api_key=os.getenv("EMERGENT_LLM_KEY"))
+    return stt
 
 # Create the main app
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@app.exception_handler(ExecutionTimeout)
+async def analytics_timeout_handler(request: Request, exc: ExecutionTimeout):
+    """An analytics query ran past ANALYTICS_MAX_TIME_MS"""
+    logger.warning(f"Query time budget exceeded on {request.url.path}: {exc}")
+    return ORJSONResponse(
+        {"detail": "Report is taking too long, try again shortly"},
+        status_code=503,
+        headers={"Retry-After": "10"}
+    )
+
 # ==================== MODELS ====================
 
 class User(BaseModel):
@@ -82,6 +211,12 @@ class StudentProgress(BaseModel):
     last_seen: Optional[datetime] = None
     next_review: Optional[datetime] = None
     confidence_score: float = 0.0  # 0-1 scale
+    # Copied from the content item so analytics don't need to join content
+    topic: Optional[str] = None
+    subtopic: Optional[str] = None
+    difficulty: Optional[str] = None
+    grade: Optional[str] = None
+    term: Optional[str] = None
 
 class QuizSession(BaseModel):
     model_config = ConfigDict(extra="ignore")
@@ -97,6 +232,7 @@ class QuizAnswer(BaseModel):
     model_config = ConfigDict(extra="ignore")
     answer_id: str = Field(default_factory=lambda: f"answer_{uuid.uuid4().hex[:12]}")
     session_id: str
+    user_id: Optional[str] = None  # Not set on answers recorded before rollups
     content_id: str
     user_answer: str
     correct: bool
@@ -123,9 +259,15 @@ class Class(BaseModel):
     teacher_id: str
     class_name: str
     class_code: str = Field(default_factory=lambda: f"{uuid.uuid4().hex[:6].upper()}")
-    student_ids: List[str] = []
+    student_count: int = 0  # Members live in class_memberships
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
+class ClassMembership(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    class_id: str
+    user_id: str
+    joined_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
 class Assignment(BaseModel):
     model_config = ConfigDict(extra="ignore")
     assignment_id: str = Field(default_factory=lambda: f"assign_{uuid.uuid4().hex[:12]}")
@@ -135,6 +277,97 @@ class Assignment(BaseModel):
     assigned_date: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     due_date: Optional[datetime] = None
 
+# ==================== RESPONSE MODELS ====================
+# Lean shapes for hot endpoints: only the fields the UI reads are serialized
+
+class QuizQuestion(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    content_id: str
+    topic: str
+    subtopic: Optional[str] = None
+    difficulty: str
+    question_text: str
+
+class QuizStartResponse(BaseModel):
+    session_id: str
+    questions: List[QuizQuestion]
+
+class AnswerResult(BaseModel):
+    correct: bool
+    confidence: float
+    correct_answer: str
+    explanation: Optional[str] = ""
+
+class StreakSummary(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    current_streak: int = 0
+    longest_streak: int = 0
+
+class RewardsSummary(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    xp: int = 0
+    level: int = 1
+    badges: List[str] = []
+
+class ProgressSummary(BaseModel):
+    total_items: int
+    mastered: int
+    due_for_review: int
+
+class RecentQuiz(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    session_id: str
+    score: int
+    total_questions: int
+    started_at: str
+    completed_at: Optional[str] = None
+
+class DashboardResponse(BaseModel):
+    streak: StreakSummary
+    rewards: RewardsSummary
+    progress: ProgressSummary
+    recent_quizzes: List[RecentQuiz]
+
+class ContentItem(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    content_id: str
+    grade: str
+    term: str
+    topic: str
+    subtopic: Optional[str] = None
+    difficulty: str
+    question_text: str
+    answer_text: str
+    explanation: Optional[str] = None
+    tags: List[str] = []
+    alternate_answers: List[str] = []
+
+class AnalyticsClass(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    class_id: str
+    class_name: str
+    class_code: Optional[str] = None
+    student_count: int = 0
+
+class StudentStats(BaseModel):
+    user_id: str
+    name: str
+    email: str
+    total_items: int
+    mastered: int
+    avg_confidence: float
+
+class TopicPerformance(BaseModel):
+    topic: str
+    accuracy: float
+    total_attempts: int
+
+class ClassAnalyticsResponse(BaseModel):
+    model_config = ConfigDict(populate_by_name=True)
+    class_: AnalyticsClass = Field(alias="class")
+    students: List[StudentStats]
+    topic_performance: List[TopicPerformance]
+
 # ==================== AUTH HELPERS ====================
 
 async def get_current_user(request: Request) -> User:
@@ -145,6 +378,10 @@ async def get_current_user(request: Request) -> User:
         if auth_header and auth_header.startswith("Bearer "):
             token = auth_header.split(" ")[1]
     
+    return await authenticate_token(token)
+
+async def authenticate_token(token: Optional[str]) -> User:
+    """Resolve a session token to its user, shared by HTTP and WebSocket auth"""
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -190,8 +427,10 @@ async def get_me(user: User = Depends(get_current_user)):
 @api_router.get("/auth/callback")
 async def auth_callback(session_id: str, response: Response):
     """Handle OAuth callback and exchange session_id for session_token"""
+    import aiohttp  # Only this route needs it; keeps it out of the import-time budget
+    
     try:
-        async with aiohttp.ClientSession() as session:
+        async with external_call("auth"), aiohttp.ClientSession() as session:
             async with session.get(
                 os.getenv("SESSION_EXTERNAL_API"),
                 headers={"X-Session-ID": session_id}
@@ -298,43 +537,78 @@ async def update_user_role(role: str, grade: Optional[str] = None, user: User =
                 "user_id": user.user_id,
                 "xp": 0,
                 "level": 1,
-                "badges": []
+                "badges": [],
+                "grade": grade
             }
             await db.rewards.insert_one(rewards_doc)
+        elif grade:
+            await db.rewards.update_one({"user_id": user.user_id}, {"$set": {"grade": grade}})
+        if grade and grade != user.grade:
+            await db.xp_weekly.update_many({"user_id": user.user_id}, {"$set": {"grade": grade}})
+            leaderboards.change_grade(user.user_id, user.grade, grade)
     
+    # Cached teacher views of this student include the user document
+    await bump_data_versions([f"student:{user.user_id}"])
     return {"message": "Role updated"}
 
 # ==================== VOICE ROUTES ====================
 
-@api_router.post("/voice/tts")
-async def text_to_speech(text: str, voice: str = "echo"):
-    """Convert text to speech (UK English)"""
-    try:
-        audio_bytes = await tts.generate_speech(
+TTS_CACHE_MAX_BYTES = int(os.environ.get('TTS_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Synthesized mp3 keyed by (voice, text); question text is shared across students
+# so repeated prompts skip the TTS round trip. Bounded by total audio size.
+tts_audio_cache: "OrderedDict[tuple, bytes]" = OrderedDict()
+tts_audio_cache_bytes = 0
+
+async def synthesize_speech(text: str, voice: str = "echo") -> bytes:
+    """mp3 audio for `text`, served from the in-process cache when possible"""
+    global tts_audio_cache_bytes
+    key = (voice, text)
+    audio_bytes = tts_audio_cache.get(key)
+    if audio_bytes is not None:
+        tts_audio_cache.move_to_end(key)
+        return audio_bytes
+    
+    async with external_call("tts"):
+        audio_bytes = await get_tts().generate_speech(
             text=text,
             model="tts-1",
             voice=voice,
             response_format="mp3"
         )
+    if key not in tts_audio_cache and len(audio_bytes) <= TTS_CACHE_MAX_BYTES:
+        tts_audio_cache[key] = audio_bytes
+        tts_audio_cache_bytes += len(audio_bytes)
+        while tts_audio_cache_bytes > TTS_CACHE_MAX_BYTES:
+            _, evicted = tts_audio_cache.popitem(last=False)
+            tts_audio_cache_bytes -= len(evicted)
+    return audio_bytes
+
+@api_router.post("/voice/tts")
+async def text_to_speech(text: str, voice: str = "echo", user: User = Depends(get_current_user)):
+    """Convert text to speech (UK English)"""
+    try:
+        audio_bytes = await synthesize_speech(text, voice)
         return StreamingResponse(io.BytesIO(audio_bytes), media_type="audio/mpeg")
     except Exception as e:
         logger.error(f"TTS error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.post("/voice/stt")
-async def speech_to_text(audio: UploadFile = File(...)):
+async def speech_to_text(audio: UploadFile = File(...), user: User = Depends(get_current_user)):
     """Convert speech to text"""
     try:
         audio_bytes = await audio.read()
         audio_file = io.BytesIO(audio_bytes)
         audio_file.name = "audio.webm"
         
-        response = await stt.transcribe(
-            file=audio_file,
-            model="whisper-1",
-            language="en",
-            response_format="json"
-        )
+        async with external_call("stt"):
+            response = await get_stt().transcribe(
+                file=audio_file,
+                model="whisper-1",
+                language="en",
+                response_format="json"
+            )
         
         return {"text": response.text, "confidence": 0.9}
     except Exception as e:
@@ -344,10 +618,13 @@ async def speech_to_text(audio: UploadFile = File(...)):
 @api_router.post("/voice/validate-answer")
 async def validate_answer(content_id: str, user_answer: str):
     """Validate answer with synonym matching"""
-    content_doc = await db.content.find_one({"content_id": content_id}, {"_id": 0})
+    content_doc = await content_catalog.get(content_id)
     if not content_doc:
         raise HTTPException(status_code=404, detail="Content not found")
     
+    return match_answer(content_doc, user_answer)
+
+def match_answer(content_doc: Dict[str, Any], user_answer: str) -> Dict[str, Any]:
     # Normalize answers
     correct_answer = content_doc["answer_text"].lower().strip()
     user_answer_norm = user_answer.lower().strip()
@@ -367,49 +644,420 @@ async def validate_answer(content_id: str, user_answer: str):
     
     return {"correct": False, "confidence": 0.0, "correct_answer": content_doc["answer_text"]}
 
+# ==================== CONTENT CATALOG ====================
+
+CONTENT_CATALOG_SIZE = int(os.environ.get("CONTENT_CATALOG_SIZE", "50000"))
+CONTENT_CATALOG_REFRESH_SECONDS = float(os.environ.get("CONTENT_CATALOG_REFRESH_SECONDS", "5"))
+CONTENT_FILTER_FIELDS = ("grade", "term", "topic", "difficulty")
+
+class ContentRecord:
+    """Compact in-memory copy of a content document"""
+    __slots__ = (
+        "content_id", "grade", "term", "topic", "subtopic", "difficulty", "question_text",
+        "answer_text", "explanation", "source", "tags", "alternate_answers", "created_at"
+    )
+    
+    def __init__(self, doc: Dict[str, Any]):
+        self.content_id = doc["content_id"]
+        # Filter values repeat across thousands of items, so share one string each
+        self.grade = sys.intern(doc.get("grade") or "")
+        self.term = sys.intern(doc.get("term") or "")
+        self.topic = sys.intern(doc.get("topic") or "")
+        self.difficulty = sys.intern(doc.get("difficulty") or "")
+        self.subtopic = doc.get("subtopic")
+        self.question_text = doc.get("question_text")
+        self.answer_text = doc.get("answer_text")
+        self.explanation = doc.get("explanation")
+        self.source = doc.get("source")
+        self.tags = tuple(doc.get("tags") or ())
+        self.alternate_answers = tuple(doc.get("alternate_answers") or ())
+        self.created_at = doc.get("created_at")
+    
+    def to_dict(self) -> Dict[str, Any]:
+        doc = {field: getattr(self, field) for field in self.__slots__}
+        doc["tags"] = list(self.tags)
+        doc["alternate_answers"] = list(self.alternate_answers)
+        return doc
+
+class ContentCatalog:
+    """Process-wide read-through cache of the content bank: whole if it fits, else LRU point lookups"""
+    
+    def __init__(self, max_records: int):
+        self.max_records = max_records
+        self.records: "OrderedDict[str, ContentRecord]" = OrderedDict()
+        self.by_filters: Dict[tuple, List[str]] = {}
+        self.complete = False
+        self.version: Optional[int] = None
+        self.checked_at = 0.0
+        self.loading: Optional[asyncio.Task] = None
+    
+    def _index(self, record: ContentRecord):
+        key = tuple(getattr(record, field) for field in CONTENT_FILTER_FIELDS)
+        self.by_filters.setdefault(key, []).append(record.content_id)
+    
+    def _unindex(self, record: ContentRecord):
+        key = tuple(getattr(record, field) for field in CONTENT_FILTER_FIELDS)
+        ids = self.by_filters.get(key)
+        if ids and record.content_id in ids:
+            ids.remove(record.content_id)
+            if not ids:
+                del self.by_filters[key]
+    
+    def _remember(self, doc: Dict[str, Any]) -> ContentRecord:
+        """Cache a document fetched on a miss (partial mode only)"""
+        record = self.records[doc["content_id"]] = ContentRecord(doc)
+        self.records.move_to_end(doc["content_id"])
+        while len(self.records) > self.max_records:
+            self._unindex(self.records.popitem(last=False)[1])
+        return record
+    
+    async def load(self, version: int):
+        records: "OrderedDict[str, ContentRecord]" = OrderedDict()
+        complete = await db.content.count_documents({}) <= self.max_records
+        if complete:
+            async for doc in db.content.find({}, {"_id": 0}).batch_size(1000):
+                records[doc["content_id"]] = ContentRecord(doc)
+        self.records = records
+        self.by_filters = {}
+        for record in records.values():
+            self._index(record)
+        self.complete = complete
+        self.version = version
+    
+    def _reload(self, version: int) -> asyncio.Task:
+        if self.loading is None:
+            async def run():
+                try:
+                    await self.load(version)
+                finally:
+                    self.loading = None
+            self.loading = asyncio.create_task(run())
+        return self.loading
+    
+    async def ensure_fresh(self):
+        if self.version is not None and time.monotonic() - self.checked_at < CONTENT_CATALOG_REFRESH_SECONDS:
+            return
+        (version,) = await get_data_versions(["content"])
+        self.checked_at = time.monotonic()
+        if version == self.version:
+            return
+        # Only the first load is waited for; after that the old records serve while one reload runs
+        if self.version is None:
+            await asyncio.shield(self._reload(version))
+        elif self.loading is None:
+            self._reload(version).add_done_callback(self._log_reload_error)
+    
+    @staticmethod
+    def _log_reload_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Content catalog reload error: {task.exception()}")
+    
+    async def get(self, content_id: str) -> Optional[Dict[str, Any]]:
+        docs = await self.get_many([content_id])
+        return docs[0] if docs else None
+    
+    async def get_many(self, content_ids: List[str]) -> List[Dict[str, Any]]:
+        """Documents for the ids that exist, in the order given"""
+        await self.ensure_fresh()
+        found = {cid: self.records[cid] for cid in content_ids if cid in self.records}
+        if not self.complete:
+            for cid in found:
+                self.records.move_to_end(cid)
+        missing = [] if self.complete else [cid for cid in content_ids if cid not in found]
+        if missing:
+            async for doc in db.content.find({"content_id": {"$in": missing}}, {"_id": 0}):
+                found[doc["content_id"]] = self._remember(doc)
+        return [found[cid].to_dict() for cid in content_ids if cid in found]
+    
+    async def find(
+        self,
+        filters: Dict[str, str],
+        exclude_ids: Optional[set] = None,
+        limit: int = 1000
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Filtered listing from the secondary index; None when the catalog is partial"""
+        await self.ensure_fresh()
+        if not self.complete:
+            return None
+        exclude_ids = exclude_ids or set()
+        results = []
+        for key, content_ids in self.by_filters.items():
+            if any(filters.get(field) not in (None, value) for field, value in zip(CONTENT_FILTER_FIELDS, key)):
+                continue
+            for content_id in content_ids:
+                if content_id not in exclude_ids:
+                    results.append(self.records[content_id].to_dict())
+                    if len(results) >= limit:
+                        return results
+        return results
+    
+    async def apply_upload(self, docs: List[Dict[str, Any]]):
+        """Patch uploaded docs in if the catalog was current before the upload's version bump"""
+        if self.version is None:
+            return
+        (version,) = await get_data_versions(["content"])
+        if version != self.version + 1:
+            return
+        for doc in docs:
+            old = self.records.get(doc["content_id"])
+            if self.complete:
+                if old:
+                    self._unindex(old)
+                record = self.records[doc["content_id"]] = ContentRecord(doc)
+                self._index(record)
+            elif old:
+                # Partial catalogs only refresh what they hold; the rest is fetched on a miss
+                self.records[doc["content_id"]] = ContentRecord(doc)
+        self.version = version
+        if self.complete and len(self.records) > self.max_records:
+            await self.load(version)
+
+content_catalog = ContentCatalog(CONTENT_CATALOG_SIZE)
+
+# ==================== CONTENT SEARCH ====================
+
+SEARCH_FIELD_WEIGHTS = {"question_text": 1.0, "answer_text": 1.0, "subtopic": 2.0, "tags": 3.0}
+SEARCH_STOPWORDS = {"a", "an", "and", "are", "at", "in", "is", "it", "of", "on", "or", "the", "to", "what", "which"}
+SEARCH_PREFIX_WEIGHT = 0.5  # Prefix-only matches score half an exact term match
+SEARCH_MAX_PREFIX_TERMS = 50
+
+def search_tokens(text: str) -> List[str]:
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+class ContentSearchIndex:
+    """In-process inverted index over the content bank, rebuilt when the content version moves."""
+    
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.doc_terms: Dict[str, List[str]] = {}
+        self.doc_tags: Dict[str, List[str]] = {}
+        self.tags: Dict[str, set] = {}
+        self.sorted_terms: List[str] = []
+        self.terms_dirty = False
+        self.version: Optional[int] = None
+        self.lock = asyncio.Lock()
+    
+    def add(self, doc: Dict[str, Any]):
+        content_id = doc["content_id"]
+        self.remove(content_id)
+        
+        weights: Dict[str, float] = {}
+        for field, weight in SEARCH_FIELD_WEIGHTS.items():
+            value = doc.get(field) or ""
+            text = " ".join(value) if isinstance(value, list) else value
+            for term in search_tokens(text):
+                weights[term] = weights.get(term, 0.0) + weight
+        
+        for term, weight in weights.items():
+            if term not in self.postings:
+                self.postings[term] = {}
+                self.terms_dirty = True
+            self.postings[term][content_id] = weight
+        tags = [tag.strip().lower() for tag in doc.get("tags") or []]
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(content_id)
+        
+        self.doc_terms[content_id] = list(weights)
+        self.doc_tags[content_id] = tags
+    
+    def remove(self, content_id: str):
+        terms = self.doc_terms.pop(content_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is not None:
+                posting.pop(content_id, None)
+                if not posting:
+                    del self.postings[term]
+                    self.terms_dirty = True
+        for tag in self.doc_tags.pop(content_id, []):
+            self.tags.get(tag, set()).discard(content_id)
+    
+    def expand(self, token: str) -> List[tuple]:
+        """(term, weight multiplier) for the exact term and the first terms it prefixes"""
+        if self.terms_dirty:
+            self.sorted_terms = sorted(self.postings)
+            self.terms_dirty = False
+        matches = []
+        position = bisect.bisect_left(self.sorted_terms, token)
+        while (
+            position < len(self.sorted_terms)
+            and len(matches) < SEARCH_MAX_PREFIX_TERMS
+            and self.sorted_terms[position].startswith(token)
+        ):
+            term = self.sorted_terms[position]
+            matches.append((term, 1.0 if term == token else SEARCH_PREFIX_WEIGHT))
+            position += 1
+        return matches
+    
+    def search(self, query: str, tag: Optional[str]) -> List[tuple]:
+        """(score, content_id) of every match, best first"""
+        tokens = search_tokens(query)
+        tokens = [t for t in tokens if t not in SEARCH_STOPWORDS] or tokens
+        candidates = set(self.tags.get(tag.strip().lower(), set())) if tag else None
+        scores: Dict[str, float] = {}
+        total_docs = len(self.doc_terms) or 1
+        
+        # Every token must match; the last one may be a partial word (search as you type).
+        # Scores add up tf-idf per token
+        for position, token in enumerate(tokens):
+            if position == len(tokens) - 1:
+                terms = self.expand(token)
+            else:
+                terms = [(token, 1.0)] if token in self.postings else []
+            token_scores: Dict[str, float] = {}
+            for term, multiplier in terms:
+                posting = self.postings[term]
+                idf = math.log(1 + total_docs / len(posting))
+                for content_id, weight in posting.items():
+                    score = weight * idf * multiplier
+                    if score > token_scores.get(content_id, 0.0):
+                        token_scores[content_id] = score
+            matched = set(token_scores)
+            candidates = matched if candidates is None else candidates & matched
+            for content_id in matched:
+                scores[content_id] = scores.get(content_id, 0.0) + token_scores[content_id]
+        
+        if candidates is None:
+            return []
+        return sorted(((round(scores.get(content_id, 0.0), 4), content_id) for content_id in candidates), reverse=True)
+    
+    async def rebuild(self, version: int):
+        # Build off to the side so searches during the load see the old index
+        fresh = ContentSearchIndex()
+        projection = {"_id": 0, "content_id": 1, **dict.fromkeys(SEARCH_FIELD_WEIGHTS, 1)}
+        async for doc in db.content.find({}, projection).batch_size(1000):
+            fresh.add(doc)
+        fresh.version = version
+        fresh.lock = self.lock
+        self.__dict__.update(fresh.__dict__)
+    
+    async def ensure_fresh(self):
+        (version,) = await get_data_versions(["content"])
+        if version != self.version:
+            async with self.lock:
+                if version != self.version:
+                    await self.rebuild(version)
+    
+    async def apply_upload(self, docs: List[Dict[str, Any]]):
+        """Patch uploaded docs in if this index was current before the upload's version bump"""
+        if self.version is None:
+            return
+        (version,) = await get_data_versions(["content"])
+        if version == self.version + 1:
+            for doc in docs:
+                self.add(doc)
+            self.version = version
+
+content_search = ContentSearchIndex()
+
+async def resolve_search_results(ranked: List[tuple], filters: Dict[str, str], limit: int) -> List[Dict[str, Any]]:
+    """Documents for the best-ranked ids that pass `filters`, fetched from the catalog a batch at a time"""
+    results = []
+    batch_size = max(limit * 4, 200) if filters else limit
+    for start in range(0, len(ranked), batch_size):
+        batch = ranked[start:start + batch_size]
+        docs = {doc["content_id"]: doc for doc in await content_catalog.get_many([content_id for _, content_id in batch])}
+        for score, content_id in batch:
+            doc = docs.get(content_id)
+            if doc and all(doc.get(field) == value for field, value in filters.items()):
+                results.append({**doc, "score": score})
+                if len(results) >= limit:
+                    return results
+    return results
+
 # ==================== CONTENT ROUTES ====================
 
+PROGRESS_CONTENT_FIELDS = ["topic", "subtopic", "difficulty", "grade", "term"]
+
+def progress_content_fields(content_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Content attributes denormalized onto student_progress"""
+    return {field: content_doc.get(field) for field in PROGRESS_CONTENT_FIELDS}
+
+async def backfill_progress_content_fields(batch_size: int = 500) -> int:
+    """Copy content attributes onto every student_progress row; returns content items processed"""
+    processed = 0
+    batch = []
+    cursor = db.content.find({}, {"_id": 0, "content_id": 1, **dict.fromkeys(PROGRESS_CONTENT_FIELDS, 1)})
+    async for content_doc in cursor.batch_size(batch_size):
+        batch.append(UpdateMany(
+            {"content_id": content_doc["content_id"]},
+            {"$set": progress_content_fields(content_doc)}
+        ))
+        if len(batch) >= batch_size:
+            await db.student_progress.bulk_write(batch, ordered=False)
+            processed += len(batch)
+            batch = []
+    if batch:
+        await db.student_progress.bulk_write(batch, ordered=False)
+        processed += len(batch)
+    await bump_data_versions(["content"])
+    return processed
+
+async def migrate_progress_content_fields() -> int:
+    """Run the progress backfill once per database, recorded in `migrations`; returns content items processed"""
+    if await db.migrations.find_one({"_id": "progress_content_fields"}):
+        return 0
+    processed = await backfill_progress_content_fields()
+    await db.migrations.update_one(
+        {"_id": "progress_content_fields"},
+        {"$set": {"completed_at": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+    return processed
+
+def content_doc_from_row(row: Dict[str, str], created_at: str) -> Dict[str, Any]:
+    """Content document for one row of an uploaded CSV"""
+    return {
+        "content_id": row["id"] if "id" in row else f"content_{uuid.uuid4().hex[:12]}",
+        "grade": row["grade"],
+        "term": row["term"],
+        "topic": row["topic"],
+        "subtopic": row.get("subtopic", ""),
+        "difficulty": row["difficulty"],
+        "question_text": row["question_text"],
+        "answer_text": row["answer_text"],
+        "explanation": row.get("explanation", ""),
+        "source": row.get("source", ""),
+        "tags": row.get("tags", "").split(",") if row.get("tags") else [],
+        "alternate_answers": row.get("alternate_answers", "").split("|") if row.get("alternate_answers") else [],
+        "created_at": created_at
+    }
+
+def parse_content_csv(csv_text: str, created_at: str) -> List[Dict[str, Any]]:
+    return [content_doc_from_row(row, created_at) for row in csv.DictReader(io.StringIO(csv_text))]
+
 @api_router.post("/content/upload")
 async def upload_content(file: UploadFile = File(...), user: User = Depends(require_role(["teacher"]))):
     """Upload content via CSV"""
     try:
         content = await file.read()
-        csv_text = content.decode('utf-8')
-        csv_reader = csv.DictReader(io.StringIO(csv_text))
-        
-        count = 0
-        for row in csv_reader:
-            content_doc = {
-                "content_id": row.get("id", f"content_{uuid.uuid4().hex[:12]}"),
-                "grade": row["grade"],
-                "term": row["term"],
-                "topic": row["topic"],
-                "subtopic": row.get("subtopic", ""),
-                "difficulty": row["difficulty"],
-                "question_text": row["question_text"],
-                "answer_text": row["answer_text"],
-                "explanation": row.get("explanation", ""),
-                "source": row.get("source", ""),
-                "tags": row.get("tags", "").split(",") if row.get("tags") else [],
-                "alternate_answers": row.get("alternate_answers", "").split("|") if row.get("alternate_answers") else [],
-                "created_at": datetime.now(timezone.utc).isoformat()
-            }
-            
-            # Upsert
-            await db.content.update_one(
-                {"content_id": content_doc["content_id"]},
-                {"$set": content_doc},
-                upsert=True
-            )
-            count += 1
+        uploaded = parse_content_csv(content.decode('utf-8'), datetime.now(timezone.utc).isoformat())
         
-        return {"message": f"Uploaded {count} content items"}
+        if uploaded:
+            # Upsert; ordered so a later row for the same id wins
+            await db.content.bulk_write([
+                UpdateOne({"content_id": doc["content_id"]}, {"$set": doc}, upsert=True)
+                for doc in uploaded
+            ])
+            # Keep the copies on student_progress in step with re-uploaded content
+            await db.student_progress.bulk_write([
+                UpdateMany({"content_id": doc["content_id"]}, {"$set": progress_content_fields(doc)})
+                for doc in uploaded
+            ], ordered=False)
+        await bump_data_versions(["content"])
+        await content_catalog.apply_upload(uploaded)
+        await content_search.apply_upload(uploaded)
+        return {"message": f"Uploaded {len(uploaded)} content items"}
     except Exception as e:
         logger.error(f"Content upload error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/content/list")
+@api_router.get("/content/list", response_model=List[ContentItem])
 async def list_content(
+    request: Request,
+    response: Response,
     grade: Optional[str] = None,
     term: Optional[str] = None,
     topic: Optional[str] = None,
@@ -417,6 +1065,11 @@ async def list_content(
     user: User = Depends(get_current_user)
 ):
     """List content with filters"""
+    version = await get_data_versions(["content"])
+    cached = not_modified(request, response, "content", version)
+    if cached:
+        return cached
+    
     query = {}
     if grade:
         query["grade"] = grade
@@ -427,19 +1080,65 @@ async def list_content(
     if difficulty:
         query["difficulty"] = difficulty
     
-    content_list = await db.content.find(query, {"_id": 0}).to_list(1000)
+    content_list = await content_catalog.find(query)
+    if content_list is None:
+        projection = {"_id": 0, **dict.fromkeys(ContentItem.model_fields, 1)}
+        content_list = await db.content.find(query, projection).to_list(1000)
+    elif content_catalog.version != version[0]:
+        # The catalog re-checks the version periodically and may still be behind
+        drop_etag(response)
     return content_list
 
+@api_router.get("/content/search")
+async def search_content(
+    q: str = "",
+    tag: Optional[str] = None,
+    grade: Optional[str] = None,
+    term: Optional[str] = None,
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    limit: int = 20,
+    user: User = Depends(get_current_user)
+):
+    """Ranked search over question, answer, subtopic and tags; the last word also matches as a prefix"""
+    if not q.strip() and not tag:
+        raise HTTPException(status_code=400, detail="Provide a query or a tag")
+    
+    filters = {}
+    if grade:
+        filters["grade"] = grade
+    if term:
+        filters["term"] = term
+    if topic:
+        filters["topic"] = topic
+    if difficulty:
+        filters["difficulty"] = difficulty
+    
+    await content_search.ensure_fresh()
+    return await resolve_search_results(content_search.search(q, tag), filters, max(1, min(limit, 100)))
+
 @api_router.get("/content/{content_id}")
-async def get_content(content_id: str, user: User = Depends(get_current_user)):
-    content_doc = await db.content.find_one({"content_id": content_id}, {"_id": 0})
+async def get_content(
+    content_id: str,
+    request: Request,
+    response: Response,
+    user: User = Depends(get_current_user)
+):
+    version = await get_data_versions(["content"])
+    cached = not_modified(request, response, f"content-{content_id}", version)
+    if cached:
+        return cached
+    
+    content_doc = await content_catalog.get(content_id)
     if not content_doc:
         raise HTTPException(status_code=404, detail="Content not found")
+    if content_catalog.version != version[0]:
+        drop_etag(response)
     return content_doc
 
 # ==================== QUIZ ROUTES ====================
 
-@api_router.post("/quiz/start")
+@api_router.post("/quiz/start", response_model=QuizStartResponse)
 async def start_quiz(
     grade: str,
     term: Optional[str] = None,
@@ -471,10 +1170,12 @@ async def start_quiz(
             {"_id": 0, "content_id": 1}
         ).to_list(1000)]
         
-        if learned_ids:
-            query["content_id"] = {"$nin": learned_ids}
-        
-        new_content = await db.content.find(query, {"_id": 0}).limit(question_count - len(review_content_ids)).to_list(100)
+        new_count = question_count - len(review_content_ids)
+        new_content = await content_catalog.find(query, set(learned_ids), new_count)
+        if new_content is None:
+            if learned_ids:
+                query["content_id"] = {"$nin": learned_ids}
+            new_content = await db.content.find(query, {"_id": 0}).limit(new_count).to_list(100)
         new_content_ids = [c["content_id"] for c in new_content]
         content_ids = review_content_ids + new_content_ids
     else:
@@ -493,17 +1194,26 @@ async def start_quiz(
     await db.quiz_sessions.insert_one(session_doc)
     
     # Get content details
-    content_list = await db.content.find(
-        {"content_id": {"$in": content_ids}},
-        {"_id": 0}
-    ).to_list(100)
+    content_list = await content_catalog.get_many(content_ids)
     
     return {
         "session_id": session_doc["session_id"],
         "questions": content_list
     }
 
-@api_router.post("/quiz/answer")
+def review_interval_days(correct: bool, confidence: Optional[float]) -> float:
+    """Days until the next review (simplified SM-2); confidence is None on a first attempt"""
+    if not correct:
+        return 0.5  # 12 hours for wrong answers
+    if confidence is None:
+        return 1
+    if confidence >= 0.9:
+        return 7  # 1 week
+    if confidence >= 0.7:
+        return 3  # 3 days
+    return 1  # 1 day
+
+@api_router.post("/quiz/answer", response_model=AnswerResult)
 async def submit_answer(
     session_id: str,
     content_id: str,
@@ -512,13 +1222,18 @@ async def submit_answer(
 ):
     """Submit quiz answer and update progress"""
     
+    content_doc = await content_catalog.get(content_id)
+    if not content_doc:
+        raise HTTPException(status_code=404, detail="Content not found")
+    
     # Validate answer
-    validation = await validate_answer(content_id, user_answer)
+    validation = match_answer(content_doc, user_answer)
     
     # Record answer
     answer_doc = {
         "answer_id": f"answer_{uuid.uuid4().hex[:12]}",
         "session_id": session_id,
+        "user_id": user.user_id,
         "content_id": content_id,
         "user_answer": user_answer,
         "correct": validation["correct"],
@@ -534,48 +1249,45 @@ async def submit_answer(
     )
     
     now = datetime.now(timezone.utc)
+    was_mastered = bool(progress_doc) and progress_doc["confidence_score"] >= MASTERED_THRESHOLD
     
     if progress_doc:
         attempts = progress_doc["attempts"] + 1
         correct_count = progress_doc["correct_count"] + (1 if validation["correct"] else 0)
         confidence = correct_count / attempts
         
-        # Calculate next review (simplified)
-        if validation["correct"]:
-            if confidence >= 0.9:
-                interval = 7  # 1 week
-            elif confidence >= 0.7:
-                interval = 3  # 3 days
-            else:
-                interval = 1  # 1 day
-        else:
-            interval = 0.5  # 12 hours for wrong answers
-        
-        next_review = now + timedelta(days=interval)
+        next_review = now + timedelta(days=review_interval_days(validation["correct"], confidence))
         
+        progress_update = {
+            **progress_content_fields(content_doc),
+            "attempts": attempts,
+            "correct_count": correct_count,
+            "last_seen": now.isoformat(),
+            "next_review": next_review.isoformat(),
+            "confidence_score": confidence
+        }
         await db.student_progress.update_one(
             {"user_id": user.user_id, "content_id": content_id},
-            {"$set": {
-                "attempts": attempts,
-                "correct_count": correct_count,
-                "last_seen": now.isoformat(),
-                "next_review": next_review.isoformat(),
-                "confidence_score": confidence
-            }}
+            {"$set": progress_update}
         )
+        await apply_progress_to_summary(user.user_id, progress_doc, progress_update)
+        is_mastered = confidence >= MASTERED_THRESHOLD
     else:
         # First attempt
         progress_doc = {
             "progress_id": f"progress_{uuid.uuid4().hex[:12]}",
             "user_id": user.user_id,
             "content_id": content_id,
+            **progress_content_fields(content_doc),
             "attempts": 1,
             "correct_count": 1 if validation["correct"] else 0,
             "last_seen": now.isoformat(),
-            "next_review": (now + timedelta(days=1 if validation["correct"] else 0.5)).isoformat(),
+            "next_review": (now + timedelta(days=review_interval_days(validation["correct"], None))).isoformat(),
             "confidence_score": 1.0 if validation["correct"] else 0.0
         }
         await db.student_progress.insert_one(progress_doc)
+        await apply_progress_to_summary(user.user_id, None, progress_doc)
+        is_mastered = progress_doc["confidence_score"] >= MASTERED_THRESHOLD
     
     # Update session score
     if validation["correct"]:
@@ -584,8 +1296,21 @@ async def submit_answer(
             {"$inc": {"score": 1}}
         )
     
-    # Get content for explanation
-    content_doc = await db.content.find_one({"content_id": content_id}, {"_id": 0})
+    class_ids = await student_class_ids(user.user_id)
+    await record_answer_rollups(
+        user.user_id, class_ids, content_doc["topic"], validation["correct"], was_mastered, is_mastered, now
+    )
+    await bump_data_versions([f"student:{user.user_id}"] + [f"class:{class_id}" for class_id in class_ids])
+    class_events.publish(class_ids, {
+        "type": "answer",
+        "user_id": user.user_id,
+        "name": user.name,
+        "session_id": session_id,
+        "content_id": content_id,
+        "topic": content_doc["topic"],
+        "correct": validation["correct"],
+        "at": now.isoformat()
+    })
     
     return {
         "correct": validation["correct"],
@@ -594,6 +1319,40 @@ async def submit_answer(
         "explanation": content_doc.get("explanation", "")
     }
 
+def advance_streak(streak_doc: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+    """Streak fields after completing a quiz at `now`"""
+    last_date = streak_doc.get("last_quiz_date")
+    if isinstance(last_date, str):
+        last_date = datetime.fromisoformat(last_date).date()
+    elif isinstance(last_date, datetime):
+        last_date = last_date.date()
+    
+    if last_date:
+        diff = (now.date() - last_date).days
+        if diff == 1:
+            # Continue streak
+            current_streak = streak_doc["current_streak"] + 1
+        elif diff == 0:
+            # Already done today
+            current_streak = streak_doc["current_streak"]
+        else:
+            # Streak broken
+            current_streak = 1
+    else:
+        current_streak = 1
+    
+    return {
+        "current_streak": current_streak,
+        "longest_streak": max(streak_doc["longest_streak"], current_streak),
+        "last_quiz_date": now.isoformat()
+    }
+
+def level_for_xp(xp: int, level: int) -> int:
+    # Simple leveling: 100 XP per level
+    while xp >= level * 100:
+        level += 1
+    return level
+
 @api_router.post("/quiz/complete")
 async def complete_quiz(session_id: str, user: User = Depends(require_role(["student"]))):
     """Complete quiz and update streaks/rewards"""
@@ -602,48 +1361,34 @@ async def complete_quiz(session_id: str, user: User = Depends(require_role(["stu
     if not session_doc:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    # Mark as completed
-    await db.quiz_sessions.update_one(
-        {"session_id": session_id},
-        {"$set": {"completed_at": datetime.now(timezone.utc).isoformat()}}
+    # Mark as completed; only the request that flips it awards XP and records the quiz
+    completed_at = datetime.now(timezone.utc).isoformat()
+    result = await db.quiz_sessions.update_one(
+        {"session_id": session_id, "completed_at": None},
+        {"$set": {"completed_at": completed_at}}
     )
+    if not result.modified_count:
+        return {
+            "score": session_doc["score"],
+            "total": session_doc["total_questions"],
+            "xp_earned": 0,
+            "message": "Quiz already completed"
+        }
+    session_doc["completed_at"] = completed_at
+    summary_update = {}
     
     # Update streak
     streak_doc = await db.streaks.find_one({"user_id": user.user_id}, {"_id": 0})
     now = datetime.now(timezone.utc)
-    today = now.date()
     
     if streak_doc:
-        last_date = streak_doc.get("last_quiz_date")
-        if isinstance(last_date, str):
-            last_date = datetime.fromisoformat(last_date).date()
-        elif isinstance(last_date, datetime):
-            last_date = last_date.date()
-        
-        if last_date:
-            diff = (today - last_date).days
-            if diff == 1:
-                # Continue streak
-                current_streak = streak_doc["current_streak"] + 1
-            elif diff == 0:
-                # Already done today
-                current_streak = streak_doc["current_streak"]
-            else:
-                # Streak broken
-                current_streak = 1
-        else:
-            current_streak = 1
-        
-        longest_streak = max(streak_doc["longest_streak"], current_streak)
+        streak_update = advance_streak(streak_doc, now)
         
         await db.streaks.update_one(
             {"user_id": user.user_id},
-            {"$set": {
-                "current_streak": current_streak,
-                "longest_streak": longest_streak,
-                "last_quiz_date": now.isoformat()
-            }}
+            {"$set": streak_update}
         )
+        summary_update["streak"] = {**streak_doc, **streak_update}
     
     # Award XP and level up
     score = session_doc["score"]
@@ -651,18 +1396,42 @@ async def complete_quiz(session_id: str, user: User = Depends(require_role(["stu
     xp_earned = score * 10
     
     rewards_doc = await db.rewards.find_one({"user_id": user.user_id}, {"_id": 0})
+    class_ids = await student_class_ids(user.user_id) if class_events.active() or leaderboards.has_class_boards() else []
     if rewards_doc:
         new_xp = rewards_doc["xp"] + xp_earned
-        new_level = rewards_doc["level"]
-        
-        # Simple leveling: 100 XP per level
-        while new_xp >= new_level * 100:
-            new_level += 1
+        new_level = level_for_xp(new_xp, rewards_doc["level"])
         
+        # grade rides along for the grade leaderboards
         await db.rewards.update_one(
             {"user_id": user.user_id},
-            {"$set": {"xp": new_xp, "level": new_level}}
+            {"$set": {"xp": new_xp, "level": new_level, "grade": user.grade}}
+        )
+        summary_update["rewards"] = {**rewards_doc, "xp": new_xp, "level": new_level}
+        leaderboards.record_xp(user.user_id, user.grade, class_ids, "all", new_xp)
+    
+    if xp_earned:
+        week = week_start(now)
+        weekly_doc = await db.xp_weekly.find_one_and_update(
+            {"user_id": user.user_id, "week": week},
+            {"$inc": {"xp": xp_earned}, "$set": {"grade": user.grade}},
+            projection={"_id": 0, "xp": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
         )
+        leaderboards.record_xp(user.user_id, user.grade, class_ids, week, weekly_doc["xp"])
+    
+    await apply_quiz_to_summary(user.user_id, session_doc, summary_update)
+    await bump_data_versions([f"student:{user.user_id}"])
+    if class_events.active():
+        class_events.publish(class_ids, {
+            "type": "complete",
+            "user_id": user.user_id,
+            "name": user.name,
+            "session_id": session_id,
+            "score": score,
+            "total": total,
+            "at": session_doc["completed_at"]
+        })
     
     return {
         "score": score,
@@ -671,91 +1440,796 @@ async def complete_quiz(session_id: str, user: User = Depends(require_role(["stu
         "message": "Quiz completed!"
     }
 
-# ==================== STUDENT ROUTES ====================
+TTS_BUNDLE_CONCURRENCY = int(os.environ.get('TTS_BUNDLE_CONCURRENCY', '4'))
 
-@api_router.get("/student/dashboard")
-async def student_dashboard(user: User = Depends(require_role(["student"]))):
-    """Get student dashboard data"""
+def multipart_part(boundary: str, name: str, body: bytes, content_type: str, filename: Optional[str] = None) -> bytes:
+    disposition = f'form-data; name="{name}"'
+    if filename:
+        disposition += f'; filename="{filename}"'
+    return (
+        f"--{boundary}\r\nContent-Disposition: {disposition}\r\nContent-Type: {content_type}\r\n\r\n"
+    ).encode() + body + b"\r\n"
+
+@api_router.get("/quiz/{session_id}/bundle")
+async def quiz_bundle(
+    session_id: str,
+    voice: str = "echo",
+    include_explanations: bool = False,
+    user: User = Depends(require_role(["student"]))
+):
+    """A session's questions and their pre-rendered audio in one multipart/form-data payload."""
+    session_doc = await db.quiz_sessions.find_one(
+        {"session_id": session_id, "user_id": user.user_id},
+        {"_id": 0, "content_ids": 1, "completed_at": 1}
+    )
+    if not session_doc:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if session_doc.get("completed_at"):
+        raise HTTPException(status_code=400, detail="Quiz already completed")
     
-    # Get streak
-    streak_doc = await db.streaks.find_one({"user_id": user.user_id}, {"_id": 0})
+    content_list = await content_catalog.get_many(session_doc["content_ids"])
     
-    # Get rewards
-    rewards_doc = await db.rewards.find_one({"user_id": user.user_id}, {"_id": 0})
+    # Explanations give the answer away, so they are only rendered on request
+    clips = [(c["content_id"], "question", c["question_text"]) for c in content_list]
+    if include_explanations:
+        clips += [
+            (c["content_id"], "explanation", c["explanation"])
+            for c in content_list if c.get("explanation")
+        ]
     
-    # Get progress stats
-    total_progress = await db.student_progress.count_documents({"user_id": user.user_id})
-    mastered = await db.student_progress.count_documents({
-        "user_id": user.user_id,
-        "confidence_score": {"$gte": 0.8}
-    })
+    semaphore = asyncio.Semaphore(TTS_BUNDLE_CONCURRENCY)
     
-    # Get items due for review
-    due_items = await db.student_progress.count_documents({
-        "user_id": user.user_id,
-        "next_review": {"$lte": datetime.now(timezone.utc).isoformat()}
-    })
+    async def render(text):
+        async with semaphore:
+            try:
+                return await synthesize_speech(text, voice)
+            except Exception as e:
+                logger.error(f"TTS error: {e}")
+                return None
     
-    # Get recent quizzes
-    recent_quizzes = await db.quiz_sessions.find(
-        {"user_id": user.user_id, "completed_at": {"$ne": None}},
-        {"_id": 0}
-    ).sort("started_at", -1).limit(5).to_list(5)
+    audio = await asyncio.gather(*(render(text) for _, _, text in clips))
+    
+    audio_parts = {}
+    for (content_id, kind, _), audio_bytes in zip(clips, audio):
+        if audio_bytes is not None:
+            audio_parts[(content_id, kind)] = (f"{content_id}.{kind}", audio_bytes)
     
+    questions = []
+    for content_doc in content_list:
+        question = QuizQuestion.model_validate(content_doc).model_dump()
+        question["audio"] = {
+            kind: audio_parts[(content_doc["content_id"], kind)][0]
+            for kind in ("question", "explanation")
+            if (content_doc["content_id"], kind) in audio_parts
+        }
+        questions.append(question)
+    manifest = {"session_id": session_id, "voice": voice, "questions": questions}
+    
+    boundary = f"quizbundle{uuid.uuid4().hex}"
+    body = [multipart_part(boundary, "manifest", json.dumps(manifest).encode(), "application/json")]
+    for name, audio_bytes in audio_parts.values():
+        body.append(multipart_part(boundary, name, audio_bytes, "audio/mpeg", f"{name}.mp3"))
+    body.append(f"--{boundary}--\r\n".encode())
+    
+    return Response(content=b"".join(body), media_type=f"multipart/form-data; boundary={boundary}")
+
+QUIZ_WS_HEARTBEAT_SECONDS = float(os.environ.get('QUIZ_WS_HEARTBEAT_SECONDS', '20'))
+QUIZ_WS_IDLE_TIMEOUT_SECONDS = float(os.environ.get('QUIZ_WS_IDLE_TIMEOUT_SECONDS', '90'))
+QUIZ_WS_TICKET_SECONDS = float(os.environ.get('QUIZ_WS_TICKET_SECONDS', '30'))
+CORS_ORIGINS = os.environ.get('CORS_ORIGINS', '*').split(',')
+
+def websocket_origin_allowed(websocket: WebSocket) -> bool:
+    """Whether a WebSocket handshake's Origin is a CORS origin, the app itself, or absent."""
+    origin = websocket.headers.get("origin")
+    if origin is None or (origin != "*" and origin in CORS_ORIGINS):
+        return True
+    return urlsplit(origin).netloc == websocket.headers.get("host")
+
+@api_router.post("/ws/ticket")
+async def websocket_ticket(request: Request, user: User = Depends(require_role(["student"]))):
+    """Single-use ticket for opening the quiz socket where the session cookie can't be sent."""
+    session_token = request.cookies.get("session_token")
+    auth_header = request.headers.get("Authorization")
+    if not session_token and auth_header and auth_header.startswith("Bearer "):
+        session_token = auth_header.split(" ")[1]
+    ticket = f"wst_{uuid.uuid4().hex}"
+    await db.ws_tickets.insert_one({
+        "ticket": ticket,
+        "session_token": session_token,
+        "expires_at": datetime.now(timezone.utc) + timedelta(seconds=QUIZ_WS_TICKET_SECONDS)
+    })
+    return {"ticket": ticket, "expires_in": QUIZ_WS_TICKET_SECONDS}
+
+async def redeem_websocket_ticket(ticket: str) -> Optional[str]:
+    """The session token behind a ticket, deleting the ticket; None if unknown or expired"""
+    ticket_doc = await db.ws_tickets.find_one_and_delete(
+        {"ticket": ticket, "expires_at": {"$gt": datetime.now(timezone.utc)}}
+    )
+    return ticket_doc["session_token"] if ticket_doc else None
+
+async def quiz_session_state(session_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Questions plus what has already been answered, so a reconnecting client can resume"""
+    content_list = await content_catalog.get_many(session_doc["content_ids"])
+    answers = await db.quiz_answers.find(
+        {"session_id": session_doc["session_id"]},
+        {"_id": 0, "content_id": 1, "correct": 1}
+    ).to_list(None)
     return {
-        "streak": streak_doc or {"current_streak": 0, "longest_streak": 0},
-        "rewards": rewards_doc or {"xp": 0, "level": 1, "badges": []},
-        "progress": {
-            "total_items": total_progress,
-            "mastered": mastered,
-            "due_for_review": due_items
-        },
-        "recent_quizzes": recent_quizzes
+        "type": "session",
+        "session_id": session_doc["session_id"],
+        "questions": [QuizQuestion.model_validate(c).model_dump() for c in content_list],
+        "answered": {a["content_id"]: a["correct"] for a in answers},
+        "score": session_doc["score"]
     }
 
-@api_router.get("/student/review-bank")
-async def review_bank(user: User = Depends(require_role(["student"]))):
-    """Get items that need review (wrong answers)"""
-    
-    # Get items with low confidence
-    progress_docs = await db.student_progress.find(
-        {"user_id": user.user_id, "confidence_score": {"$lt": 0.7}},
-        {"_id": 0}
-    ).sort("last_seen", -1).to_list(50)
+async def previous_answer_result(session_id: str, content_id: str) -> Optional[Dict[str, Any]]:
+    """The recorded result for an answer the client is re-sending after a dropped connection"""
+    answer_doc = await db.quiz_answers.find_one(
+        {"session_id": session_id, "content_id": content_id},
+        {"_id": 0, "correct": 1, "confidence": 1}
+    )
+    if not answer_doc:
+        return None
+    content_doc = await content_catalog.get(content_id)
+    return {
+        "correct": answer_doc["correct"],
+        "confidence": answer_doc["confidence"],
+        "correct_answer": content_doc["answer_text"],
+        "explanation": content_doc.get("explanation", "")
+    }
+
+@api_router.websocket("/ws/quiz/{session_id}")
+async def quiz_socket(websocket: WebSocket, session_id: str):
+    """Run a quiz session over one WebSocket."""
+    if not websocket_origin_allowed(websocket):
+        # Closing before accept refuses the handshake with a 403
+        await websocket.close(code=4403)
+        return
+    await websocket.accept()
     
-    content_ids = [p["content_id"] for p in progress_docs]
-    if not content_ids:
-        return []
+    token = websocket.cookies.get("session_token")
+    if not token and websocket.query_params.get("ticket"):
+        token = await redeem_websocket_ticket(websocket.query_params["ticket"])
+    auth_header = websocket.headers.get("Authorization")
+    if not token and auth_header and auth_header.startswith("Bearer "):
+        token = auth_header.split(" ")[1]
+    try:
+        user = await authenticate_token(token)
+        if user.role != "student":
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
+        session_doc = await db.quiz_sessions.find_one(
+            {"session_id": session_id, "user_id": user.user_id}, {"_id": 0}
+        )
+        if not session_doc:
+            raise HTTPException(status_code=404, detail="Session not found")
+        if session_doc.get("completed_at"):
+            raise HTTPException(status_code=400, detail="Quiz already completed")
+    except HTTPException as e:
+        # 4000 + HTTP status, e.g. 4401 for an invalid session token
+        await websocket.close(code=4000 + e.status_code, reason=e.detail)
+        return
     
-    # Get content details
-    content_list = await db.content.find(
-        {"content_id": {"$in": content_ids}},
-        {"_id": 0}
-    ).to_list(100)
-    
-    # Merge with progress
-    result = []
-    for content in content_list:
-        progress = next((p for p in progress_docs if p["content_id"] == content["content_id"]), None)
-        result.append({
-            **content,
-            "attempts": progress["attempts"] if progress else 0,
-            "confidence_score": progress["confidence_score"] if progress else 0
-        })
+    await websocket.send_json(await quiz_session_state(session_doc))
+    content_ids = set(session_doc["content_ids"])
+    idle = 0.0
     
-    return result
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(websocket.receive_json(), QUIZ_WS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                idle += QUIZ_WS_HEARTBEAT_SECONDS
+                if idle >= QUIZ_WS_IDLE_TIMEOUT_SECONDS:
+                    await websocket.close(code=1001, reason="Idle timeout")
+                    return
+                await websocket.send_json({"type": "ping"})
+                continue
+            except ValueError:
+                await websocket.send_json({"type": "error", "status": 400, "detail": "Invalid JSON"})
+                continue
+            idle = 0.0
+            
+            kind = message.get("type") if isinstance(message, dict) else None
+            try:
+                if kind == "ping":
+                    await websocket.send_json({"type": "pong"})
+                elif kind == "pong":
+                    continue
+                elif kind == "answer":
+                    content_id = message.get("content_id")
+                    if content_id not in content_ids or not isinstance(message.get("user_answer"), str):
+                        raise HTTPException(status_code=400, detail="Answer must name a question in this session")
+                    result = await previous_answer_result(session_id, content_id)
+                    if result is None:
+                        result = await submit_answer(session_id, content_id, message["user_answer"], user)
+                    await websocket.send_json({"type": "result", "content_id": content_id, **result})
+                elif kind == "complete":
+                    result = await complete_quiz(session_id, user)
+                    await websocket.send_json({"type": "completed", **result})
+                    await websocket.close()
+                    return
+                elif kind == "resume":
+                    session_doc = await db.quiz_sessions.find_one({"session_id": session_id}, {"_id": 0})
+                    await websocket.send_json(await quiz_session_state(session_doc))
+                else:
+                    raise HTTPException(status_code=400, detail="Unknown message type")
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "status": e.status_code, "detail": e.detail})
+    except WebSocketDisconnect:
+        # Everything answered so far is already persisted; reconnecting resumes the session
+        pass
 
-# ==================== TEACHER ROUTES ====================
+# ==================== RESPONSE CACHE ====================
 
-@api_router.post("/teacher/class")
-async def create_class(class_name: str, user: User = Depends(require_role(["teacher"]))):
-    """Create a new class"""
+async def bump_data_versions(keys: List[str]):
+    """Invalidate cached responses that depend on any of these data keys"""
+    if keys:
+        await db.data_versions.bulk_write([
+            UpdateOne({"_id": key}, {"$inc": {"version": 1}}, upsert=True)
+            for key in keys
+        ], ordered=False)
+
+async def get_data_versions(keys: List[str]) -> tuple:
+    docs = await db.data_versions.find({"_id": {"$in": keys}}).to_list(len(keys))
+    versions = {doc["_id"]: doc["version"] for doc in docs}
+    return tuple(versions.get(key, 0) for key in keys)
+
+class ResponseCache:
+    """LRU cache of computed responses tagged with the data versions they were built from."""
+    
+    def __init__(self, max_entries: int, stale_seconds: float):
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (version, value, computed_at)
+        self.inflight: Dict[tuple, asyncio.Task] = {}
+        self.counters: Dict[str, Dict[str, int]] = {}
+    
+    def _count(self, endpoint: str, outcome: str):
+        counters = self.counters.setdefault(endpoint, {"hits": 0, "stale_hits": 0, "misses": 0})
+        counters[outcome] += 1
+    
+    def _refresh(self, key: tuple, version: tuple, compute) -> asyncio.Task:
+        # Keyed by version too: a request for a newer version must not join an older computation
+        inflight_key = (key, version)
+        task = self.inflight.get(inflight_key)
+        if task is None:
+            async def run():
+                try:
+                    value = await compute()
+                    current = self.entries.get(key)
+                    # Versions only grow, so a slower computation of an older one must not replace a newer entry
+                    if current is None or current[0] <= version:
+                        self.entries[key] = (version, value, time.monotonic())
+                        self.entries.move_to_end(key)
+                        while len(self.entries) > self.max_entries:
+                            self.entries.popitem(last=False)
+                    return version, value
+                finally:
+                    self.inflight.pop(inflight_key, None)
+            task = self.inflight[inflight_key] = asyncio.create_task(run())
+        return task
+    
+    async def get_or_compute(self, endpoint: str, scope: tuple, version: tuple, compute):
+        key = (endpoint, *scope)
+        entry = self.entries.get(key)
+        if entry:
+            self.entries.move_to_end(key)
+            cached_version, value, computed_at = entry
+            if cached_version == version:
+                self._count(endpoint, "hits")
+                return cached_version, value
+            if time.monotonic() - computed_at < self.stale_seconds:
+                self._count(endpoint, "stale_hits")
+                self._refresh(key, version, compute).add_done_callback(self._log_refresh_error)
+                return cached_version, value
+        self._count(endpoint, "misses")
+        return await asyncio.shield(self._refresh(key, version, compute))
+    
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Cache refresh error: {task.exception()}")
+    
+    def stats(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, counters in self.counters.items():
+            lookups = sum(counters.values())
+            endpoints[endpoint] = {
+                **counters,
+                "hit_ratio": round((counters["hits"] + counters["stale_hits"]) / lookups, 3) if lookups else 0
+            }
+        return {"entries": len(self.entries), "max_entries": self.max_entries, "endpoints": endpoints}
+
+analytics_cache = ResponseCache(
+    max_entries=int(os.environ.get("ANALYTICS_CACHE_SIZE", "512")),
+    stale_seconds=float(os.environ.get("ANALYTICS_CACHE_STALE_SECONDS", "30"))
+)
+
+async def cached_response(endpoint: str, scope: tuple, version: tuple, compute) -> tuple:
+    """Serve `compute()` through the analytics cache; returns (version, value)."""
+    return await analytics_cache.get_or_compute(endpoint, scope, version, compute)
+
+def not_modified(request: Request, response: Response, scope: str, version: tuple) -> Optional[Response]:
+    """Tag the response with a data-version ETag; 304 when If-None-Match already names it."""
+    etag = f'W/"{scope}.{".".join(str(v) for v in version)}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    client_etags = [tag.strip().removeprefix("W/") for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag.removeprefix("W/") in client_etags:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+def drop_etag(response: Response):
+    """Remove the ETag not_modified set when the body is older than the versions it named."""
+    if "etag" in response.headers:
+        del response.headers["etag"]
+
+# ==================== STUDENT SUMMARY ====================
+
+MASTERED_THRESHOLD = 0.8
+RECENT_QUIZZES_LIMIT = 5
+SUMMARY_REBUILD_ATTEMPTS = 3
+
+def due_bucket(next_review: Optional[str]) -> Optional[str]:
+    """Minute bucket key ("YYYY-MM-DDTHH:MM") for an ISO next_review timestamp"""
+    return next_review[:16] if next_review else None
+
+def split_due_buckets(due_buckets: Dict[str, int], now: Optional[datetime] = None) -> tuple:
+    """(count, keys) of the buckets whose whole minute has passed."""
+    current = due_bucket((now or datetime.now(timezone.utc)).isoformat())
+    past = [bucket for bucket in due_buckets if bucket < current]
+    return sum(due_buckets[bucket] for bucket in past), past
+
+def count_due_items(summary: Dict[str, Any], now: Optional[datetime] = None) -> int:
+    """Items due for review: the folded `overdue` counter plus buckets that have come due since"""
+    due, _ = split_due_buckets(summary.get("due_buckets") or {}, now)
+    return max(summary.get("overdue", 0) + due, 0)
+
+async def fold_due_buckets(user_id: str, summary: Dict[str, Any]):
+    """Move buckets that have come due into `overdue` so due_buckets stays small."""
+    due_buckets = summary.get("due_buckets") or {}
+    due, past = split_due_buckets(due_buckets)
+    if not past:
+        return
+    await db.student_summary.update_one(
+        {"user_id": user_id, **{f"due_buckets.{bucket}": due_buckets[bucket] for bucket in past}},
+        {"$inc": {"overdue": due}, "$unset": {f"due_buckets.{bucket}": "" for bucket in past}}
+    )
+
+async def apply_progress_to_summary(user_id: str, old_progress: Optional[Dict[str, Any]], new_progress: Dict[str, Any]):
+    """Move one progress item between mastery/due buckets in the student's summary"""
+    inc: Dict[str, int] = {"revision": 1}
+    
+    def bump(field: Optional[str], amount: int):
+        if field:
+            inc[field] = inc.get(field, 0) + amount
+    
+    if old_progress is None:
+        bump("total_items", 1)
+    else:
+        if old_progress.get("confidence_score", 0) >= MASTERED_THRESHOLD:
+            bump("mastered", -1)
+        old_bucket = due_bucket(old_progress.get("next_review"))
+        bump(old_bucket and f"due_buckets.{old_bucket}", -1)
+    
+    if new_progress["confidence_score"] >= MASTERED_THRESHOLD:
+        bump("mastered", 1)
+    new_bucket = due_bucket(new_progress.get("next_review"))
+    bump(new_bucket and f"due_buckets.{new_bucket}", 1)
+    
+    inc = {field: amount for field, amount in inc.items() if amount}
+    await db.student_summary.update_one(
+        {"user_id": user_id},
+        {"$set": {"updated_at": datetime.now(timezone.utc).isoformat()}, "$inc": inc}
+    )
+
+async def apply_quiz_to_summary(user_id: str, session_doc: Dict[str, Any], summary_update: Dict[str, Any]):
+    """Push a completed quiz (and the new streak/rewards) into the student's summary"""
+    await db.student_summary.update_one(
+        {"user_id": user_id},
+        {
+            "$set": {**summary_update, "updated_at": datetime.now(timezone.utc).isoformat()},
+            "$inc": {"revision": 1},
+            "$push": {"recent_quizzes": {
+                "$each": [session_doc],
+                "$sort": {"started_at": -1},
+                "$slice": RECENT_QUIZZES_LIMIT
+            }}
+        }
+    )
+
+async def rebuild_student_summary(user_id: str) -> Dict[str, Any]:
+    """Recompute a student's summary from the source collections (fixes drift)"""
+    # A placeholder gives answers made during the rebuild a revision to bump; the
+    # snapshot is only written if none did, otherwise it is taken again
+    for _ in range(SUMMARY_REBUILD_ATTEMPTS):
+        current = await db.student_summary.find_one_and_update(
+            {"user_id": user_id},
+            {"$setOnInsert": {"rebuilding": True}},
+            projection={"_id": 0, "revision": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        revision = current.get("revision")
+        summary = await student_summary_snapshot(user_id)
+        summary["revision"] = revision or 0
+        result = await db.student_summary.replace_one({"user_id": user_id, "revision": revision}, summary)
+        if result.matched_count:
+            return summary
+    # Still racing answers: show this snapshot and leave the placeholder for the next read to rebuild
+    logger.warning(f"Summary rebuild for {user_id} kept racing concurrent answers")
+    return summary
+
+async def student_summary_snapshot(user_id: str) -> Dict[str, Any]:
+    """A student's summary computed from student_progress, streaks, rewards and quiz_sessions"""
+    # One pass over the student's progress, grouped by due bucket
+    buckets = await db.student_progress.aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$group": {
+            "_id": {"$substrBytes": [{"$ifNull": ["$next_review", ""]}, 0, 16]},
+            "count": {"$sum": 1},
+            "mastered": {"$sum": {"$cond": [{"$gte": ["$confidence_score", MASTERED_THRESHOLD]}, 1, 0]}}
+        }}
+    ]).to_list(None)
+    
+    streak_doc = await db.streaks.find_one({"user_id": user_id}, {"_id": 0})
+    rewards_doc = await db.rewards.find_one({"user_id": user_id}, {"_id": 0})
+    recent_quizzes = await db.quiz_sessions.find(
+        {"user_id": user_id, "completed_at": {"$ne": None}},
+        {"_id": 0}
+    ).sort("started_at", -1).limit(RECENT_QUIZZES_LIMIT).to_list(RECENT_QUIZZES_LIMIT)
+    
+    due_buckets = {b["_id"]: b["count"] for b in buckets if b["_id"]}
+    overdue, past = split_due_buckets(due_buckets)
+    
+    summary = {
+        "user_id": user_id,
+        "total_items": sum(b["count"] for b in buckets),
+        "mastered": sum(b["mastered"] for b in buckets),
+        "overdue": overdue,
+        "due_buckets": {bucket: count for bucket, count in due_buckets.items() if bucket not in past},
+        "streak": streak_doc,
+        "rewards": rewards_doc,
+        "recent_quizzes": recent_quizzes,
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+    return summary
+
+async def rebuild_all_student_summaries() -> int:
+    """Rebuild the summary of every student; returns the number rebuilt"""
+    count = 0
+    async for student in db.users.find({"role": "student"}, {"_id": 0, "user_id": 1}):
+        await rebuild_student_summary(student["user_id"])
+        count += 1
+    return count
+
+# ==================== ANALYTICS ROLLUPS ====================
+
+ROLLUP_COUNTERS = ["attempts", "correct", "mastered", "unmastered"]
+
+def rollup_increments(correct: bool, was_mastered: bool, is_mastered: bool) -> Dict[str, int]:
+    """Counter increments for one answer event"""
+    return {
+        "attempts": 1,
+        "correct": 1 if correct else 0,
+        "mastered": 1 if is_mastered and not was_mastered else 0,
+        "unmastered": 1 if was_mastered and not is_mastered else 0
+    }
+
+async def record_answer_rollups(
+    user_id: str,
+    class_ids: List[str],
+    topic: str,
+    correct: bool,
+    was_mastered: bool,
+    is_mastered: bool,
+    at: datetime
+):
+    """Add one answer to the student's and each of their classes' daily topic rollups"""
+    inc = rollup_increments(correct, was_mastered, is_mastered)
+    day = at.date().isoformat()
+    
+    await db.rollup_student_topic_daily.update_one(
+        {"user_id": user_id, "topic": topic, "day": day},
+        {"$inc": inc},
+        upsert=True
+    )
+    
+    if class_ids:
+        await db.rollup_class_topic_daily.bulk_write([
+            UpdateOne({"class_id": class_id, "topic": topic, "day": day}, {"$inc": inc}, upsert=True)
+            for class_id in class_ids
+        ], ordered=False)
+
+async def backfill_rollups() -> int:
+    """Rebuild daily rollups before today from quiz_answers; returns the number of answers replayed."""
+    student_rollups: Dict[tuple, Dict[str, int]] = {}
+    item_state: Dict[tuple, List[int]] = {}  # (user_id, content_id) -> [attempts, correct]
+    replayed = 0
+    today = datetime.now(timezone.utc).date().isoformat()
+    
+    cursor = db.quiz_answers.aggregate([
+        {"$match": {"timestamp": {"$lt": today}}},
+        {"$sort": {"timestamp": 1}},
+        {"$lookup": {
+            "from": "quiz_sessions",
+            "localField": "session_id",
+            "foreignField": "session_id",
+            "as": "session"
+        }},
+        {"$lookup": {
+            "from": "content",
+            "localField": "content_id",
+            "foreignField": "content_id",
+            "as": "content"
+        }},
+        {"$unwind": "$session"},
+        {"$unwind": "$content"},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$session.user_id",
+            "content_id": 1,
+            "topic": "$content.topic",
+            "correct": 1,
+            "timestamp": 1
+        }}
+    ], allowDiskUse=True)
+    
+    async for answer in cursor:
+        state = item_state.setdefault((answer["user_id"], answer["content_id"]), [0, 0])
+        was_mastered = state[0] > 0 and state[1] / state[0] >= MASTERED_THRESHOLD
+        state[0] += 1
+        state[1] += 1 if answer["correct"] else 0
+        is_mastered = state[1] / state[0] >= MASTERED_THRESHOLD
+        
+        key = (answer["user_id"], answer["topic"], answer["timestamp"][:10])
+        counters = student_rollups.setdefault(key, dict.fromkeys(ROLLUP_COUNTERS, 0))
+        for field, amount in rollup_increments(answer["correct"], was_mastered, is_mastered).items():
+            counters[field] += amount
+        replayed += 1
+    
+    # Fold student rollups into every class the student currently belongs to
+    classes_by_student: Dict[str, List[str]] = {}
+    async for membership in db.class_memberships.find({}, {"_id": 0, "class_id": 1, "user_id": 1}):
+        classes_by_student.setdefault(membership["user_id"], []).append(membership["class_id"])
+    
+    class_rollups: Dict[tuple, Dict[str, int]] = {}
+    for (user_id, topic, day), counters in student_rollups.items():
+        for class_id in classes_by_student.get(user_id, []):
+            totals = class_rollups.setdefault((class_id, topic, day), dict.fromkeys(ROLLUP_COUNTERS, 0))
+            for field, amount in counters.items():
+                totals[field] += amount
+    
+    run_id = uuid.uuid4().hex
+    students = await replace_rollups(db.rollup_student_topic_daily, "user_id", student_rollups, today, run_id)
+    classes = await replace_rollups(db.rollup_class_topic_daily, "class_id", class_rollups, today, run_id)
+    # Trend ETags are these versions plus the date, so rewritten history must move them
+    keys = [f"student:{user_id}" for user_id in sorted(students)] + [f"class:{class_id}" for class_id in sorted(classes)]
+    for start in range(0, len(keys), 1000):
+        await bump_data_versions(keys[start:start + 1000])
+    return replayed
+
+async def replace_rollups(collection, owner_field: str, rollups: Dict[tuple, Dict[str, int]], before_day: str, run_id: str, batch_size: int = 1000) -> set:
+    """Overwrite rollups for days before `before_day`, then drop ones the replay no longer produces; returns the owners touched"""
+    owners = {owner for owner, _, _ in rollups}
+    batch = []
+    for (owner, topic, day), counters in rollups.items():
+        batch.append(UpdateOne(
+            {owner_field: owner, "topic": topic, "day": day},
+            {"$set": {**counters, "rebuilt_by": run_id}},
+            upsert=True
+        ))
+        if len(batch) >= batch_size:
+            await collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        await collection.bulk_write(batch, ordered=False)
+    stale = {"day": {"$lt": before_day}, "rebuilt_by": {"$ne": run_id}}
+    owners.update(await collection.distinct(owner_field, stale))
+    await collection.delete_many(stale)
+    return owners
+
+async def rollup_trend(collection, owner: Dict[str, str], topic: Optional[str], days: int) -> List[Dict[str, Any]]:
+    """Daily series (oldest first) of rollup counters with accuracy, summed over topics unless one is given"""
+    since = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+    query: Dict[str, Any] = {**owner, "day": {"$gte": since}}
+    if topic:
+        query["topic"] = topic
+    
+    series: Dict[str, Dict[str, int]] = {}
+    async for doc in collection.find(query, {"_id": 0}).max_time_ms(ANALYTICS_MAX_TIME_MS):
+        totals = series.setdefault(doc["day"], dict.fromkeys(ROLLUP_COUNTERS, 0))
+        for field in ROLLUP_COUNTERS:
+            totals[field] += doc.get(field, 0)
+    
+    return [
+        {
+            "day": day,
+            **totals,
+            "accuracy": round(totals["correct"] / totals["attempts"], 2) if totals["attempts"] > 0 else 0
+        }
+        for day, totals in sorted(series.items())
+    ]
+
+# ==================== STUDENT ROUTES ====================
+
+@api_router.get("/student/dashboard", response_model=DashboardResponse)
+async def student_dashboard(user: User = Depends(require_role(["student"]))):
+    """Get student dashboard data"""
+    
+    # Single point read of the materialized summary; built on first visit
+    summary = await db.student_summary.find_one(
+        {"user_id": user.user_id},
+        {"_id": 0, "user_id": 0, "updated_at": 0}
+    )
+    # Summaries from before minute buckets are rebuilt once, as are ones left mid-rebuild
+    if not summary or summary.get("rebuilding") or any(len(bucket) != 16 for bucket in summary.get("due_buckets") or {}):
+        summary = await rebuild_student_summary(user.user_id)
+    else:
+        await fold_due_buckets(user.user_id, summary)
+    
+    return {
+        "streak": summary.get("streak") or {"current_streak": 0, "longest_streak": 0},
+        "rewards": summary.get("rewards") or {"xp": 0, "level": 1, "badges": []},
+        "progress": {
+            "total_items": summary.get("total_items", 0),
+            "mastered": summary.get("mastered", 0),
+            "due_for_review": count_due_items(summary)
+        },
+        "recent_quizzes": summary.get("recent_quizzes", [])
+    }
+
+def encode_cursor(*values: str) -> str:
+    """Opaque keyset pagination cursor"""
+    return base64.urlsafe_b64encode("|".join(values).encode()).decode()
+
+def decode_cursor(cursor: str, parts: int) -> List[str]:
+    try:
+        values = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", parts - 1)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if len(values) != parts:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def merge_review_items(progress_docs: List[Dict[str, Any]], content_docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Content fields plus the progress fields the review bank shows, in progress order"""
+    content_by_id = {c["content_id"]: c for c in content_docs}
+    return [
+        {
+            **content_by_id[p["content_id"]],
+            "attempts": p["attempts"],
+            "confidence_score": p["confidence_score"],
+            "last_seen": p["last_seen"]
+        }
+        for p in progress_docs
+        if p["content_id"] in content_by_id
+    ]
+
+@api_router.get("/student/review-bank")
+async def review_bank(
+    request: Request,
+    response: Response,
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    user: User = Depends(require_role(["student"]))
+):
+    """Get items that need review (wrong answers), most recently seen first"""
+    version = await get_data_versions([f"student:{user.user_id}", "content"])
+    cached = not_modified(request, response, f"review-{user.user_id}", version)
+    if cached:
+        return cached
+    
+    limit = max(1, min(limit, 200))
+    
+    # Items with low confidence, after the cursor position
+    match: Dict[str, Any] = {"user_id": user.user_id, "confidence_score": {"$lt": 0.7}}
+    if topic:
+        match["topic"] = topic
+    if difficulty:
+        match["difficulty"] = difficulty
+    if cursor:
+        last_seen, content_id = decode_cursor(cursor, 2)
+        match["$or"] = [
+            {"last_seen": {"$lt": last_seen}},
+            {"last_seen": last_seen, "content_id": {"$lt": content_id}}
+        ]
+    
+    progress_docs = await db.student_progress.find(
+        match,
+        {"_id": 0, "content_id": 1, "attempts": 1, "confidence_score": 1, "last_seen": 1}
+    ).sort([("last_seen", -1), ("content_id", -1)]).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(progress_docs) > limit:
+        progress_docs = progress_docs[:limit]
+        next_cursor = encode_cursor(progress_docs[-1]["last_seen"], progress_docs[-1]["content_id"])
+    
+    content_docs = await content_catalog.get_many([p["content_id"] for p in progress_docs])
+    if content_catalog.version != version[1]:
+        drop_etag(response)
+    return {"items": merge_review_items(progress_docs, content_docs), "next_cursor": next_cursor}
+
+@api_router.get("/student/classes")
+async def student_classes(user: User = Depends(require_role(["student"]))):
+    """Classes the student belongs to"""
+    class_ids = await student_class_ids(user.user_id)
+    return await db.classes.find(
+        {"class_id": {"$in": class_ids}},
+        {"_id": 0, "class_id": 1, "class_name": 1, "teacher_id": 1}
+    ).to_list(len(class_ids))
+
+# ==================== CLASS MEMBERSHIP ====================
+
+ROSTER_PAGE_LIMIT = 200
+
+async def add_class_members(class_id: str, user_ids: List[str]) -> int:
+    """Idempotently add students to a class; returns how many were newly added"""
+    if not user_ids:
+        return 0
+    joined_at = datetime.now(timezone.utc).isoformat()
+    result = await db.class_memberships.bulk_write([
+        UpdateOne(
+            {"class_id": class_id, "user_id": user_id},
+            {"$setOnInsert": {"joined_at": joined_at}},
+            upsert=True
+        )
+        for user_id in user_ids
+    ], ordered=False)
+    added = result.upserted_count
+    if added:
+        await db.classes.update_one({"class_id": class_id}, {"$inc": {"student_count": added}})
+        await bump_data_versions([f"class:{class_id}"])
+        leaderboards.discard_class(class_id)
+    return added
+
+async def remove_class_member(class_id: str, user_id: str) -> bool:
+    result = await db.class_memberships.delete_one({"class_id": class_id, "user_id": user_id})
+    if result.deleted_count:
+        await db.classes.update_one({"class_id": class_id}, {"$inc": {"student_count": -1}})
+        await bump_data_versions([f"class:{class_id}"])
+        leaderboards.discard_class(class_id)
+    return bool(result.deleted_count)
+
+async def class_member_ids(class_id: str) -> List[str]:
+    return [
+        m["user_id"]
+        async for m in db.class_memberships.find({"class_id": class_id}, {"_id": 0, "user_id": 1})
+    ]
+
+async def student_class_ids(user_id: str) -> List[str]:
+    return [
+        m["class_id"]
+        async for m in db.class_memberships.find({"user_id": user_id}, {"_id": 0, "class_id": 1})
+    ]
+
+async def migrate_class_memberships() -> int:
+    """Move embedded Class.student_ids arrays into class_memberships; returns classes migrated"""
+    migrated = 0
+    async for class_doc in db.classes.find({"student_ids": {"$exists": True}}, {"_id": 0, "class_id": 1, "student_ids": 1}):
+        class_id = class_doc["class_id"]
+        await add_class_members(class_id, class_doc["student_ids"])
+        student_count = await db.class_memberships.count_documents({"class_id": class_id})
+        await db.classes.update_one(
+            {"class_id": class_id},
+            {"$set": {"student_count": student_count}, "$unset": {"student_ids": ""}}
+        )
+        migrated += 1
+    return migrated
+
+# ==================== TEACHER ROUTES ====================
+
+@api_router.post("/teacher/class")
+async def create_class(class_name: str, user: User = Depends(require_role(["teacher"]))):
+    """Create a new class"""
     class_doc = {
         "class_id": f"class_{uuid.uuid4().hex[:8]}",
         "teacher_id": user.user_id,
         "class_name": class_name,
         "class_code": f"{uuid.uuid4().hex[:6].upper()}",
-        "student_ids": [],
+        "student_count": 0,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
     await db.classes.insert_one(class_doc)
@@ -770,19 +2244,133 @@ async def get_classes(user: User = Depends(require_role(["teacher"]))):
 @api_router.post("/teacher/class/{class_id}/add-student")
 async def add_student_to_class(class_id: str, student_email: str, user: User = Depends(require_role(["teacher"]))):
     """Add student to class by email"""
-    student = await db.users.find_one({"email": student_email, "role": "student"}, {"_id": 0})
+    await get_owned_class(class_id, user)
+    student = await db.users.find_one(
+        {"email": student_email.strip(), "role": "student"}, {"_id": 0}, collation=EMAIL_COLLATION
+    )
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
     
-    await db.classes.update_one(
-        {"class_id": class_id, "teacher_id": user.user_id},
-        {"$addToSet": {"student_ids": student["user_id"]}}
-    )
+    await add_class_members(class_id, [student["user_id"]])
     
     return {"message": "Student added"}
 
-@api_router.get("/teacher/analytics/{class_id}")
-async def class_analytics(class_id: str, user: User = Depends(require_role(["teacher"]))):
+@api_router.get("/teacher/class/{class_id}/students")
+async def class_roster(
+    class_id: str,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    user: User = Depends(require_role(["teacher"]))
+):
+    """Page through a class roster in user_id order"""
+    await get_owned_class(class_id, user)
+    limit = max(1, min(limit, ROSTER_PAGE_LIMIT))
+    
+    query: Dict[str, Any] = {"class_id": class_id}
+    if cursor:
+        query["user_id"] = {"$gt": decode_cursor(cursor, 1)[0]}
+    memberships = await db.class_memberships.find(
+        query,
+        {"_id": 0, "user_id": 1, "joined_at": 1}
+    ).sort("user_id", 1).limit(limit + 1).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(memberships) > limit:
+        memberships = memberships[:limit]
+        next_cursor = encode_cursor(memberships[-1]["user_id"])
+    
+    users = {
+        u["user_id"]: u
+        async for u in db.users.find(
+            {"user_id": {"$in": [m["user_id"] for m in memberships]}},
+            {"_id": 0, "user_id": 1, "name": 1, "email": 1, "grade": 1}
+        )
+    }
+    items = [{**users.get(m["user_id"], {"user_id": m["user_id"]}), "joined_at": m.get("joined_at")} for m in memberships]
+    
+    return {"items": items, "next_cursor": next_cursor}
+
+@api_router.delete("/teacher/class/{class_id}/students/{student_id}")
+async def remove_student_from_class(class_id: str, student_id: str, user: User = Depends(require_role(["teacher"]))):
+    """Remove a student from a class"""
+    await get_owned_class(class_id, user)
+    if not await remove_class_member(class_id, student_id):
+        raise HTTPException(status_code=404, detail="Student not in class")
+    return {"message": "Student removed"}
+
+MAX_ROSTER_IMPORT = 5000
+# Case-insensitive email matching; ensure_indexes builds a users.email index with this collation
+EMAIL_COLLATION = {"locale": "en", "strength": 2}
+
+def parse_roster_emails(csv_text: str) -> List[str]:
+    """Emails from a roster CSV: the `email` column if there is a header, else the first column"""
+    rows = list(csv.reader(io.StringIO(csv_text)))
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    if "email" in header:
+        column = header.index("email")
+        rows = rows[1:]
+    else:
+        column = 0
+    return [row[column] for row in rows if len(row) > column]
+
+@api_router.post("/teacher/class/{class_id}/import-roster")
+async def import_roster(class_id: str, request: Request, user: User = Depends(require_role(["teacher"]))):
+    """Add many students to a class by email from a CSV upload, CSV body or JSON list."""
+    await get_owned_class(class_id, user)
+    
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("multipart/form-data"):
+            form = await request.form()
+            upload = form.get("file")
+            # Starlette's class: request.form() doesn't build FastAPI's UploadFile subclass
+            if not isinstance(upload, FormFile):
+                raise HTTPException(status_code=400, detail="Missing roster file")
+            raw_emails = parse_roster_emails((await upload.read()).decode("utf-8-sig"))
+        elif content_type.startswith("text/csv"):
+            raw_emails = parse_roster_emails((await request.body()).decode("utf-8-sig"))
+        else:
+            payload = await request.json()
+            raw_emails = payload.get("emails", []) if isinstance(payload, dict) else payload
+    except (UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Could not parse roster")
+    
+    if not isinstance(raw_emails, list):
+        raise HTTPException(status_code=400, detail="Roster must be a list of emails")
+    emails = list(dict.fromkeys(str(e).strip().lower() for e in raw_emails if str(e).strip()))
+    if len(emails) > MAX_ROSTER_IMPORT:
+        raise HTTPException(status_code=413, detail=f"Roster imports are limited to {MAX_ROSTER_IMPORT} emails")
+    
+    # Resolve every email in one query
+    students = await db.users.find(
+        {"email": {"$in": emails}, "role": "student"},
+        {"_id": 0, "user_id": 1, "email": 1},
+        collation=EMAIL_COLLATION
+    ).to_list(None)
+    found_emails = {s["email"].lower() for s in students}
+    student_ids = [s["user_id"] for s in students]
+    
+    added = await add_class_members(class_id, student_ids)
+    
+    return {
+        "added": added,
+        "already_in_class": len(student_ids) - added,
+        "unknown_emails": [email for email in emails if email not in found_emails]
+    }
+
+@api_router.get(
+    "/teacher/analytics/{class_id}",
+    response_model=ClassAnalyticsResponse,
+    response_model_by_alias=True
+)
+async def class_analytics(
+    class_id: str,
+    request: Request,
+    response: Response,
+    user: User = Depends(require_role(["teacher"]))
+):
     """Get class analytics"""
     
     # Get class
@@ -790,88 +2378,269 @@ async def class_analytics(class_id: str, user: User = Depends(require_role(["tea
     if not class_doc:
         raise HTTPException(status_code=404, detail="Class not found")
     
-    student_ids = class_doc["student_ids"]
-    if not student_ids:
-        return {"class": class_doc, "students": [], "topic_performance": []}
-    
-    # Get student progress
-    progress_docs = await db.student_progress.find(
-        {"user_id": {"$in": student_ids}},
-        {"_id": 0}
-    ).to_list(1000)
-    
-    # Get students
-    students = await db.users.find(
-        {"user_id": {"$in": student_ids}},
-        {"_id": 0}
-    ).to_list(100)
+    version = await get_data_versions([f"class:{class_id}", "content"])
+    cached = not_modified(request, response, f"class-{class_id}", version)
+    if cached:
+        return cached
     
-    # Calculate stats per student
+    computed_version, result = await cached_response(
+        "class_analytics",
+        (class_id,),
+        version,
+        lambda: compute_class_analytics(class_doc)
+    )
+    if computed_version != version:
+        drop_etag(response)
+    return result
+
+# Groups a student_progress match into per-topic attempts/correct totals
+TOPIC_STATS_STAGES = [
+    {"$match": {"topic": {"$ne": None}}},
+    {"$group": {
+        "_id": "$topic",
+        "total": {"$sum": "$attempts"},
+        "correct": {"$sum": "$correct_count"}
+    }}
+]
+
+def format_topic_performance(topic_stats: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [
+        {
+            "topic": stats["_id"],
+            "accuracy": round(stats["correct"] / stats["total"], 2) if stats["total"] > 0 else 0,
+            "total_attempts": stats["total"]
+        }
+        for stats in topic_stats
+    ]
+
+def merge_student_stats(students: List[Dict[str, Any]], student_groups: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Join users with their per-student progress groups; students with no progress get zeros"""
+    stats_by_student = {s["_id"]: s for s in student_groups}
     student_stats = []
     for student in students:
-        student_progress = [p for p in progress_docs if p["user_id"] == student["user_id"]]
-        total = len(student_progress)
-        mastered = len([p for p in student_progress if p["confidence_score"] >= 0.8])
-        avg_confidence = sum(p["confidence_score"] for p in student_progress) / total if total > 0 else 0
-        
+        stats = stats_by_student.get(student["user_id"], {})
         student_stats.append({
             "user_id": student["user_id"],
             "name": student["name"],
             "email": student["email"],
-            "total_items": total,
-            "mastered": mastered,
-            "avg_confidence": round(avg_confidence, 2)
+            "total_items": stats.get("total_items", 0),
+            "mastered": stats.get("mastered", 0),
+            "avg_confidence": round(stats.get("avg_confidence") or 0, 2)
         })
+    return student_stats
+
+def class_members_lookup(class_id: str, collection: str) -> List[Dict[str, Any]]:
+    """Pipeline stages turning a class's memberships into the members' `collection` documents."""
+    return [
+        {"$match": {"class_id": class_id}},
+        {"$lookup": {"from": collection, "localField": "user_id", "foreignField": "user_id", "as": "joined"}},
+        {"$unwind": "$joined"},
+        {"$replaceRoot": {"newRoot": "$joined"}}
+    ]
+
+async def compute_class_analytics(class_doc: Dict[str, Any]) -> Dict[str, Any]:
+    class_id = class_doc["class_id"]
     
-    # Topic performance (aggregate by topic)
-    content_ids = list(set(p["content_id"] for p in progress_docs))
-    if content_ids:
-        content_list = await db.content.find(
-            {"content_id": {"$in": content_ids}},
-            {"_id": 0}
-        ).to_list(1000)
-        
-        # Group by topic
-        topic_perf = {}
-        for content in content_list:
-            topic = content["topic"]
-            if topic not in topic_perf:
-                topic_perf[topic] = {"total": 0, "correct": 0}
-            
-            content_progress = [p for p in progress_docs if p["content_id"] == content["content_id"]]
-            for p in content_progress:
-                topic_perf[topic]["total"] += p["attempts"]
-                topic_perf[topic]["correct"] += p["correct_count"]
-        
-        topic_performance = [
-            {
-                "topic": topic,
-                "accuracy": round(stats["correct"] / stats["total"], 2) if stats["total"] > 0 else 0,
-                "total_attempts": stats["total"]
-            }
-            for topic, stats in topic_perf.items()
-        ]
-    else:
-        topic_performance = []
+    # Per-student and per-topic stats in a single pass over the class's progress
+    facets = await analytics_db.class_memberships.aggregate([
+        *class_members_lookup(class_id, "student_progress"),
+        {"$facet": {
+            "students": [
+                {"$group": {
+                    "_id": "$user_id",
+                    "total_items": {"$sum": 1},
+                    "mastered": {"$sum": {"$cond": [{"$gte": ["$confidence_score", MASTERED_THRESHOLD]}, 1, 0]}},
+                    "avg_confidence": {"$avg": "$confidence_score"}
+                }}
+            ],
+            "topics": TOPIC_STATS_STAGES
+        }}
+    ], maxTimeMS=ANALYTICS_MAX_TIME_MS).to_list(1)
+    student_groups = facets[0]["students"] if facets else []
+    topic_stats = facets[0]["topics"] if facets else []
+    
+    # Get students, including ones with no progress yet
+    students = await analytics_db.class_memberships.aggregate([
+        *class_members_lookup(class_id, "users"),
+        {"$project": {"_id": 0, "user_id": 1, "name": 1, "email": 1}}
+    ], maxTimeMS=ANALYTICS_MAX_TIME_MS).to_list(None)
     
     return {
         "class": class_doc,
-        "students": student_stats,
-        "topic_performance": topic_performance
+        "students": merge_student_stats(students, student_groups),
+        "topic_performance": format_topic_performance(topic_stats)
+    }
+
+MULTI_CLASS_CONCURRENCY = int(os.environ.get("MULTI_CLASS_CONCURRENCY", "4"))
+CONFIDENCE_BANDS = [0.2, 0.4, 0.6, 0.8]  # Upper bounds; the last band is 0.8-1.0
+
+def merge_class_analytics(results: List[Dict[str, Any]], topic_stats: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine per-class analytics into cohort totals, counting each student once"""
+    students: Dict[str, Dict[str, Any]] = {}
+    classes = []
+    
+    for result in results:
+        class_students = result["students"]
+        for student in class_students:
+            students.setdefault(student["user_id"], student)
+        classes.append({
+            "class_id": result["class"]["class_id"],
+            "class_name": result["class"]["class_name"],
+            "students": len(class_students),
+            "avg_confidence": round(
+                sum(s["avg_confidence"] for s in class_students) / len(class_students), 2
+            ) if class_students else 0
+        })
+    
+    confidence_distribution = [0] * (len(CONFIDENCE_BANDS) + 1)
+    for student in students.values():
+        confidence_distribution[bisect.bisect_right(CONFIDENCE_BANDS, student["avg_confidence"])] += 1
+    
+    return {
+        "classes": classes,
+        "total_students": len(students),
+        "students_with_mastery": sum(1 for s in students.values() if s["mastered"] > 0),
+        "confidence_distribution": [
+            {"band": f"{low:.1f}-{high:.1f}", "students": count}
+            for low, high, count in zip([0.0] + CONFIDENCE_BANDS, CONFIDENCE_BANDS + [1.0], confidence_distribution)
+        ],
+        "topic_performance": sorted(format_topic_performance(topic_stats), key=lambda t: t["topic"])
+    }
+
+@api_router.get("/teacher/cohort-analytics")
+async def cohort_analytics(
+    request: Request,
+    response: Response,
+    class_ids: Optional[str] = None,
+    user: User = Depends(require_role(["teacher"]))
+):
+    """Analytics across several of the teacher's classes (comma-separated ids, default all)"""
+    query: Dict[str, Any] = {"teacher_id": user.user_id}
+    if class_ids:
+        query["class_id"] = {"$in": class_ids.split(",")}
+    class_docs = await db.classes.find(query, {"_id": 0}).to_list(None)
+    if not class_docs:
+        raise HTTPException(status_code=404, detail="No classes found")
+    
+    cohort_ids = sorted(c["class_id"] for c in class_docs)
+    versions = await get_data_versions([f"class:{cid}" for cid in cohort_ids] + ["content"])
+    cohort_key = zlib.crc32(",".join(cohort_ids).encode())
+    cached = not_modified(request, response, f"cohort-{cohort_key:08x}", versions)
+    if cached:
+        return cached
+    class_versions = dict(zip(cohort_ids, versions))
+    
+    # Per-class aggregations run concurrently, at most MULTI_CLASS_CONCURRENCY at a time
+    semaphore = asyncio.Semaphore(MULTI_CLASS_CONCURRENCY)
+    
+    async def analyze(class_doc):
+        async with semaphore:
+            return await cached_response(
+                "class_analytics",
+                (class_doc["class_id"],),
+                (class_versions[class_doc["class_id"]], versions[-1]),
+                lambda: compute_class_analytics(class_doc)
+            )
+    
+    async def cohort_topic_stats():
+        # Students in several of the classes must only count once, so topics
+        # are aggregated over the union of members rather than summed per class
+        member_ids = await analytics_db.class_memberships.distinct(
+            "user_id", {"class_id": {"$in": [c["class_id"] for c in class_docs]}},
+            maxTimeMS=ANALYTICS_MAX_TIME_MS
+        )
+        async with semaphore:
+            return await analytics_db.student_progress.aggregate(
+                [{"$match": {"user_id": {"$in": member_ids}}}] + TOPIC_STATS_STAGES,
+                maxTimeMS=ANALYTICS_MAX_TIME_MS
+            ).to_list(None)
+    
+    topic_stats, *results = await asyncio.gather(
+        cohort_topic_stats(),
+        *(analyze(class_doc) for class_doc in class_docs)
+    )
+    if any(computed_version != (class_versions[result["class"]["class_id"]], versions[-1]) for computed_version, result in results):
+        drop_etag(response)
+    return merge_class_analytics([result for _, result in results], topic_stats)
+
+@api_router.get("/teacher/analytics/{class_id}/trends")
+async def class_trends(
+    class_id: str,
+    request: Request,
+    response: Response,
+    topic: Optional[str] = None,
+    days: int = 28,
+    user: User = Depends(require_role(["teacher"]))
+):
+    """Daily attempts, accuracy and mastery changes for a class from the rollups"""
+    class_doc = await db.classes.find_one(
+        {"class_id": class_id, "teacher_id": user.user_id},
+        {"_id": 0, "class_id": 1}
+    )
+    if not class_doc:
+        raise HTTPException(status_code=404, detail="Class not found")
+    
+    days = max(1, min(days, 366))
+    # The window slides daily, so the current day is part of the tag
+    version = await get_data_versions([f"class:{class_id}"]) + (datetime.now(timezone.utc).date().isoformat(),)
+    cached = not_modified(request, response, f"class-trends-{class_id}-{topic}-{days}", version)
+    if cached:
+        return cached
+    return {
+        "class_id": class_id,
+        "topic": topic,
+        "days": await rollup_trend(analytics_db.rollup_class_topic_daily, {"class_id": class_id}, topic, days)
     }
 
+STUDENT_PROGRESS_PAGE_LIMIT = 1000
+
 @api_router.get("/teacher/student/{student_id}/progress")
-async def student_progress(student_id: str, user: User = Depends(require_role(["teacher"]))):
-    """Get individual student progress"""
+async def student_progress(
+    student_id: str,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = STUDENT_PROGRESS_PAGE_LIMIT,
+    user: User = Depends(require_role(["teacher"]))
+):
+    """Get individual student progress, a page of items at a time in content_id order"""
     
     student = await db.users.find_one({"user_id": student_id, "role": "student"}, {"_id": 0})
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
+    limit = max(1, min(limit, STUDENT_PROGRESS_PAGE_LIMIT))
+    after = decode_cursor(cursor, 1)[0] if cursor else None
     
-    progress_docs = await db.student_progress.find(
-        {"user_id": student_id},
+    # Progress rows carry denormalized content fields, so content uploads change the body too
+    version = await get_data_versions([f"student:{student_id}", "content"])
+    cached = not_modified(request, response, f"student-{student_id}-{cursor}-{limit}", version)
+    if cached:
+        return cached
+    
+    computed_version, result = await cached_response(
+        "student_progress",
+        (student_id, after, limit),
+        version,
+        lambda: compute_student_progress(student, after, limit)
+    )
+    if computed_version != version:
+        drop_etag(response)
+    return result
+
+async def compute_student_progress(student: Dict[str, Any], after: Optional[str], limit: int) -> Dict[str, Any]:
+    student_id = student["user_id"]
+    query: Dict[str, Any] = {"user_id": student_id}
+    if after is not None:
+        query["content_id"] = {"$gt": after}
+    progress_docs = await analytics_db.student_progress.find(
+        query,
         {"_id": 0}
-    ).to_list(1000)
+    ).sort("content_id", 1).limit(limit + 1).max_time_ms(ANALYTICS_MAX_TIME_MS).to_list(limit + 1)
+    
+    next_cursor = None
+    if len(progress_docs) > limit:
+        progress_docs = progress_docs[:limit]
+        next_cursor = encode_cursor(progress_docs[-1]["content_id"])
     
     streak_doc = await db.streaks.find_one({"user_id": student_id}, {"_id": 0})
     rewards_doc = await db.rewards.find_one({"user_id": student_id}, {"_id": 0})
@@ -879,22 +2648,1064 @@ async def student_progress(student_id: str, user: User = Depends(require_role(["
     return {
         "student": student,
         "progress": progress_docs,
+        "next_cursor": next_cursor,
         "streak": streak_doc or {"current_streak": 0},
         "rewards": rewards_doc or {"xp": 0, "level": 1}
     }
 
+@api_router.get("/teacher/student/{student_id}/trends")
+async def student_trends(
+    student_id: str,
+    request: Request,
+    response: Response,
+    topic: Optional[str] = None,
+    days: int = 28,
+    user: User = Depends(require_role(["teacher"]))
+):
+    """Daily attempts, accuracy and mastery changes for one student from the rollups"""
+    days = max(1, min(days, 366))
+    version = await get_data_versions([f"student:{student_id}"]) + (datetime.now(timezone.utc).date().isoformat(),)
+    cached = not_modified(request, response, f"student-trends-{student_id}-{topic}-{days}", version)
+    if cached:
+        return cached
+    return {
+        "student_id": student_id,
+        "topic": topic,
+        "days": await rollup_trend(analytics_db.rollup_student_topic_daily, {"user_id": student_id}, topic, days)
+    }
+
+@api_router.get("/cache/stats")
+async def cache_stats(user: User = Depends(require_role(["teacher"]))):
+    """Analytics cache occupancy and hit ratio per endpoint"""
+    return analytics_cache.stats()
+
+# ==================== LIVE CLASS MONITOR ====================
+
+LIVE_QUEUE_SIZE = int(os.environ.get('LIVE_QUEUE_SIZE', '100'))
+LIVE_KEEPALIVE_SECONDS = float(os.environ.get('LIVE_KEEPALIVE_SECONDS', '15'))
+
+class LiveSubscriber:
+    __slots__ = ("queue", "dropped")
+    
+    def __init__(self, maxsize: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+class ClassEventHub:
+    """In-process pub/sub of quiz activity, keyed by class."""
+    
+    def __init__(self, queue_size: int):
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, set] = {}
+    
+    def active(self) -> bool:
+        return bool(self.subscribers)
+    
+    def subscribe(self, class_id: str) -> LiveSubscriber:
+        subscriber = LiveSubscriber(self.queue_size)
+        self.subscribers.setdefault(class_id, set()).add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, class_id: str, subscriber: LiveSubscriber):
+        subscribers = self.subscribers.get(class_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[class_id]
+    
+    def publish(self, class_ids: List[str], event: Dict[str, Any]):
+        for class_id in class_ids:
+            for subscriber in self.subscribers.get(class_id, ()):
+                if subscriber.queue.full():
+                    subscriber.queue.get_nowait()
+                    subscriber.dropped += 1
+                subscriber.queue.put_nowait(event)
+
+class_events = ClassEventHub(LIVE_QUEUE_SIZE)
+
+def sse_frame(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@api_router.get("/teacher/class/{class_id}/live")
+async def class_live(class_id: str, user: User = Depends(require_role(["teacher"]))):
+    """Server-sent events of answers and completions in a class as they happen."""
+    await get_owned_class(class_id, user)
+    
+    async def stream():
+        # Subscribed only once the body starts, so a client gone before then leaves nothing behind
+        subscriber = class_events.subscribe(class_id)
+        try:
+            yield sse_frame("ready", {"class_id": class_id})
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if subscriber.dropped:
+                    yield sse_frame("lagged", {"dropped": subscriber.dropped})
+                    subscriber.dropped = 0
+                yield sse_frame(event["type"], event)
+        finally:
+            class_events.unsubscribe(class_id, subscriber)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ==================== LEADERBOARDS ====================
+
+LEADERBOARD_MAX_BOARDS = int(os.environ.get('LEADERBOARD_MAX_BOARDS', '256'))
+LEADERBOARD_REFRESH_SECONDS = float(os.environ.get('LEADERBOARD_REFRESH_SECONDS', '300'))
+LEADERBOARD_MAX_LIMIT = 100
+
+def week_start(now: datetime) -> str:
+    """Monday of `now`'s week, the key for weekly XP"""
+    return (now.date() - timedelta(days=now.weekday())).isoformat()
+
+class RankedBoard:
+    """XP standings kept sorted by (-xp, user_id)."""
+    __slots__ = ("keys", "xp", "loaded_at")
+    
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.xp = {row["user_id"]: row["xp"] for row in rows}
+        # Rows arrive sorted from Mongo, so this is a linear pass
+        self.keys = sorted((-xp, user_id) for user_id, xp in self.xp.items())
+        self.loaded_at = time.monotonic()
+    
+    def __len__(self) -> int:
+        return len(self.keys)
+    
+    def set(self, user_id: str, xp: int):
+        """Record a new XP total; totals only grow, so older values are ignored"""
+        old = self.xp.get(user_id)
+        if old is not None:
+            if xp <= old:
+                return
+            del self.keys[bisect.bisect_left(self.keys, (-old, user_id))]
+        bisect.insort(self.keys, (-xp, user_id))
+        self.xp[user_id] = xp
+    
+    def remove(self, user_id: str):
+        xp = self.xp.pop(user_id, None)
+        if xp is not None:
+            del self.keys[bisect.bisect_left(self.keys, (-xp, user_id))]
+    
+    def rank(self, user_id: str) -> Optional[int]:
+        xp = self.xp.get(user_id)
+        if xp is None:
+            return None
+        # (-xp,) sorts before every (-xp, user_id), so this counts strictly higher totals
+        return bisect.bisect_left(self.keys, (-xp,)) + 1
+    
+    def top(self, n: int) -> List[tuple]:
+        """(rank, user_id, xp) for the first n entries"""
+        entries = []
+        for position, (negative_xp, user_id) in enumerate(self.keys[:n]):
+            rank = entries[-1][0] if entries and entries[-1][2] == -negative_xp else position + 1
+            entries.append((rank, user_id, -negative_xp))
+        return entries
+
+class LeaderboardStore:
+    """In-process boards keyed by (kind, scope_id, period), loaded from Mongo on first use."""
+    
+    def __init__(self, max_boards: int, refresh_seconds: float):
+        self.max_boards = max_boards
+        self.refresh_seconds = refresh_seconds
+        self.boards: "OrderedDict[tuple, RankedBoard]" = OrderedDict()
+        self.loading: Dict[tuple, asyncio.Task] = {}
+        self.pending: Dict[tuple, Dict[str, int]] = {}  # XP recorded while a board loads
+    
+    def _load(self, key: tuple, load) -> asyncio.Task:
+        task = self.loading.get(key)
+        if task is None:
+            pending = self.pending[key] = {}
+            async def run():
+                try:
+                    board = RankedBoard(await load())
+                    for user_id, xp in pending.items():
+                        board.set(user_id, xp)
+                    # A discard while loading means the rows may predate a roster change
+                    if self.loading.get(key) is task:
+                        self.boards[key] = board
+                        self.boards.move_to_end(key)
+                        while len(self.boards) > self.max_boards:
+                            self.boards.popitem(last=False)
+                    return board
+                finally:
+                    if self.loading.get(key) is task:
+                        del self.loading[key]
+                        del self.pending[key]
+            task = self.loading[key] = asyncio.create_task(run())
+        return task
+    
+    async def get(self, key: tuple, load) -> RankedBoard:
+        board = self.boards.get(key)
+        if board is None:
+            return await asyncio.shield(self._load(key, load))
+        self.boards.move_to_end(key)
+        if time.monotonic() - board.loaded_at >= self.refresh_seconds and key not in self.loading:
+            self._load(key, load).add_done_callback(self._log_reload_error)
+        return board
+    
+    @staticmethod
+    def _log_reload_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception():
+            logger.error(f"Leaderboard reload error: {task.exception()}")
+    
+    def has_class_boards(self) -> bool:
+        return any(key[0] == "class" for key in (*self.boards, *self.loading))
+    
+    def record_xp(self, user_id: str, grade: Optional[str], class_ids: List[str], period: str, xp: int):
+        keys = [("school", "", period)] + [("class", class_id, period) for class_id in class_ids]
+        if grade:
+            keys.append(("grade", grade, period))
+        for key in keys:
+            board = self.boards.get(key)
+            if board is not None:
+                board.set(user_id, xp)
+            pending = self.pending.get(key)
+            if pending is not None:
+                pending[user_id] = max(pending.get(user_id, 0), xp)
+    
+    def discard(self, kind: str, scope_id: str):
+        """Drop every period's board for a scope, and disown loads already running for it"""
+        for key in [key for key in (*self.boards, *self.loading) if key[:2] == (kind, scope_id)]:
+            self.boards.pop(key, None)
+            if self.loading.pop(key, None) is not None:
+                del self.pending[key]
+    
+    def discard_class(self, class_id: str):
+        """Drop a class's boards after its roster changes"""
+        self.discard("class", class_id)
+    
+    def change_grade(self, user_id: str, old_grade: Optional[str], new_grade: str):
+        """Move a student between grade boards, using their totals on the loaded school boards"""
+        if old_grade:
+            for key, board in self.boards.items():
+                if key[:2] == ("grade", old_grade):
+                    board.remove(user_id)
+        for key in [key for key in (*self.boards, *self.loading) if key[:2] == ("grade", new_grade)]:
+            school = self.boards.get(("school", "", key[2]))
+            if key in self.boards and school is not None:
+                if user_id in school.xp:
+                    self.boards[key].set(user_id, school.xp[user_id])
+                continue
+            # No loaded school board to copy the total from, so load this one afresh
+            self.boards.pop(key, None)
+            if self.loading.pop(key, None) is not None:
+                del self.pending[key]
+
+leaderboards = LeaderboardStore(LEADERBOARD_MAX_BOARDS, LEADERBOARD_REFRESH_SECONDS)
+
+def leaderboard_loader(kind: str, scope_id: str, period: str):
+    """Indexed sorted query for one board: rewards for all-time, xp_weekly for a week"""
+    async def load() -> List[Dict[str, Any]]:
+        collection = db.rewards if period == "all" else db.xp_weekly
+        query: Dict[str, Any] = {} if period == "all" else {"week": period}
+        if kind == "grade":
+            query["grade"] = scope_id
+        elif kind == "class":
+            query["user_id"] = {"$in": await class_member_ids(scope_id)}
+        return await collection.find(
+            query, {"_id": 0, "user_id": 1, "xp": 1}
+        ).sort([("xp", -1), ("user_id", 1)]).to_list(None)
+    return load
+
+async def leaderboard_named_ids(user: User, user_ids: List[str]) -> set:
+    """Those of `user_ids` sharing a class with the caller, as teacher or classmate"""
+    if user.role == "teacher":
+        class_ids = await db.classes.distinct("class_id", {"teacher_id": user.user_id})
+    else:
+        class_ids = await student_class_ids(user.user_id)
+    named = {user.user_id} & set(user_ids)
+    if class_ids:
+        named.update(await db.class_memberships.distinct(
+            "user_id", {"class_id": {"$in": class_ids}, "user_id": {"$in": user_ids}}
+        ))
+    return named
+
+async def leaderboard_response(kind: str, scope_id: str, period: str, limit: int, user: User) -> Dict[str, Any]:
+    if period not in ("all", "week"):
+        raise HTTPException(status_code=400, detail="period must be 'all' or 'week'")
+    board_period = "all" if period == "all" else week_start(datetime.now(timezone.utc))
+    board = await leaderboards.get((kind, scope_id, board_period), leaderboard_loader(kind, scope_id, board_period))
+    
+    top = board.top(limit)
+    top_ids = [user_id for _, user_id, _ in top]
+    # School and grade boards span every class, so only name students the caller shares a class with
+    named_ids = top_ids if kind == "class" else list(await leaderboard_named_ids(user, top_ids))
+    names = {
+        u["user_id"]: u["name"]
+        async for u in db.users.find({"user_id": {"$in": named_ids}}, {"_id": 0, "user_id": 1, "name": 1})
+    }
+    rank = board.rank(user.user_id)
+    return {
+        "board": kind,
+        "period": period,
+        "week": None if period == "all" else board_period,
+        "total": len(board),
+        "entries": [
+            {"rank": rank, "user_id": user_id, "name": names.get(user_id), "xp": xp}
+            for rank, user_id, xp in top
+        ],
+        "me": {"rank": rank, "xp": board.xp[user.user_id]} if rank else None
+    }
+
+@api_router.get("/leaderboard/school")
+async def school_leaderboard(
+    period: str = "all",
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    user: User = Depends(require_role(["student", "teacher"]))
+):
+    """Top students by XP across the school, named only within the caller's classes, plus the caller's rank"""
+    return await leaderboard_response("school", "", period, limit, user)
+
+@api_router.get("/leaderboard/grade/{grade}")
+async def grade_leaderboard(
+    grade: str,
+    period: str = "all",
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    user: User = Depends(require_role(["student", "teacher"]))
+):
+    """Top students by XP in one grade, named only within the caller's classes; students may only view their own grade"""
+    if user.role == "student" and user.grade != grade:
+        raise HTTPException(status_code=403, detail="Not your grade")
+    return await leaderboard_response("grade", grade, period, limit, user)
+
+@api_router.get("/leaderboard/class/{class_id}")
+async def class_leaderboard(
+    class_id: str,
+    period: str = "all",
+    limit: int = Query(10, ge=1, le=LEADERBOARD_MAX_LIMIT),
+    user: User = Depends(require_role(["student", "teacher"]))
+):
+    """Top students by XP in a class the caller teaches or belongs to"""
+    if user.role == "teacher":
+        await get_owned_class(class_id, user)
+    elif not await db.class_memberships.find_one({"class_id": class_id, "user_id": user.user_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Class not found")
+    return await leaderboard_response("class", class_id, period, limit, user)
+
+async def backfill_rewards_grades(batch_size: int = 500) -> int:
+    """Copy each student's grade onto their rewards document for grade boards; returns students processed"""
+    processed = 0
+    batch = []
+    cursor = db.users.find({"role": "student"}, {"_id": 0, "user_id": 1, "grade": 1})
+    async for student in cursor.batch_size(batch_size):
+        batch.append(UpdateOne({"user_id": student["user_id"]}, {"$set": {"grade": student.get("grade")}}))
+        if len(batch) >= batch_size:
+            await db.rewards.bulk_write(batch, ordered=False)
+            processed += len(batch)
+            batch = []
+    if batch:
+        await db.rewards.bulk_write(batch, ordered=False)
+        processed += len(batch)
+    return processed
+
+# ==================== EXPORT ROUTES ====================
+
+EXPORT_BATCH_SIZE = 500
+EXPORT_MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+CONTENT_EXPORT_COLUMNS = [
+    "id", "grade", "term", "topic", "subtopic", "difficulty", "question_text",
+    "answer_text", "explanation", "source", "tags", "alternate_answers"
+]
+PROGRESS_EXPORT_COLUMNS = [
+    "user_id", "name", "email", "content_id", "attempts", "correct_count",
+    "confidence_score", "last_seen", "next_review"
+]
+ANSWER_EXPORT_COLUMNS = [
+    "answer_id", "session_id", "user_id", "content_id", "user_answer", "correct", "confidence", "timestamp"
+]
+
+async def export_chunks(rows, columns: List[str], fmt: str):
+    """Encode an async iterator of row dicts as CSV or NDJSON, one chunk per batch"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore") if fmt == "csv" else None
+    if writer:
+        writer.writeheader()
+    
+    count = 0
+    async for row in rows:
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row, default=str) + "\n")
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+async def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    async for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_response(rows, columns: List[str], fmt: str, gzip: bool, filename: str) -> StreamingResponse:
+    if fmt not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    
+    chunks = export_chunks(rows, columns, fmt)
+    filename = f"{filename}.{fmt}"
+    media_type = EXPORT_MEDIA_TYPES[fmt]
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+async def get_owned_class(class_id: str, user: User) -> Dict[str, Any]:
+    class_doc = await db.classes.find_one({"class_id": class_id, "teacher_id": user.user_id}, {"_id": 0})
+    if not class_doc:
+        raise HTTPException(status_code=404, detail="Class not found")
+    return class_doc
+
+@api_router.get("/export/content")
+async def export_content(
+    grade: Optional[str] = None,
+    term: Optional[str] = None,
+    topic: Optional[str] = None,
+    difficulty: Optional[str] = None,
+    fmt: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    user: User = Depends(require_role(["teacher"]))
+):
+    """Stream the content bank in the same CSV layout /content/upload accepts"""
+    query = {}
+    if grade:
+        query["grade"] = grade
+    if term:
+        query["term"] = term
+    if topic:
+        query["topic"] = topic
+    if difficulty:
+        query["difficulty"] = difficulty
+    
+    async def rows():
+        cursor = db.content.find(query, {"_id": 0}).batch_size(EXPORT_BATCH_SIZE)
+        async for doc in cursor:
+            row = {**doc, "id": doc["content_id"]}
+            if fmt == "csv":
+                row["tags"] = ",".join(doc.get("tags", []))
+                row["alternate_answers"] = "|".join(doc.get("alternate_answers", []))
+            yield row
+    
+    return export_response(rows(), CONTENT_EXPORT_COLUMNS, fmt, gzip, "content")
+
+@api_router.get("/export/class/{class_id}/progress")
+async def export_class_progress(
+    class_id: str,
+    fmt: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    user: User = Depends(require_role(["teacher"]))
+):
+    """Stream every progress row of every student in a class"""
+    await get_owned_class(class_id, user)
+    
+    async def rows():
+        # Memberships come off the (class_id, user_id) index already in user order
+        cursor = export_db.class_memberships.aggregate([
+            {"$match": {"class_id": class_id}},
+            {"$sort": {"user_id": 1}},
+            {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "user_id", "as": "student"}},
+            {"$lookup": {"from": "student_progress", "localField": "user_id", "foreignField": "user_id", "as": "progress"}},
+            {"$unwind": "$progress"},
+            {"$addFields": {
+                "progress.name": {"$arrayElemAt": ["$student.name", 0]},
+                "progress.email": {"$arrayElemAt": ["$student.email", 0]}
+            }},
+            {"$replaceRoot": {"newRoot": "$progress"}},
+            {"$project": {"_id": 0}}
+        ], allowDiskUse=True, batchSize=EXPORT_BATCH_SIZE)
+        async for doc in cursor:
+            yield doc
+    
+    return export_response(rows(), PROGRESS_EXPORT_COLUMNS, fmt, gzip, f"{class_id}_progress")
+
+@api_router.get("/export/class/{class_id}/answers")
+async def export_class_answers(
+    class_id: str,
+    fmt: str = Query("csv", alias="format"),
+    gzip: bool = False,
+    user: User = Depends(require_role(["teacher"]))
+):
+    """Stream the answer history of every student in a class"""
+    await get_owned_class(class_id, user)
+    
+    async def rows():
+        # Older answers have no user_id, so go through the students' sessions
+        cursor = export_db.class_memberships.aggregate([
+            *class_members_lookup(class_id, "quiz_sessions"),
+            {"$sort": {"started_at": 1}},
+            {"$lookup": {
+                "from": "quiz_answers",
+                "localField": "session_id",
+                "foreignField": "session_id",
+                "as": "answer"
+            }},
+            {"$unwind": "$answer"},
+            {"$addFields": {"answer.user_id": "$user_id"}},
+            {"$replaceRoot": {"newRoot": "$answer"}},
+            {"$project": {"_id": 0}}
+        ], allowDiskUse=True, batchSize=EXPORT_BATCH_SIZE)
+        async for doc in cursor:
+            yield doc
+    
+    return export_response(rows(), ANSWER_EXPORT_COLUMNS, fmt, gzip, f"{class_id}_answers")
+
+# ==================== METRICS ====================
+
+# Bearer token scrapers must send to /api/metrics; the endpoint refuses everyone while unset
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+LOOP_LAG_INTERVAL_SECONDS = float(os.environ.get('LOOP_LAG_INTERVAL_SECONDS', '0.5'))
+SLOW_REQUEST_SECONDS = float(os.environ.get('SLOW_REQUEST_SECONDS', '1.0'))
+# Fraction of matching requests to run under cProfile; 0 disables profiling
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_PATH_PREFIX = os.environ.get('PROFILE_PATH_PREFIX', '/api/')
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', '/tmp/quizvoice-profiles'))
+
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds",
+    "Request latency by method, route template and status",
+    ("method", "route", "status")
+)
+http_requests_in_flight = metrics.gauge("http_requests_in_flight", "HTTP requests currently being served")
+external_call_seconds = metrics.histogram(
+    "external_call_duration_seconds",
+    "Latency of calls to external services (tts, stt, auth) by outcome",
+    ("service", "outcome")
+)
+external_calls_in_flight = metrics.gauge("external_calls_in_flight", "External service calls awaiting a reply", ("service",))
+event_loop_lag = metrics.gauge("event_loop_lag_seconds", "Most recent delay in waking a periodic event loop timer")
+event_loop_lag_seconds = metrics.histogram(
+    "event_loop_lag_distribution_seconds", "Event loop timer wake-up delays"
+)
+metrics.gauge("live_monitor_subscribers", "Open live class monitor streams",
+              function=lambda: sum(len(subscribers) for subscribers in class_events.subscribers.values()))
+
+@asynccontextmanager
+async def external_call(service: str):
+    """Time a call to an external service, labelled ok or error"""
+    external_calls_in_flight.inc(service)
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        elapsed = time.perf_counter() - start
+        external_calls_in_flight.dec(service)
+        external_call_seconds.observe(elapsed, service, outcome)
+        trace = metrics.current_trace.get()
+        if trace is not None:
+            trace.external_seconds += elapsed
+
+class MetricsMiddleware:
+    """Record latency per route template, so /content/{content_id} is one series"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        status = "500"
+        
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+        
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                route.path if route is not None else "unmatched",
+                status
+            )
+
+class RequestTimingMiddleware:
+    """Per-request DB and external-call accounting."""
+    
+    profiling = False
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        trace = metrics.RequestTrace(uuid.uuid4().hex[:12])
+        token = metrics.current_trace.set(trace)
+        start = time.perf_counter()
+        status = 500
+        event_stream = False
+        
+        async def send_with_timing(message):
+            nonlocal status, event_stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                headers = MutableHeaders(raw=message["headers"])
+                event_stream = headers.get("content-type", "").startswith("text/event-stream")
+                headers["X-Request-ID"] = trace.request_id
+                headers["Server-Timing"] = (
+                    f'db;dur={trace.db_seconds * 1000:.1f};desc="{len(trace.db_ops)} ops", '
+                    f"ext;dur={trace.external_seconds * 1000:.1f}, "
+                    f"app;dur={elapsed_ms:.1f}"
+                )
+            await send(message)
+        
+        profiler = self._start_profiler(scope["path"])
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.current_trace.reset(token)
+            if profiler is not None:
+                self._finish_profiler(profiler, trace.request_id, scope["path"])
+            # Event streams stay open until the client leaves; their length isn't latency
+            if elapsed >= SLOW_REQUEST_SECONDS and not event_stream:
+                self._log_slow_request(scope, status, elapsed, trace)
+    
+    def _start_profiler(self, path: str):
+        if (
+            PROFILE_SAMPLE_RATE <= 0
+            or RequestTimingMiddleware.profiling
+            or not path.startswith(PROFILE_PATH_PREFIX)
+            or random.random() >= PROFILE_SAMPLE_RATE
+        ):
+            return None
+        RequestTimingMiddleware.profiling = True
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+    
+    def _finish_profiler(self, profiler, request_id: str, path: str):
+        profiler.disable()
+        RequestTimingMiddleware.profiling = False
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        profile_path = PROFILE_DIR / f"{request_id}.prof"
+        profiler.dump_stats(profile_path)
+        logger.info(f"Profiled {path} as {profile_path}")
+    
+    def _log_slow_request(self, scope, status: int, elapsed: float, trace):
+        queries = "; ".join(
+            f"{collection}.{command} {seconds * 1000:.1f}ms" + ("" if outcome == "ok" else f" ({outcome})")
+            for collection, command, outcome, seconds in trace.db_ops
+        )
+        logger.warning(
+            f"Slow request {trace.request_id} {scope['method']} {scope['path']} -> {status} "
+            f"in {elapsed * 1000:.0f}ms: db {trace.db_seconds * 1000:.0f}ms over {len(trace.db_ops)} ops, "
+            f"ext {trace.external_seconds * 1000:.0f}ms [{queries}]"
+        )
+
+async def monitor_event_loop_lag():
+    """Sleep for a fixed interval and record how late the loop woke us"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+        lag = max(0.0, time.perf_counter() - start - LOOP_LAG_INTERVAL_SECONDS)
+        event_loop_lag.set(lag)
+        event_loop_lag_seconds.observe(lag)
+
+@api_router.get("/metrics")
+async def metrics_endpoint(request: Request):
+    """Prometheus text exposition of the process metrics"""
+    # Route labels describe internal traffic, so there is no anonymous access
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=403, detail="Metrics are disabled until METRICS_TOKEN is set")
+    if not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return Response(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# ==================== HEALTH ====================
+
+READY_PING_TIMEOUT_SECONDS = float(os.environ.get('READY_PING_TIMEOUT_SECONDS', '2'))
+INDEX_RETRY_SECONDS = float(os.environ.get('INDEX_RETRY_SECONDS', '5'))
+IMPORT_BUDGET_SECONDS = float(os.environ.get('IMPORT_BUDGET_SECONDS', '1.5'))
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the worker is up and its event loop is serving"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: Mongo answers a ping and startup index creation has finished"""
+    checks = {"indexes": "ok" if getattr(app.state, "database_ready", False) else "pending"}
+    try:
+        await asyncio.wait_for(db.command("ping"), READY_PING_TIMEOUT_SECONDS)
+        checks["mongo"] = "ok"
+    except Exception as e:
+        checks["mongo"] = f"error: {e.__class__.__name__}"
+    ready = all(status == "ok" for status in checks.values())
+    return ORJSONResponse(
+        {"status": "ready" if ready else "not ready", "checks": checks},
+        status_code=200 if ready else 503
+    )
+
+async def prepare_database():
+    """Create indexes and finish pending migrations in the background, retrying until Mongo is reachable"""
+    while True:
+        started = time.perf_counter()
+        try:
+            await ensure_indexes()
+        except Exception as e:
+            logger.error(f"Index setup failed, retrying in {INDEX_RETRY_SECONDS:.0f}s: {e}")
+            await asyncio.sleep(INDEX_RETRY_SECONDS)
+            continue
+        app.state.database_ready = True
+        logger.info(f"Indexes ensured in {(time.perf_counter() - started) * 1000:.0f}ms; ready for traffic")
+        return
+
+# ==================== MIDDLEWARE ====================
+
+COMPRESSION_MINIMUM_SIZE = int(os.environ.get('COMPRESSION_MINIMUM_SIZE', '1024'))
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick brotli over gzip from an Accept-Encoding header, honouring q=0"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip())
+    for coding in ("br", "gzip"):
+        if coding in accepted:
+            return coding
+    return None
+
+class CompressionMiddleware:
+    """Brotli/gzip for buffered responses above a size threshold."""
+    
+    def __init__(self, app, minimum_size: int = COMPRESSION_MINIMUM_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        
+        start_message = None
+        
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+            
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            compressible = (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            )
+            if compressible:
+                body = brotli.compress(body, quality=4) if encoding == "br" else gzip.compress(body, compresslevel=6)
+                headers["Content-Encoding"] = encoding
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            elif "content-encoding" not in headers:
+                headers.add_vary_header("Accept-Encoding")
+            await send(start)
+            await send(message)
+        
+        await self.app(scope, receive, send_compressed)
+
+# Requests are grouped into classes with their own per-user token bucket
+# (sustained rate per second, burst), per-user concurrency cap and shedding
+# priority: "low" GETs go first under load, then "normal"; "critical" never.
+RateClass = Dict[str, Any]
+RATE_CLASSES: Dict[str, RateClass] = {
+    "voice": {"rate": 1, "burst": 10, "concurrency": 2, "priority": "normal"},
+    "upload": {"rate": 0.1, "burst": 3, "concurrency": 1, "priority": "normal"},
+    "analytics": {"rate": 2, "burst": 20, "concurrency": 4, "priority": "low"},
+    "browse": {"rate": 5, "burst": 30, "concurrency": None, "priority": "low"},
+    "quiz": {"rate": 10, "burst": 40, "concurrency": None, "priority": "critical"},
+    "system": {"rate": 10, "burst": 50, "concurrency": None, "priority": "critical"},
+    "default": {"rate": 10, "burst": 50, "concurrency": None, "priority": "normal"},
+}
+RATE_CLASS_ROUTES = [
+    (re.compile(r"^/api/voice/(tts|stt)$|^/api/quiz/[^/]+/bundle$"), "voice"),
+    (re.compile(r"^/api/content/upload$|^/api/teacher/class/[^/]+/import-roster$"), "upload"),
+    (re.compile(r"^/api/teacher/(analytics|cohort-analytics|student/[^/]+/(progress|trends))|^/api/export/"), "analytics"),
+    (re.compile(r"^/api/content/(list|search)$|^/api/student/review-bank$|^/api/leaderboard/"), "browse"),
+    (re.compile(r"^/api/(quiz|auth)/|^/api/voice/validate-answer$"), "quiz"),
+    (re.compile(r"^/api/metrics$|^/(healthz|readyz)$"), "system"),
+]
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+RATE_LIMIT_AUTH_CACHE_SECONDS = float(os.environ.get('RATE_LIMIT_AUTH_CACHE_SECONDS', '60'))
+# Reverse proxies whose X-Forwarded-For is believed (comma-separated addresses or CIDRs)
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip()) for proxy in os.environ.get('TRUSTED_PROXIES', '').split(',') if proxy.strip()
+]
+LOAD_SHED_LOOP_LAG_SECONDS = float(os.environ.get('LOAD_SHED_LOOP_LAG_SECONDS', '0.25'))
+LOAD_SHED_DB_SECONDS = float(os.environ.get('LOAD_SHED_DB_SECONDS', '0.5'))
+
+admission_rejections = metrics.counter(
+    "admission_rejections_total", "Requests refused by admission control", ("route_class", "reason")
+)
+
+def session_token_from(scope) -> Optional[str]:
+    """The session cookie or bearer token, as read by get_current_user"""
+    headers = Headers(scope=scope)
+    for cookie in headers.get("cookie", "").split(";"):
+        name, _, value = cookie.strip().partition("=")
+        if name == "session_token" and value:
+            return value
+    auth_header = headers.get("authorization", "")
+    if auth_header.startswith("Bearer "):
+        return auth_header.split(" ")[1] or None
+    return None
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+def client_address(scope) -> str:
+    """The peer address, or the first untrusted hop of X-Forwarded-For when the peer is a trusted proxy"""
+    address = scope["client"][0] if scope.get("client") else "unknown"
+    if not is_trusted_proxy(address):
+        return address
+    forwarded = Headers(scope=scope).get("x-forwarded-for", "")
+    # Walk from the nearest hop; everything left of the first untrusted one could be forged
+    for hop in reversed([hop.strip() for hop in forwarded.split(",") if hop.strip()]):
+        if not is_trusted_proxy(hop):
+            return hop
+        address = hop
+    return address
+
+def rate_class_for(path: str) -> str:
+    for pattern, name in RATE_CLASS_ROUTES:
+        if pattern.match(path):
+            return name
+    return "default"
+
+def load_shed_level() -> int:
+    """0 when healthy, 1 past a threshold (shed low), 2 past twice a threshold (shed normal too)"""
+    pressure = max(
+        event_loop_lag.get() / LOAD_SHED_LOOP_LAG_SECONDS,
+        mongo_command_metrics.recent_latency() / LOAD_SHED_DB_SECONDS
+    )
+    return 2 if pressure >= 2 else 1 if pressure >= 1 else 0
+
+class AdmissionMiddleware:
+    """Per-user token buckets, concurrency caps and load shedding, before any handler work."""
+    
+    SHED_PRIORITIES = {1: ("low",), 2: ("low", "normal")}
+    
+    def __init__(self, app):
+        self.app = app
+        # (caller, class) -> [tokens, last refill]; least recently used first
+        self.buckets: "OrderedDict[tuple, list]" = OrderedDict()
+        self.active: Dict[tuple, int] = {}
+        # session token -> (user_id, resolved at); least recently used first
+        self.token_users: "OrderedDict[str, tuple]" = OrderedDict()
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        
+        class_name = rate_class_for(scope["path"])
+        rate_class = RATE_CLASSES[class_name]
+        
+        shed_level = load_shed_level()
+        if scope["method"] == "GET" and rate_class["priority"] in self.SHED_PRIORITIES.get(shed_level, ()):
+            admission_rejections.inc(class_name, "shed")
+            await self.reject(scope, send, 503, "Server busy, try again shortly", 5)
+            return
+        
+        address = f"ip:{client_address(scope)}"
+        token = session_token_from(scope)
+        user_id = self.cached_user(token) if token else None
+        retry_after = 0
+        if token and user_id is None:
+            # Refused without a lookup if the token would fall back to an exhausted address
+            retry_after = self.take_token((address, class_name), rate_class, spend=False)
+            if not retry_after:
+                user_id = await self.resolve_user(token)
+        
+        key = (f"user:{user_id}" if user_id else address, class_name)
+        if not retry_after:
+            retry_after = self.take_token(key, rate_class)
+        if retry_after:
+            admission_rejections.inc(class_name, "rate")
+            await self.reject(scope, send, 429, "Rate limit exceeded", retry_after)
+            return
+        
+        cap = rate_class["concurrency"]
+        if cap is not None and self.active.get(key, 0) >= cap:
+            admission_rejections.inc(class_name, "concurrency")
+            await self.reject(scope, send, 429, "Too many concurrent requests", 1)
+            return
+        
+        self.active[key] = self.active.get(key, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.active[key] -= 1
+            if not self.active[key]:
+                del self.active[key]
+    
+    def cached_user(self, token: str) -> Optional[str]:
+        entry = self.token_users.get(token)
+        if entry is None or time.monotonic() - entry[1] > RATE_LIMIT_AUTH_CACHE_SECONDS:
+            return None
+        self.token_users.move_to_end(token)
+        return entry[0]
+    
+    async def resolve_user(self, token: str) -> Optional[str]:
+        """user_id for a valid session token, remembered for RATE_LIMIT_AUTH_CACHE_SECONDS"""
+        try:
+            user = await authenticate_token(token)
+        except HTTPException:
+            return None
+        self.token_users[token] = (user.user_id, time.monotonic())
+        self.token_users.move_to_end(token)
+        while len(self.token_users) > RATE_LIMIT_MAX_KEYS:
+            self.token_users.popitem(last=False)
+        return user.user_id
+    
+    def take_token(self, key: tuple, rate_class: RateClass, spend: bool = True) -> int:
+        """Spend one token (or only check for one); returns 0 when admitted, else whole seconds until one is available"""
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [rate_class["burst"], now]
+            # Evicted buckets were idle longest, and an idle bucket is full anyway
+            while len(self.buckets) > RATE_LIMIT_MAX_KEYS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket[0] = min(rate_class["burst"], bucket[0] + (now - bucket[1]) * rate_class["rate"])
+            bucket[1] = now
+        if bucket[0] >= 1:
+            if spend:
+                bucket[0] -= 1
+            return 0
+        return max(1, math.ceil((1 - bucket[0]) / rate_class["rate"]))
+    
+    @staticmethod
+    async def reject(scope, send, status: int, detail: str, retry_after: int):
+        response = ORJSONResponse({"detail": detail}, status_code=status, headers={"Retry-After": str(retry_after)})
+        await response(scope, None, send)
+
 # ==================== INCLUDE ROUTER ====================
 
 app.include_router(api_router)
 
+# Inside CORS so browsers can read 429/503 refusals and their Retry-After
+app.add_middleware(AdmissionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+    allow_origins=CORS_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Request-ID"],
 )
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RequestTimingMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+async def ensure_indexes():
+    await db.content.create_index("content_id")
+    await db.student_progress.create_index([("user_id", 1), ("content_id", 1)])
+    await db.student_progress.create_index([("user_id", 1), ("last_seen", -1), ("content_id", -1)])
+    await db.student_progress.create_index([("user_id", 1), ("topic", 1), ("difficulty", 1)])
+    await db.student_progress.create_index("content_id")
+    await db.student_summary.create_index("user_id", unique=True)
+    await db.users.create_index("email")
+    await db.users.create_index("email", collation=EMAIL_COLLATION, name="email_ci")
+    await db.users.create_index("user_id")
+    await db.user_sessions.create_index("session_token")
+    await db.class_memberships.create_index([("class_id", 1), ("user_id", 1)], unique=True)
+    await db.class_memberships.create_index([("user_id", 1), ("class_id", 1)])
+    await db.quiz_sessions.create_index([("user_id", 1), ("started_at", -1)])
+    await db.quiz_answers.create_index("session_id")
+    await db.rollup_student_topic_daily.create_index([("user_id", 1), ("topic", 1), ("day", 1)], unique=True)
+    await db.rollup_class_topic_daily.create_index([("class_id", 1), ("topic", 1), ("day", 1)], unique=True)
+    await db.ws_tickets.create_index("ticket", unique=True)
+    await db.ws_tickets.create_index("expires_at", expireAfterSeconds=0)
+    await db.rewards.create_index("user_id")
+    await db.rewards.create_index([("xp", -1), ("user_id", 1)])
+    await db.rewards.create_index([("grade", 1), ("xp", -1), ("user_id", 1)])
+    await db.xp_weekly.create_index([("user_id", 1), ("week", 1)], unique=True)
+    await db.xp_weekly.create_index([("week", 1), ("xp", -1), ("user_id", 1)])
+    await db.xp_weekly.create_index([("week", 1), ("grade", 1), ("xp", -1), ("user_id", 1)])
+    # Classes still holding embedded student_ids would read as empty; /readyz waits for this
+    migrated = await migrate_class_memberships()
+    if migrated:
+        logger.info(f"Migrated {migrated} classes to class_memberships")
+    # Progress rows from before denormalization have no topic and would drop out of topic stats
+    backfilled = await migrate_progress_content_fields()
+    if backfilled:
+        logger.info(f"Copied attributes of {backfilled} content items onto student_progress")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    # Index creation runs behind /readyz instead of holding up startup
+    app.state.database_ready = False
+    app.state.prepare_database_task = asyncio.create_task(prepare_database())
+    app.state.loop_lag_task = asyncio.create_task(monitor_event_loop_lag())
 
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
+    close_mongo_client()
+
+# Import-time budget: how long `import server` took, checked on every start
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+metrics.gauge("app_import_seconds", "Time taken to import the application module", function=lambda: IMPORT_SECONDS)
+if IMPORT_SECONDS > IMPORT_BUDGET_SECONDS:
+    logger.warning(
+        f"Importing server took {IMPORT_SECONDS * 1000:.0f}ms, over the {IMPORT_BUDGET_SECONDS * 1000:.0f}ms budget; "
+        f"run `python maintenance.py import-report` for a breakdown"
+    )
+else:
+    logger.info(f"Imported server in {IMPORT_SECONDS * 1000:.0f}ms")
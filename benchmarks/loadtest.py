@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+"""Load test for the QuizVoice API against a local mongod.
+
+Seeds a dedicated database with synthetic data generated from
+seed_content.csv (content variants, students, teachers, classes and quiz
+history), then runs concurrent virtual users through a weighted mix of
+student quiz flows, dashboards, content browsing and teacher analytics.
+Latency percentiles and RPS are reported per endpoint.
+
+By default the app runs in-process, with the TTS/STT clients replaced by
+stubs that sleep for --voice-latency. Auth needs no external call because
+sessions are seeded directly. With --base-url the same traffic is sent to
+a running server; voice flows are left out of the mix in that mode. The
+target server must use the same database (--db) so the seeded tokens work.
+
+Run from the repo root with the backend's environment available:
+
+    python benchmarks/loadtest.py --students 2000 --duration 60
+    python benchmarks/loadtest.py --save-baseline benchmarks/loadtest_baseline.json
+    python benchmarks/loadtest.py --baseline benchmarks/loadtest_baseline.json
+
+Comparing against a baseline exits non-zero if any endpoint's p95 latency
+or error rate regressed beyond --tolerance.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+
+SCENARIO_WEIGHTS = {
+    "student_quiz": 40,
+    "student_dashboard": 25,
+    "content_browse": 10,
+    "teacher_analytics": 20,
+    "quiz_bundle": 5,
+}
+VOICE_SCENARIOS = {"quiz_bundle"}
+SEARCH_TERMS = ["fraction", "planet", "capital", "river", "animal", "add", "sun", "history"]
+
+
+class StubTextToSpeech:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def generate_speech(self, text, **kwargs):
+        await asyncio.sleep(self.latency)
+        # Roughly the size of a 64kbps mp3 at speaking pace
+        return b"\xff\xf3" * (len(text) * 40)
+
+
+class StubSpeechToText:
+    def __init__(self, latency):
+        self.latency = latency
+
+    async def transcribe(self, **kwargs):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(text="three quarters")
+
+
+def seed_rows():
+    with open(ROOT / "seed_content.csv", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def content_docs(server, variants):
+    """Seed rows as the upload endpoint would store them, repeated with numbered variants"""
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        server.content_doc_from_row({
+            **row,
+            "id": f"{row['id']}-{n:04d}",
+            "question_text": row["question_text"] if n == 0 else f"{row['question_text']} (variant {n})",
+            "source": "loadtest",
+        }, now)
+        for n in range(variants)
+        for row in seed_rows()
+    ]
+
+
+async def seed(server, args, rng):
+    """Drop and repopulate the load-test database; returns the personas to drive"""
+    db = server.db
+    for name in await db.list_collection_names():
+        await db.drop_collection(name)
+    await server.ensure_indexes()
+
+    now = datetime.now(timezone.utc)
+    content = content_docs(server, args.content_variants)
+    await db.content.insert_many([dict(doc) for doc in content])
+    by_grade = {}
+    for doc in content:
+        by_grade.setdefault(doc["grade"], []).append(doc)
+    grades = sorted(by_grade)
+
+    students, teachers, sessions = [], [], []
+    for i in range(args.students):
+        grade = grades[i % len(grades)]
+        students.append({"user_id": f"user_s{i:06d}", "grade": grade})
+    for i in range(args.teachers):
+        teachers.append({"user_id": f"user_t{i:04d}", "classes": []})
+
+    users = [
+        {"user_id": s["user_id"], "email": f"{s['user_id']}@loadtest.example", "name": f"Student {i}",
+         "role": "student", "grade": s["grade"], "created_at": now.isoformat()}
+        for i, s in enumerate(students)
+    ] + [
+        {"user_id": t["user_id"], "email": f"{t['user_id']}@loadtest.example", "name": f"Teacher {i}",
+         "role": "teacher", "created_at": now.isoformat()}
+        for i, t in enumerate(teachers)
+    ]
+    await db.users.insert_many(users)
+    await db.user_sessions.insert_many([
+        {"user_id": u["user_id"], "session_token": f"loadtest_{u['user_id']}",
+         "expires_at": (now + timedelta(days=1)).isoformat(), "created_at": now.isoformat()}
+        for u in users
+    ])
+    await db.streaks.insert_many([
+        {"user_id": s["user_id"], "current_streak": 0, "longest_streak": 0, "last_quiz_date": None}
+        for s in students
+    ])
+    await db.rewards.insert_many([
+        {"user_id": s["user_id"], "xp": 0, "level": 1, "badges": []} for s in students
+    ])
+
+    # Classes of --class-size students, dealt round-robin to teachers
+    classes, memberships = [], []
+    for start in range(0, len(students), args.class_size):
+        teacher = teachers[len(classes) % len(teachers)]
+        class_id = f"class_{len(classes):06d}"
+        members = students[start:start + args.class_size]
+        classes.append({"class_id": class_id, "teacher_id": teacher["user_id"], "class_name": class_id,
+                        "class_code": f"{len(classes):06X}", "student_count": len(members),
+                        "created_at": now.isoformat()})
+        memberships += [{"class_id": class_id, "user_id": s["user_id"], "joined_at": now.isoformat()}
+                        for s in members]
+        teacher["classes"].append({"class_id": class_id, "student_ids": [s["user_id"] for s in members]})
+    await db.classes.insert_many(classes)
+    await db.class_memberships.insert_many(memberships)
+
+    # Quiz history: sessions, answers and progress over the last few weeks
+    answers, progress = [], {}
+    for student in students:
+        pool = by_grade[student["grade"]]
+        for _ in range(args.history_quizzes):
+            started = now - timedelta(days=rng.randint(0, 27), minutes=rng.randint(0, 1440))
+            items = rng.sample(pool, min(5, len(pool)))
+            session_id = f"quiz_{len(sessions):012d}"
+            score = 0
+            for offset, doc in enumerate(items):
+                correct = rng.random() < 0.7
+                score += correct
+                at = started + timedelta(seconds=20 * offset)
+                answers.append({"answer_id": f"answer_{len(answers):012d}", "session_id": session_id,
+                                "user_id": student["user_id"], "content_id": doc["content_id"],
+                                "user_answer": doc["answer_text"] if correct else "not sure",
+                                "correct": correct, "confidence": 1.0 if correct else 0.0,
+                                "timestamp": at.isoformat()})
+                entry = progress.setdefault((student["user_id"], doc["content_id"]), {
+                    "progress_id": f"progress_{len(progress):012d}", "user_id": student["user_id"],
+                    "content_id": doc["content_id"], **server.progress_content_fields(doc),
+                    "attempts": 0, "correct_count": 0,
+                })
+                entry["attempts"] += 1
+                entry["correct_count"] += correct
+                entry["confidence_score"] = entry["correct_count"] / entry["attempts"]
+                entry["last_seen"] = at.isoformat()
+                entry["next_review"] = (at + timedelta(days=1 if correct else 0.5)).isoformat()
+            sessions.append({"session_id": session_id, "user_id": student["user_id"],
+                             "started_at": started.isoformat(), "completed_at": started.isoformat(),
+                             "score": score, "total_questions": len(items),
+                             "content_ids": [doc["content_id"] for doc in items]})
+    for collection, docs in (("quiz_sessions", sessions), ("quiz_answers", answers),
+                             ("student_progress", list(progress.values()))):
+        for start in range(0, len(docs), 5000):
+            await db[collection].insert_many(docs[start:start + 5000])
+
+    await server.rebuild_all_student_summaries()
+    await server.backfill_rollups()
+    return {"students": students, "teachers": teachers, "content": {doc["content_id"]: doc for doc in content},
+            "grades": grades}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.errors = {}
+        self.recording = False
+
+    async def call(self, client, label, method, url, token, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"}
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, headers=headers, **kwargs)
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            response, failed = None, True
+        elapsed = time.perf_counter() - start
+        if self.recording:
+            self.samples.setdefault(label, []).append(elapsed)
+            if failed:
+                self.errors[label] = self.errors.get(label, 0) + 1
+        return response if not failed else None
+
+
+async def student_quiz(client, rec, world, rng, bundle=False):
+    student = rng.choice(world["students"])
+    token = f"loadtest_{student['user_id']}"
+    response = await rec.call(client, "POST /api/quiz/start", "POST", "/api/quiz/start", token,
+                              params={"grade": student["grade"], "question_count": 5})
+    if response is None:
+        return
+    quiz = response.json()
+    session_id = quiz["session_id"]
+    if bundle:
+        await rec.call(client, "GET /api/quiz/{session_id}/bundle", "GET", f"/api/quiz/{session_id}/bundle",
+                       token)
+    for question in quiz["questions"]:
+        answer = world["content"].get(question["content_id"], {}).get("answer_text", "")
+        await rec.call(client, "POST /api/quiz/answer", "POST", "/api/quiz/answer", token,
+                       params={"session_id": session_id, "content_id": question["content_id"],
+                               "user_answer": answer if rng.random() < 0.7 else "not sure"})
+    await rec.call(client, "POST /api/quiz/complete", "POST", "/api/quiz/complete", token,
+                   params={"session_id": session_id})
+
+
+async def student_dashboard(client, rec, world, rng):
+    token = f"loadtest_{rng.choice(world['students'])['user_id']}"
+    await rec.call(client, "GET /api/student/dashboard", "GET", "/api/student/dashboard", token)
+    await rec.call(client, "GET /api/student/review-bank", "GET", "/api/student/review-bank", token)
+
+
+async def content_browse(client, rec, world, rng):
+    token = f"loadtest_{rng.choice(world['students'])['user_id']}"
+    await rec.call(client, "GET /api/content/list", "GET", "/api/content/list", token,
+                   params={"grade": rng.choice(world["grades"])})
+    await rec.call(client, "GET /api/content/search", "GET", "/api/content/search", token,
+                   params={"q": rng.choice(SEARCH_TERMS)})
+
+
+async def teacher_analytics(client, rec, world, rng):
+    teacher = rng.choice([t for t in world["teachers"] if t["classes"]])
+    token = f"loadtest_{teacher['user_id']}"
+    cls = rng.choice(teacher["classes"])
+    class_id = cls["class_id"]
+    await rec.call(client, "GET /api/teacher/analytics/{class_id}", "GET",
+                   f"/api/teacher/analytics/{class_id}", token)
+    await rec.call(client, "GET /api/teacher/analytics/{class_id}/trends", "GET",
+                   f"/api/teacher/analytics/{class_id}/trends", token)
+    if cls["student_ids"]:
+        student_id = rng.choice(cls["student_ids"])
+        await rec.call(client, "GET /api/teacher/student/{student_id}/progress", "GET",
+                       f"/api/teacher/student/{student_id}/progress", token)
+
+
+SCENARIOS = {
+    "student_quiz": student_quiz,
+    "student_dashboard": student_dashboard,
+    "content_browse": content_browse,
+    "teacher_analytics": teacher_analytics,
+    "quiz_bundle": lambda client, rec, world, rng: student_quiz(client, rec, world, rng, bundle=True),
+}
+
+
+async def virtual_user(client, rec, world, rng, weights, deadline):
+    names, values = list(weights), list(weights.values())
+    while time.perf_counter() < deadline:
+        scenario = rng.choices(names, weights=values)[0]
+        await SCENARIOS[scenario](client, rec, world, rng)
+
+
+def percentile(sorted_samples, fraction):
+    index = min(len(sorted_samples) - 1, max(0, int(round(fraction * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def summarize(rec, duration):
+    report = {}
+    for label in sorted(rec.samples):
+        samples = sorted(rec.samples[label])
+        report[label] = {
+            "requests": len(samples),
+            "errors": rec.errors.get(label, 0),
+            "rps": round(len(samples) / duration, 2),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+            "p90_ms": round(percentile(samples, 0.90) * 1000, 2),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 2),
+            "max_ms": round(samples[-1] * 1000, 2),
+        }
+    return report
+
+
+def print_report(report, duration):
+    print(f"{'endpoint':<48}{'reqs':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for label, row in report.items():
+        print(f"{label:<48}{row['requests']:>8}{row['errors']:>6}{row['rps']:>9.1f}{row['p50_ms']:>9.1f}"
+              f"{row['p90_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}{row['max_ms']:>9.1f}")
+    total = sum(row["requests"] for row in report.values())
+    print(f"\n{total} requests in {duration:.1f}s ({total / duration:.1f} rps); latencies in ms")
+
+
+def compare(report, baseline, tolerance):
+    """Regressions as strings: p95 beyond tolerance, or a higher error rate"""
+    regressions = []
+    for label, base in baseline["endpoints"].items():
+        row = report.get(label)
+        if row is None:
+            continue
+        if row["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {base['p95_ms']}ms -> {row['p95_ms']}ms")
+        base_rate = base["errors"] / max(base["requests"], 1)
+        rate = row["errors"] / max(row["requests"], 1)
+        if rate > base_rate + 0.01:
+            regressions.append(f"{label}: error rate {base_rate:.1%} -> {rate:.1%}")
+    return regressions
+
+
+async def run(args):
+    os.environ["MONGO_URL"] = args.mongo_url
+    os.environ["DB_NAME"] = args.db
+    import server
+
+    # Virtual users share a few teacher accounts, so per-user limits would
+    # measure the limiter rather than the endpoints
+    server.RATE_LIMIT_ENABLED = args.rate_limits
+    server.tts = StubTextToSpeech(args.voice_latency)
+    server.stt = StubSpeechToText(args.voice_latency)
+    rng = random.Random(args.seed)
+
+    if not args.skip_seed:
+        started = time.perf_counter()
+        world = await seed(server, args, rng)
+        print(f"Seeded {args.db} in {time.perf_counter() - started:.1f}s")
+    else:
+        world = await load_world(server)
+
+    weights = dict(SCENARIO_WEIGHTS)
+    if args.base_url:
+        for scenario in VOICE_SCENARIOS:
+            weights.pop(scenario)
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=30)
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://loadtest",
+                                   timeout=30)
+
+    rec = Recorder()
+    async with client:
+        deadline = time.perf_counter() + args.warmup + args.duration
+        users = [
+            asyncio.create_task(virtual_user(client, rec, world, random.Random(args.seed + i), weights, deadline))
+            for i in range(args.concurrency)
+        ]
+        await asyncio.sleep(args.warmup)
+        rec.recording = True
+        measured_from = time.perf_counter()
+        await asyncio.gather(*users)
+        duration = time.perf_counter() - measured_from
+    server.close_mongo_client()
+    return summarize(rec, duration), duration
+
+
+async def load_world(server):
+    """Rebuild the personas from an already seeded database (--skip-seed)"""
+    db = server.db
+    students = await db.users.find({"role": "student"}, {"_id": 0, "user_id": 1, "grade": 1}).to_list(None)
+    teachers = await db.users.find({"role": "teacher"}, {"_id": 0, "user_id": 1}).to_list(None)
+    for teacher in teachers:
+        teacher["classes"] = []
+        async for cls in db.classes.find({"teacher_id": teacher["user_id"]}, {"_id": 0, "class_id": 1}):
+            cls["student_ids"] = await server.class_member_ids(cls["class_id"])
+            teacher["classes"].append(cls)
+    content = {doc["content_id"]: doc async for doc in db.content.find({}, {"_id": 0})}
+    return {"students": students, "teachers": teachers, "content": content,
+            "grades": sorted({doc["grade"] for doc in content.values()})}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="QuizVoice API load test")
+    parser.add_argument("--mongo-url", default=os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db", default="quizvoice_loadtest", help="Database to seed; it is dropped first")
+    parser.add_argument("--base-url", help="Send traffic to a running server instead of in-process")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--teachers", type=int, default=20)
+    parser.add_argument("--class-size", type=int, default=30)
+    parser.add_argument("--content-variants", type=int, default=50,
+                        help="Copies of each seed_content.csv row")
+    parser.add_argument("--history-quizzes", type=int, default=10, help="Past quizzes per student")
+    parser.add_argument("--concurrency", type=int, default=50, help="Virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="Unmeasured seconds before measuring")
+    parser.add_argument("--voice-latency", type=float, default=0.2, help="Stub TTS/STT delay in seconds")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="Keep per-user rate limits on for in-process runs")
+    parser.add_argument("--skip-seed", action="store_true", help="Reuse the data from a previous run")
+    parser.add_argument("--save-baseline", type=Path, help="Write the results as a baseline file")
+    parser.add_argument("--baseline", type=Path, help="Compare against a baseline file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth over the baseline")
+    args = parser.parse_args()
+
+    report, duration = asyncio.run(run(args))
+    print_report(report, duration)
+
+    if args.save_baseline:
+        config = {key: value for key, value in vars(args).items()
+                  if key not in ("save_baseline", "baseline", "mongo_url", "skip_seed")}
+        args.save_baseline.write_text(json.dumps({"config": config, "endpoints": report}, indent=2) + "\n")
+        print(f"Baseline written to {args.save_baseline}")
+    if args.baseline:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
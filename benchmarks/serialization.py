@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""Before/after serialization benchmark for the hot endpoints.
+
+"before" is FastAPI's default path for a raw Mongo dict: jsonable_encoder
+followed by json.dumps (what JSONResponse does). "after" is the typed path:
+validating into the lean response model, dumping it in JSON mode and
+encoding with orjson (what response_model + ORJSONResponse do).
+
+Run from the repo root with the backend's environment available:
+
+    python benchmarks/serialization.py
+"""
+import csv
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+import server  # noqa: E402
+
+
+def content_docs(count):
+    with open(ROOT / "seed_content.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    now = datetime.now(timezone.utc).isoformat()
+    return [
+        server.content_doc_from_row({**rows[i % len(rows)], "id": f"{rows[i % len(rows)]['id']}-{i}"}, now)
+        for i in range(count)
+    ]
+
+
+def payloads():
+    now = datetime.now(timezone.utc).isoformat()
+    session = {
+        "session_id": "quiz_0123456789ab", "user_id": "user_0123456789ab", "started_at": now,
+        "completed_at": now, "score": 4, "total_questions": 5, "content_ids": ["c1", "c2", "c3", "c4", "c5"],
+    }
+    topics = sorted({doc["topic"] for doc in content_docs(50)})
+    return {
+        "/quiz/start": (
+            server.QuizStartResponse,
+            {"session_id": "quiz_0123456789ab", "questions": content_docs(10)},
+        ),
+        "/quiz/answer": (
+            server.AnswerResult,
+            {"correct": True, "confidence": 0.95, "correct_answer": "Three quarters",
+             "explanation": content_docs(1)[0]["explanation"]},
+        ),
+        "/student/dashboard": (
+            server.DashboardResponse,
+            {
+                "streak": {"user_id": "user_0123456789ab", "current_streak": 3, "longest_streak": 9,
+                           "last_quiz_date": now},
+                "rewards": {"user_id": "user_0123456789ab", "xp": 420, "level": 5, "badges": []},
+                "progress": {"total_items": 310, "mastered": 122, "due_for_review": 14},
+                "recent_quizzes": [session] * 5,
+            },
+        ),
+        "/content/list": (List[server.ContentItem], content_docs(1000)),
+        "/teacher/analytics": (
+            server.ClassAnalyticsResponse,
+            {
+                "class": {"class_id": "class_01234567", "teacher_id": "user_t", "class_name": "Year 5 Oak",
+                          "class_code": "A1B2C3", "student_count": 30, "created_at": now},
+                "students": [
+                    {"user_id": f"user_{i:012d}", "name": f"Student {i}", "email": f"s{i}@school.example",
+                     "total_items": 120, "mastered": 48, "avg_confidence": 0.61}
+                    for i in range(30)
+                ],
+                "topic_performance": [
+                    {"topic": topic, "accuracy": 0.72, "total_attempts": 830} for topic in topics
+                ],
+            },
+        ),
+    }
+
+
+def before(payload):
+    return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def after(adapter, payload):
+    return orjson.dumps(adapter.dump_python(adapter.validate_python(payload), mode="json", by_alias=True))
+
+
+def main():
+    print(f"{'endpoint':<22}{'before µs':>12}{'after µs':>12}{'speedup':>10}{'bytes':>16}")
+    for endpoint, (model, payload) in payloads().items():
+        adapter = TypeAdapter(model)
+        runs = 20 if endpoint == "/content/list" else 2000
+        before_us = min(timeit.repeat(lambda: before(payload), number=runs, repeat=5)) / runs * 1e6
+        after_us = min(timeit.repeat(lambda: after(adapter, payload), number=runs, repeat=5)) / runs * 1e6
+        size = f"{len(before(payload))}->{len(after(adapter, payload))}"
+        print(f"{endpoint:<22}{before_us:>12.1f}{after_us:>12.1f}{before_us / after_us:>9.1f}x{size:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""pytest-benchmark suite for the pure logic on the answer, quiz, review and analytics paths.
+
+Run from the repo root with the backend's environment available:
+
+    python -m pytest benchmarks/test_hot_paths.py --benchmark-sort=name
+    python -m pytest benchmarks/test_hot_paths.py --benchmark-autosave
+    python -m pytest benchmarks/test_hot_paths.py --benchmark-compare
+
+Sizes cover what the app sees in practice and the large end of it: long
+spoken answers, classes from 30 to 3000 students, and CSV uploads up to
+100k rows.
+"""
+import csv
+import io
+import os
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+import server  # noqa: E402
+
+NOW = datetime(2025, 3, 14, 9, 30, tzinfo=timezone.utc)
+
+
+def seed_rows():
+    with open(ROOT / "seed_content.csv", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def content_docs(count):
+    rows = seed_rows()
+    return [
+        server.content_doc_from_row({**rows[i % len(rows)], "id": f"{rows[i % len(rows)]['id']}-{i}"}, NOW.isoformat())
+        for i in range(count)
+    ]
+
+
+def content_csv(count):
+    rows = seed_rows()
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    for i in range(count):
+        writer.writerow({**rows[i % len(rows)], "id": f"{rows[i % len(rows)]['id']}-{i}"})
+    return out.getvalue()
+
+
+# ---------- answer matching ----------
+
+MATCH_DOC = {
+    "answer_text": "Three quarters",
+    "alternate_answers": ["3/4", "0.75", "three fourths"] + [f"alternate {i}" for i in range(17)],
+}
+
+
+@pytest.mark.parametrize("user_answer", [
+    "three quarters",
+    "three fourths",
+    "i think it is three quarters of the whole thing",
+    "um " * 150 + "no idea",
+], ids=["exact", "alternate", "fuzzy", "long-miss"])
+def test_match_answer(benchmark, user_answer):
+    benchmark(server.match_answer, MATCH_DOC, user_answer)
+
+
+# ---------- spaced repetition and rewards ----------
+
+def test_review_interval_days(benchmark):
+    cases = [(correct, confidence) for correct in (True, False) for confidence in (None, 0.5, 0.75, 0.95)]
+
+    def run():
+        for correct, confidence in cases:
+            server.review_interval_days(correct, confidence)
+
+    benchmark(run)
+
+
+@pytest.mark.parametrize("last_quiz_date", [
+    None,
+    (NOW - timedelta(days=1)).isoformat(),
+    NOW - timedelta(days=5),
+], ids=["first", "iso-string", "datetime"])
+def test_advance_streak(benchmark, last_quiz_date):
+    streak_doc = {"current_streak": 12, "longest_streak": 30, "last_quiz_date": last_quiz_date}
+    benchmark(server.advance_streak, streak_doc, NOW)
+
+
+@pytest.mark.parametrize("xp,level", [(450, 4), (50_000, 1)], ids=["one-level", "catch-up"])
+def test_level_for_xp(benchmark, xp, level):
+    benchmark(server.level_for_xp, xp, level)
+
+
+# ---------- merges ----------
+
+@pytest.mark.parametrize("page_size", [50, 200])
+def test_merge_review_items(benchmark, page_size):
+    docs = content_docs(page_size)
+    progress = [
+        {"content_id": doc["content_id"], "attempts": 3, "confidence_score": 0.33,
+         "last_seen": (NOW - timedelta(minutes=i)).isoformat()}
+        for i, doc in enumerate(docs)
+    ]
+    random.Random(1).shuffle(docs)
+    benchmark(server.merge_review_items, progress, docs)
+
+
+@pytest.mark.parametrize("class_size", [30, 300, 3000])
+def test_merge_student_stats(benchmark, class_size):
+    students = [
+        {"user_id": f"user_{i:012d}", "name": f"Student {i}", "email": f"s{i}@school.example"}
+        for i in range(class_size)
+    ]
+    # A tenth of the class has not answered anything yet
+    groups = [
+        {"_id": s["user_id"], "total_items": 120, "mastered": 40, "avg_confidence": 0.6123}
+        for s in students[class_size // 10:]
+    ]
+    benchmark(server.merge_student_stats, students, groups)
+
+
+@pytest.mark.parametrize("classes,class_size", [(5, 30), (40, 30), (10, 300)])
+def test_merge_class_analytics(benchmark, classes, class_size):
+    rng = random.Random(2)
+    results = []
+    for c in range(classes):
+        results.append({
+            "class": {"class_id": f"class_{c}", "class_name": f"Class {c}"},
+            "students": [
+                # Consecutive classes share a few students
+                {"user_id": f"user_{c * class_size + i - (c and 3)}", "name": "", "email": "",
+                 "total_items": 50, "mastered": rng.randint(0, 5), "avg_confidence": round(rng.random(), 2)}
+                for i in range(class_size)
+            ],
+        })
+    topic_stats = [{"_id": f"Topic {t}", "total": 900, "correct": 610} for t in range(12)]
+    benchmark(server.merge_class_analytics, results, topic_stats)
+
+
+# ---------- content upload ----------
+
+def test_content_doc_from_row(benchmark):
+    row = seed_rows()[0]
+    benchmark(server.content_doc_from_row, row, NOW.isoformat())
+
+
+@pytest.mark.parametrize("rows", [1_000, 100_000])
+def test_parse_content_csv(benchmark, rows):
+    text = content_csv(rows)
+    if rows >= 100_000:
+        benchmark.pedantic(server.parse_content_csv, args=(text, NOW.isoformat()), rounds=3, iterations=1)
+    else:
+        benchmark(server.parse_content_csv, text, NOW.isoformat())
+
+
+# ---------- leaderboards ----------
+
+def leaderboard_board(size):
+    rng = random.Random(4)
+    rows = [{"user_id": f"user_{i:012d}", "xp": rng.randint(0, 5000) * 10} for i in range(size)]
+    rows.sort(key=lambda row: (-row["xp"], row["user_id"]))
+    return server.RankedBoard(rows)
+
+
+@pytest.mark.parametrize("size", [30, 10_000, 200_000])
+def test_leaderboard_award_and_rank(benchmark, size):
+    board = leaderboard_board(size)
+    user_ids = list(board.xp)
+    rng = random.Random(5)
+
+    def run():
+        user_id = rng.choice(user_ids)
+        board.set(user_id, board.xp[user_id] + 30)
+        board.rank(user_id)
+        board.top(10)
+
+    benchmark(run)
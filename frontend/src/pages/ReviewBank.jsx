@@ -12,7 +12,9 @@ const API = `${process.env.REACT_APP_BACKEND_URL}/api`;
 export default function ReviewBank() {
   const navigate = useNavigate();
   const [items, setItems] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   
   useEffect(() => {
     loadReviewBank();
@@ -23,7 +25,8 @@ export default function ReviewBank() {
       const response = await axios.get(`${API}/student/review-bank`, {
         withCredentials: true
       });
-      setItems(response.data);
+      setItems(response.data.items);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       console.error('Load review bank error:', error);
       toast.error('Failed to load review bank');
@@ -32,6 +35,23 @@ export default function ReviewBank() {
     }
   };
   
+  const loadMore = async () => {
+    setLoadingMore(true);
+    try {
+      const response = await axios.get(`${API}/student/review-bank`, {
+        params: { cursor: nextCursor },
+        withCredentials: true
+      });
+      setItems((prev) => [...prev, ...response.data.items]);
+      setNextCursor(response.data.next_cursor);
+    } catch (error) {
+      console.error('Load more review items error:', error);
+      toast.error('Failed to load more items');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+  
   const speakText = (text) => {
     if (window.speechSynthesis.speaking) {
       window.speechSynthesis.cancel();
@@ -148,6 +168,17 @@ export default function ReviewBank() {
                 </Card>
               );
             })}
+            {nextCursor && (
+              <Button
+                variant="outline"
+                onClick={loadMore}
+                disabled={loadingMore}
+                className="w-full"
+                data-testid="load-more-review-btn"
+              >
+                {loadingMore ? 'Loading...' : 'Load More'}
+              </Button>
+            )}
           </div>
         )}
       </div>
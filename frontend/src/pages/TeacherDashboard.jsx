@@ -212,7 +212,7 @@ export default function TeacherDashboard() {
                   </div>
                   <div className="flex justify-between">
                     <span>Students:</span>
-                    <span className="font-semibold">{cls.student_ids?.length || 0}</span>
+                    <span className="font-semibold">{cls.student_count || 0}</span>
                   </div>
                   <div className="flex justify-between">
                     <span>Created:</span>
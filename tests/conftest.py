@@ -0,0 +1,67 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "backend"))
+# The Mongo clients are opened lazily, so importing the app needs these set but no server
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "test")
+
+import server  # noqa: E402
+
+
+@pytest.fixture
+def database(monkeypatch):
+    """An in-memory Mongo behind every database handle, with fresh process-wide caches"""
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    import mongomock.aggregate
+
+    # mongomock only knows the older $substr spelling
+    handle = mongomock.aggregate._Parser._handle_string_operator
+
+    def handle_string_operator(parser, operator, values):
+        return handle(parser, "$substr" if operator == "$substrBytes" else operator, values)
+
+    monkeypatch.setattr(mongomock.aggregate._Parser, "_handle_string_operator", handle_string_operator)
+
+    db = mongomock_motor.AsyncMongoMockClient()["test"]
+    for name in ("db", "analytics_db", "export_db"):
+        monkeypatch.setattr(server, name, db)
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", False)
+    monkeypatch.setattr(server, "content_catalog", server.ContentCatalog(server.CONTENT_CATALOG_SIZE))
+    monkeypatch.setattr(server, "content_search", server.ContentSearchIndex())
+    monkeypatch.setattr(server, "analytics_cache", server.ResponseCache(max_entries=64, stale_seconds=0))
+    monkeypatch.setattr(server, "leaderboards", server.LeaderboardStore(max_boards=64, refresh_seconds=300))
+    monkeypatch.setattr(server, "class_events", server.ClassEventHub(server.LIVE_QUEUE_SIZE))
+    return db
+
+
+@pytest.fixture
+def seed_user(database):
+    """Insert a user with a live session; returns the Authorization headers for it"""
+    async def seed(user_id, role="student", grade="Year5", email=None):
+        now = datetime.now(timezone.utc)
+        await database.users.insert_one({
+            "user_id": user_id, "email": email or f"{user_id}@example.com", "name": user_id,
+            "role": role, "grade": grade, "created_at": now.isoformat(),
+        })
+        await database.user_sessions.insert_one({
+            "user_id": user_id, "session_token": f"token_{user_id}",
+            "expires_at": (now + timedelta(days=1)).isoformat(),
+        })
+        if role == "student":
+            await database.streaks.insert_one({"user_id": user_id, "current_streak": 0, "longest_streak": 0, "last_quiz_date": None})
+            await database.rewards.insert_one({"user_id": user_id, "xp": 0, "level": 1, "badges": []})
+        return {"Authorization": f"Bearer token_{user_id}"}
+    return seed
+
+
+@pytest.fixture
+def api(database):
+    """Factory for an HTTP client bound to the app; use inside the test's event loop"""
+    return lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://testserver")
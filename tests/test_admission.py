@@ -0,0 +1,113 @@
+import asyncio
+import ipaddress
+
+
+import server
+
+
+def scope(path="/", headers=(), client=("10.0.0.5", 1234), method="GET"):
+    return {
+        "type": "http", "method": method, "path": path, "client": client,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+
+
+RATE = {"rate": 1, "burst": 3, "concurrency": None, "priority": "normal"}
+
+
+def test_token_bucket_allows_burst_then_reports_wait(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(server.time, "monotonic", lambda: clock[0])
+    admission = server.AdmissionMiddleware(app=None)
+    key = ("user:a", "default")
+    assert [admission.take_token(key, RATE) for _ in range(3)] == [0, 0, 0]
+    assert admission.take_token(key, RATE) == 1
+    clock[0] += 1.0
+    assert admission.take_token(key, RATE) == 0
+    clock[0] += 60
+    assert [admission.take_token(key, RATE) for _ in range(4)] == [0, 0, 0, 1]
+
+
+def test_check_without_spending(monkeypatch):
+    monkeypatch.setattr(server.time, "monotonic", lambda: 100.0)
+    admission = server.AdmissionMiddleware(app=None)
+    key = ("ip:10.0.0.5", "default")
+    assert [admission.take_token(key, RATE, spend=False) for _ in range(5)] == [0] * 5
+    for _ in range(3):
+        admission.take_token(key, RATE)
+    assert admission.take_token(key, RATE, spend=False) == 1
+
+
+def test_buckets_are_bounded(monkeypatch):
+    monkeypatch.setattr(server, "RATE_LIMIT_MAX_KEYS", 2)
+    admission = server.AdmissionMiddleware(app=None)
+    for user in "abc":
+        admission.take_token((f"user:{user}", "default"), RATE)
+    assert list(admission.buckets) == [("user:b", "default"), ("user:c", "default")]
+
+
+def test_rate_class_for():
+    assert server.rate_class_for("/api/voice/tts") == "voice"
+    assert server.rate_class_for("/api/teacher/analytics/c1") == "analytics"
+    assert server.rate_class_for("/api/leaderboard/school") == "browse"
+    assert server.rate_class_for("/api/quiz/start") == "quiz"
+    assert server.rate_class_for("/api/something/else") == "default"
+
+
+def test_session_token_from_cookie_or_bearer():
+    assert server.session_token_from(scope(headers=[("Cookie", "a=1; session_token=abc")])) == "abc"
+    assert server.session_token_from(scope(headers=[("Authorization", "Bearer xyz")])) == "xyz"
+    assert server.session_token_from(scope(headers=[("Authorization", "Basic xyz")])) is None
+
+
+def test_forwarded_for_ignored_from_untrusted_peer(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [])
+    request = scope(headers=[("X-Forwarded-For", "1.2.3.4")], client=("203.0.113.9", 1))
+    assert server.client_address(request) == "203.0.113.9"
+
+
+def test_forwarded_for_takes_first_untrusted_hop(monkeypatch):
+    monkeypatch.setattr(server, "TRUSTED_PROXIES", [ipaddress.ip_network("10.0.0.0/8")])
+    request = scope(headers=[("X-Forwarded-For", "6.6.6.6, 198.51.100.7, 10.1.1.1")], client=("10.0.0.2", 1))
+    # 6.6.6.6 was supplied by the client and cannot be trusted
+    assert server.client_address(request) == "198.51.100.7"
+    request = scope(headers=[], client=("10.0.0.2", 1))
+    assert server.client_address(request) == "10.0.0.2"
+    assert server.client_address({"type": "http", "headers": []}) == "unknown"
+
+
+def test_admission_keys_on_validated_user_not_token(monkeypatch):
+    async def authenticate_token(token):
+        if token != "good":
+            raise server.HTTPException(status_code=401, detail="Invalid session")
+        return server.User(user_id="u1", email="u1@example.com", name="u1", role="student")
+
+    async def ok(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    monkeypatch.setattr(server, "authenticate_token", authenticate_token)
+    monkeypatch.setattr(server, "load_shed_level", lambda: 0)
+    monkeypatch.setattr(server, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setitem(server.RATE_CLASSES, "default", {**RATE, "rate": 0.001})
+    admission = server.AdmissionMiddleware(ok)
+
+    def status(token):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        request = scope("/api/other", headers=[("Authorization", f"Bearer {token}")])
+        asyncio.run(admission(request, None, send))
+        return messages[0]["status"]
+
+    # A valid user has their own bucket, and the address is only checked for the first lookup
+    assert status("good") == 200
+    # Made-up tokens all draw on the address's bucket
+    assert [status(f"forged{i}") for i in range(4)] == [200, 200, 200, 429]
+    # The resolved user is unaffected by the drained address
+    assert [status("good") for _ in range(3)] == [200, 200, 429]
+    assert set(admission.buckets) == {("user:u1", "default"), ("ip:10.0.0.5", "default")}
+    # An unresolved token is not looked up while its address is out of budget
+    assert status("other-user") == 429
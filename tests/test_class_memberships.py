@@ -0,0 +1,80 @@
+import asyncio
+
+import server
+
+
+def test_migration_moves_embedded_student_ids(database):
+    async def scenario():
+        await database.classes.insert_many([
+            {"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_ids": ["s1", "s2", "s1"]},
+            {"class_id": "k2", "teacher_id": "t1", "class_name": "K2", "student_ids": ["s2"]},
+            {"class_id": "k3", "teacher_id": "t1", "class_name": "K3", "student_count": 0},
+        ])
+        # Half-migrated before: s2 already has a membership in k2
+        await database.class_memberships.insert_one({"class_id": "k2", "user_id": "s2", "joined_at": "2025-01-01"})
+        migrated = await server.migrate_class_memberships()
+        again = await server.migrate_class_memberships()
+        classes = {c["class_id"]: c async for c in database.classes.find({}, {"_id": 0})}
+        return migrated, again, classes, await server.class_member_ids("k1"), await server.student_class_ids("s2")
+
+    migrated, again, classes, k1_members, s2_classes = asyncio.run(scenario())
+    assert (migrated, again) == (2, 0)
+    assert "student_ids" not in classes["k1"] and "student_ids" not in classes["k2"]
+    assert classes["k1"]["student_count"] == 2 and classes["k2"]["student_count"] == 1
+    assert sorted(k1_members) == ["s1", "s2"]
+    assert sorted(s2_classes) == ["k1", "k2"]
+
+
+def test_ensure_indexes_migrates(database):
+    async def scenario():
+        await database.classes.insert_one({"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_ids": ["s1"]})
+        await server.ensure_indexes()
+        return await server.class_member_ids("k1")
+
+    assert asyncio.run(scenario()) == ["s1"]
+
+
+def test_add_and_remove_keep_count_and_version(database):
+    async def scenario():
+        await database.classes.insert_one({"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_count": 0})
+        added = [await server.add_class_members("k1", ["s1", "s2"]), await server.add_class_members("k1", ["s2", "s3"])]
+        removed = [await server.remove_class_member("k1", "s1"), await server.remove_class_member("k1", "s1")]
+        class_doc = await database.classes.find_one({"class_id": "k1"})
+        return added, removed, class_doc["student_count"], await server.get_data_versions(["class:k1"])
+
+    added, removed, count, version = asyncio.run(scenario())
+    assert added == [2, 1] and removed == [True, False]
+    assert count == 2
+    assert version == (3,)
+
+
+def test_analytics_join_members_server_side(database):
+    async def scenario():
+        await database.classes.insert_one({"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_count": 0})
+        await server.add_class_members("k1", ["s1", "s2"])
+        await database.users.insert_many([
+            {"user_id": user_id, "email": f"{user_id}@example.com", "name": user_id, "role": "student"}
+            for user_id in ("s1", "s2", "s3")
+        ])
+        pipeline = server.class_members_lookup("k1", "users") + [{"$project": {"_id": 0, "user_id": 1}}]
+        return sorted(doc["user_id"] for doc in await database.class_memberships.aggregate(pipeline).to_list(None))
+
+    assert asyncio.run(scenario()) == ["s1", "s2"]
+
+
+def test_roster_pages_in_user_id_order(database, seed_user, api):
+    async def scenario():
+        headers = await seed_user("t1", role="teacher")
+        await database.classes.insert_one({"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_count": 0})
+        await server.add_class_members("k1", [f"s{i}" for i in range(5)])
+        pages, cursor = [], None
+        async with api() as client:
+            while True:
+                params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+                page = (await client.get("/api/teacher/class/k1/students", params=params, headers=headers)).json()
+                pages.append([item["user_id"] for item in page["items"]])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    return pages
+
+    assert asyncio.run(scenario()) == [["s0", "s1"], ["s2", "s3"], ["s4"]]
@@ -0,0 +1,73 @@
+import asyncio
+import gzip
+
+import brotli
+import pytest
+
+import server
+
+
+def scope(path="/", headers=(), client=("10.0.0.5", 1234), method="GET"):
+    return {
+        "type": "http", "method": method, "path": path, "client": client,
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+    }
+
+
+def test_choose_encoding():
+    assert server.choose_encoding("gzip, deflate, br") == "br"
+    assert server.choose_encoding("gzip, br;q=0") == "gzip"
+    assert server.choose_encoding("identity") is None
+    assert server.choose_encoding("") is None
+
+
+def app_sending(body, content_type="application/json", more_body=False):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", content_type.encode()), (b"content-length", str(len(body)).encode())
+        ]})
+        await send({"type": "http.response.body", "body": body, "more_body": more_body})
+    return app
+
+
+def call(middleware, request_scope):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(middleware(request_scope, receive, send))
+    start, body = messages
+    return {k.decode(): v.decode() for k, v in start["headers"]}, body["body"]
+
+
+@pytest.mark.parametrize("encoding,decompress", [("br", brotli.decompress), ("gzip", gzip.decompress)])
+def test_large_json_is_compressed(encoding, decompress):
+    payload = b'{"items": [' + b'"x",' * 1000 + b'"x"]}'
+    middleware = server.CompressionMiddleware(app_sending(payload), minimum_size=1024)
+    headers, body = call(middleware, scope(headers=[("Accept-Encoding", encoding)]))
+    assert headers["content-encoding"] == encoding
+    assert headers["content-length"] == str(len(body))
+    assert headers["vary"] == "Accept-Encoding"
+    assert decompress(body) == payload
+
+
+@pytest.mark.parametrize("app", [
+    app_sending(b"{}"),
+    app_sending(b"\x89PNG" * 1000, content_type="image/png"),
+    app_sending(b"a,b\n" * 1000, content_type="text/csv", more_body=True),
+], ids=["small", "binary", "streaming"])
+def test_uncompressible_bodies_pass_through(app):
+    middleware = server.CompressionMiddleware(app, minimum_size=1024)
+    headers, body = call(middleware, scope(headers=[("Accept-Encoding", "br")]))
+    assert "content-encoding" not in headers
+
+
+def test_no_accept_encoding_passes_through():
+    payload = b"x" * 5000
+    middleware = server.CompressionMiddleware(app_sending(payload), minimum_size=1024)
+    headers, body = call(middleware, scope())
+    assert body == payload and "content-encoding" not in headers
@@ -0,0 +1,108 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from fastapi import Response
+from starlette.requests import Request
+
+import server
+# ---------- ETags ----------
+
+def request_with(if_none_match=None):
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_not_modified_tags_response():
+    response = Response()
+    assert server.not_modified(request_with(), response, "analytics.c1", (3, 7)) is None
+    assert response.headers["etag"] == 'W/"analytics.c1.3.7"'
+    assert response.headers["cache-control"] == "private, no-cache"
+
+
+def test_not_modified_answers_304_for_matching_tag():
+    for header in ('W/"analytics.c1.3.7"', '"analytics.c1.3.7"', '"other", W/"analytics.c1.3.7"'):
+        result = server.not_modified(request_with(header), Response(), "analytics.c1", (3, 7))
+        assert result is not None and result.status_code == 304
+        assert result.headers["etag"] == 'W/"analytics.c1.3.7"'
+
+
+def test_not_modified_ignores_other_versions():
+    response = Response()
+    assert server.not_modified(request_with('W/"analytics.c1.3.6"'), response, "analytics.c1", (3, 7)) is None
+    assert "etag" in response.headers
+
+
+def test_drop_etag():
+    response = Response()
+    server.not_modified(request_with(), response, "analytics.c1", (1,))
+    server.drop_etag(response)
+    assert "etag" not in response.headers
+    server.drop_etag(response)
+
+
+# ---------- routes ----------
+
+def test_content_list_revalidates_until_an_upload(database, seed_user, api):
+    async def scenario():
+        headers = await seed_user("s1")
+        await database.content.insert_one({"content_id": "c1", "grade": "Year5", "term": "T1", "topic": "Fractions",
+                                           "difficulty": "easy", "question_text": "q", "answer_text": "a"})
+        async with api() as client:
+            first = await client.get("/api/content/list", headers=headers)
+            etag = first.headers["etag"]
+            repeat = await client.get("/api/content/list", headers={**headers, "If-None-Match": etag})
+            await server.bump_data_versions(["content"])
+            after = await client.get("/api/content/list", headers={**headers, "If-None-Match": etag})
+        return first, repeat, after, etag
+
+    first, repeat, after, etag = asyncio.run(scenario())
+    assert first.status_code == 200
+    assert repeat.status_code == 304 and repeat.content == b""
+    assert after.status_code == 200 and after.headers.get("etag") != etag
+
+
+def test_rollup_backfill_moves_trend_etags(database, seed_user, api):
+    yesterday = datetime.now(timezone.utc) - timedelta(days=1)
+
+    async def scenario():
+        headers = await seed_user("t1", role="teacher")
+        await seed_user("s1")
+        await database.classes.insert_one({"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_count": 0})
+        await server.add_class_members("k1", ["s1"])
+        await database.content.insert_one({"content_id": "c1", "topic": "Fractions"})
+        await database.quiz_sessions.insert_one({"session_id": "q1", "user_id": "s1"})
+        await database.quiz_answers.insert_one({
+            "session_id": "q1", "content_id": "c1", "correct": True, "timestamp": yesterday.isoformat(),
+        })
+        async with api() as client:
+            urls = ["/api/teacher/analytics/k1/trends", "/api/teacher/student/s1/trends"]
+            before = [await client.get(url, headers=headers) for url in urls]
+            await server.backfill_rollups()
+            after = [
+                await client.get(url, headers={**headers, "If-None-Match": response.headers["etag"]})
+                for url, response in zip(urls, before)
+            ]
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    day = yesterday.date().isoformat()
+    for old, new in zip(before, after):
+        assert all(d["attempts"] == 0 for d in old.json()["days"] if d["day"] == day)
+        assert new.status_code == 200
+        assert [d["attempts"] for d in new.json()["days"] if d["day"] == day] == [1]
+
+
+def test_grade_change_moves_student_progress_etag(database, seed_user, api):
+    async def scenario():
+        teacher = await seed_user("t1", role="teacher")
+        student = await seed_user("s1")
+        async with api() as client:
+            first = await client.get("/api/teacher/student/s1/progress", headers=teacher)
+            await client.post("/api/auth/update-role", params={"role": "student", "grade": "Year6"}, headers=student)
+            return await client.get(
+                "/api/teacher/student/s1/progress", headers={**teacher, "If-None-Match": first.headers["etag"]}
+            )
+
+    after = asyncio.run(scenario())
+    assert after.status_code == 200
+    assert after.json()["student"]["grade"] == "Year6"
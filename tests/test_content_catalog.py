@@ -0,0 +1,177 @@
+import asyncio
+
+import pytest
+
+import server
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for d in self.docs:
+            yield dict(d)
+
+
+class FakeContent:
+    def __init__(self, docs):
+        self.docs = docs
+        self.finds = 0
+
+    async def count_documents(self, query):
+        return len(self.docs)
+
+    def find(self, query, projection=None):
+        self.finds += 1
+        wanted = query.get("content_id", {}).get("$in")
+        return FakeCursor([d for d in self.docs if wanted is None or d["content_id"] in wanted])
+
+
+def content(content_id, grade="Year5", topic="Fractions", difficulty="easy"):
+    return {
+        "content_id": content_id, "grade": grade, "term": "T1", "topic": topic,
+        "difficulty": difficulty, "question_text": f"question {content_id}", "answer_text": "a",
+        "tags": ["x"], "alternate_answers": [],
+    }
+
+
+@pytest.fixture
+def bank(monkeypatch):
+    collection = FakeContent([content("c1"), content("c2", topic="Decimals"), content("c3", grade="Year6")])
+    versions = {"content": 1}
+
+    async def get_data_versions(keys):
+        return tuple(versions.get(key, 0) for key in keys)
+
+    monkeypatch.setattr(server, "db", type("FakeDB", (), {"content": collection})())
+    monkeypatch.setattr(server, "get_data_versions", get_data_versions)
+    monkeypatch.setattr(server, "CONTENT_CATALOG_REFRESH_SECONDS", 0)
+    return collection, versions
+
+
+def test_complete_catalog_answers_filtered_listings(bank):
+    catalog = server.ContentCatalog(max_records=10)
+    results = asyncio.run(catalog.find({"grade": "Year5"}))
+    assert catalog.complete
+    assert sorted(d["content_id"] for d in results) == ["c1", "c2"]
+    results = asyncio.run(catalog.find({"grade": "Year5", "topic": "Decimals"}))
+    assert [d["content_id"] for d in results] == ["c2"]
+    results = asyncio.run(catalog.find({}, exclude_ids={"c1"}, limit=1))
+    assert len(results) == 1 and results[0]["content_id"] != "c1"
+
+
+def test_get_many_keeps_requested_order_and_skips_unknown_ids(bank):
+    catalog = server.ContentCatalog(max_records=10)
+    docs = asyncio.run(catalog.get_many(["c3", "missing", "c1"]))
+    assert [d["content_id"] for d in docs] == ["c3", "c1"]
+    assert docs[0]["tags"] == ["x"]
+
+
+def test_partial_catalog_falls_back_and_caches_lookups(bank):
+    collection, _ = bank
+    catalog = server.ContentCatalog(max_records=2)
+    assert asyncio.run(catalog.find({"grade": "Year5"})) is None
+    assert not catalog.complete
+    asyncio.run(catalog.get("c1"))
+    finds = collection.finds
+    assert asyncio.run(catalog.get("c1"))["content_id"] == "c1"
+    assert collection.finds == finds
+    asyncio.run(catalog.get_many(["c2", "c3"]))
+    # LRU bound: c1 was least recently used
+    assert list(catalog.records) == ["c2", "c3"]
+
+
+def test_version_change_reloads_in_the_background(bank):
+    collection, versions = bank
+
+    async def scenario():
+        catalog = server.ContentCatalog(max_records=10)
+        await catalog.ensure_fresh()
+        collection.docs.append(content("c4"))
+        await catalog.ensure_fresh()
+        unchanged = "c4" in catalog.records
+        versions["content"] = 2
+        await catalog.ensure_fresh()
+        # The old records keep serving until the one reload finishes
+        during = ("c4" in catalog.records, catalog.version, catalog.loading is not None)
+        await catalog.ensure_fresh()
+        reload = catalog.loading
+        await reload
+        return unchanged, during, reload, catalog
+
+    unchanged, during, reload, catalog = asyncio.run(scenario())
+    assert not unchanged
+    assert during == (False, 1, True)
+    assert catalog.version == 2 and "c4" in catalog.records and catalog.loading is None
+
+
+def test_first_load_is_shared_and_awaited(bank):
+    collection, _ = bank
+
+    async def scenario():
+        catalog = server.ContentCatalog(max_records=10)
+        await asyncio.gather(*(catalog.get("c1") for _ in range(3)))
+        return collection.finds
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_version_is_rechecked_only_after_refresh_interval(bank, monkeypatch):
+    _, versions = bank
+    monkeypatch.setattr(server, "CONTENT_CATALOG_REFRESH_SECONDS", 3600)
+
+    async def scenario():
+        catalog = server.ContentCatalog(max_records=10)
+        await catalog.ensure_fresh()
+        versions["content"] = 2
+        await catalog.ensure_fresh()
+        return catalog
+
+    catalog = asyncio.run(scenario())
+    assert catalog.version == 1 and catalog.loading is None
+
+
+def test_apply_upload_patches_only_the_next_version(bank):
+    _, versions = bank
+
+    async def scenario():
+        catalog = server.ContentCatalog(max_records=10)
+        await catalog.ensure_fresh()
+        versions["content"] = 2
+        await catalog.apply_upload([content("c1", topic="Decimals")])
+        patched = (catalog.version, sorted(catalog.by_filters[("Year5", "T1", "Decimals", "easy")]), dict(catalog.by_filters))
+        # Another writer's upload in between: leave it to ensure_fresh to reload
+        versions["content"] = 4
+        await catalog.apply_upload([content("c9")])
+        return patched, catalog
+
+    (version, decimals, by_filters), catalog = asyncio.run(scenario())
+    assert version == 2 and decimals == ["c1", "c2"]
+    assert ("Year5", "T1", "Fractions", "easy") not in by_filters
+    assert catalog.version == 2 and "c9" not in catalog.records
+
+
+def test_partial_catalog_uploads_stay_within_bounds(bank):
+    _, versions = bank
+
+    async def scenario():
+        catalog = server.ContentCatalog(max_records=2)
+        await catalog.get("c1")
+        versions["content"] = 2
+        await catalog.apply_upload([content("c1", topic="Decimals")] + [content(f"new{i}") for i in range(50)])
+        held = (list(catalog.records), catalog.records["c1"].topic)
+        await catalog.get_many(["c2", "c3"])
+        return held, catalog
+
+    (held, topic), catalog = asyncio.run(scenario())
+    # Cached ids are refreshed in place; uploads of anything else are left to the next miss
+    assert held == ["c1"] and topic == "Decimals"
+    assert list(catalog.records) == ["c2", "c3"]
+    assert catalog.by_filters == {}
@@ -0,0 +1,131 @@
+import asyncio
+
+import server
+
+
+def doc(content_id, question, answer="", subtopic="", tags=()):
+    return {
+        "content_id": content_id,
+        "question_text": question,
+        "answer_text": answer,
+        "subtopic": subtopic,
+        "tags": list(tags),
+    }
+
+
+def build(*docs):
+    index = server.ContentSearchIndex()
+    for d in docs:
+        index.add(d)
+    return index
+
+
+def ids(results):
+    return [content_id for _, content_id in results]
+
+
+def test_search_tokens():
+    assert server.search_tokens("What is 3/4 of Twelve?") == ["what", "is", "3", "4", "of", "twelve"]
+
+
+def test_field_weights_rank_tags_above_question_text():
+    index = build(
+        doc("q", "a question about fractions"),
+        doc("s", "a question", subtopic="fractions"),
+        doc("t", "a question", tags=["fractions"]),
+    )
+    assert ids(index.search("fractions", None)) == ["t", "s", "q"]
+
+
+def test_rarer_terms_score_higher():
+    index = build(
+        doc("a", "common rare"),
+        doc("b", "common"),
+        doc("c", "common"),
+    )
+    results = dict((content_id, score) for score, content_id in index.search("rare", None))
+    common = dict((content_id, score) for score, content_id in index.search("common", None))
+    assert results["a"] > common["a"]
+
+
+def test_every_token_must_match():
+    index = build(doc("a", "adding fractions"), doc("b", "adding decimals"))
+    assert ids(index.search("adding fractions", None)) == ["a"]
+
+
+def test_only_the_last_token_matches_as_a_prefix():
+    index = build(doc("a", "multiplication tables"), doc("b", "multiply tables"))
+    assert set(ids(index.search("tables multipl", None))) == {"a", "b"}
+    assert ids(index.search("multipl tables", None)) == []
+
+
+def test_exact_match_outranks_prefix_match():
+    index = build(doc("exact", "sum"), doc("prefix", "summary"))
+    assert ids(index.search("sum", None)) == ["exact", "prefix"]
+
+
+def test_stopwords_dropped_unless_query_is_only_stopwords():
+    index = build(doc("a", "what is the area"), doc("b", "what is the perimeter"))
+    assert ids(index.search("what is the area", None)) == ["a"]
+    assert set(ids(index.search("what the", None))) == {"a", "b"}
+
+
+def test_tag_filter_alone_and_with_query():
+    index = build(
+        doc("a", "halves", tags=["Fractions"]),
+        doc("b", "halves"),
+        doc("c", "quarters", tags=["fractions"]),
+    )
+    assert set(ids(index.search("", "fractions"))) == {"a", "c"}
+    assert ids(index.search("halves", " FRACTIONS ")) == ["a"]
+
+
+def test_empty_query_without_tag_matches_nothing():
+    assert build(doc("a", "halves")).search("", None) == []
+
+
+def test_re_adding_a_document_replaces_its_terms():
+    index = build(doc("a", "halves", tags=["fractions"]))
+    index.add(doc("a", "decimals"))
+    assert index.search("halves", None) == []
+    assert index.search("", "fractions") == []
+    assert ids(index.search("decimals", None)) == ["a"]
+
+
+def test_remove_drops_postings_and_prefix_terms():
+    index = build(doc("a", "triangle"), doc("b", "square"))
+    assert ids(index.search("tri", None)) == ["a"]
+    index.remove("a")
+    assert "triangle" not in index.postings
+    assert index.search("tri", None) == []
+    assert index.doc_terms.keys() == {"b"}
+
+
+def test_search_route_ranks_filters_and_follows_uploads(database, seed_user, api, monkeypatch):
+    monkeypatch.setattr(server, "CONTENT_CATALOG_REFRESH_SECONDS", 0)
+
+    async def scenario():
+        headers = await seed_user("s1")
+        await database.content.insert_many([
+            {"content_id": "a", "grade": "Year5", "topic": "Fractions", "question_text": "halves", "tags": ["fractions"]},
+            {"content_id": "b", "grade": "Year6", "topic": "Fractions", "question_text": "halves and fractions"},
+            {"content_id": "c", "grade": "Year5", "topic": "Shapes", "question_text": "hexagon"},
+        ])
+        async with api() as client:
+            ranked = (await client.get("/api/content/search", params={"q": "fractions"}, headers=headers)).json()
+            filtered = (await client.get("/api/content/search", params={"q": "halves", "grade": "Year6"}, headers=headers)).json()
+            empty = await client.get("/api/content/search", params={"q": " "}, headers=headers)
+            # Another worker's upload: only the shared content version tells this index
+            await database.content.insert_one({"content_id": "d", "grade": "Year5", "question_text": "heptagon"})
+            await server.bump_data_versions(["content"])
+            await server.content_catalog.ensure_fresh()
+            await server.content_catalog.loading
+            after = (await client.get("/api/content/search", params={"q": "hep"}, headers=headers)).json()
+        return ranked, filtered, empty.status_code, after
+
+    ranked, filtered, status, after = asyncio.run(scenario())
+    assert [doc["content_id"] for doc in ranked] == ["a", "b"]
+    assert ranked[0]["score"] > ranked[1]["score"] and ranked[0]["grade"] == "Year5"
+    assert [doc["content_id"] for doc in filtered] == ["b"]
+    assert status == 400
+    assert [doc["content_id"] for doc in after] == ["d"]
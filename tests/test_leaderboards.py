@@ -0,0 +1,175 @@
+import asyncio
+import time
+
+import server
+
+
+def rows(**xp):
+    return [{"user_id": user_id, "xp": value} for user_id, value in sorted(xp.items(), key=lambda item: (-item[1], item[0]))]
+
+
+def loader(result, started=None, release=None):
+    async def load():
+        if started is not None:
+            started.append(1)
+        if release is not None:
+            await release.wait()
+        return rows(**result)
+    return load
+
+
+# ---------- RankedBoard ----------
+
+def test_ties_share_a_rank():
+    board = server.RankedBoard(rows(a=30, b=50, c=30, d=10))
+    assert [board.rank(u) for u in "abcd"] == [2, 1, 2, 4]
+    assert board.top(10) == [(1, "b", 50), (2, "a", 30), (2, "c", 30), (4, "d", 10)]
+    assert board.top(2) == [(1, "b", 50), (2, "a", 30)]
+    assert board.rank("missing") is None
+
+
+def test_set_moves_and_ignores_lower_totals():
+    board = server.RankedBoard(rows(a=30, b=50))
+    board.set("a", 60)
+    board.set("b", 40)
+    board.set("c", 5)
+    assert board.top(3) == [(1, "a", 60), (2, "b", 50), (3, "c", 5)]
+    assert len(board) == 3
+
+
+def test_remove():
+    board = server.RankedBoard(rows(a=30, b=50, c=30))
+    board.remove("b")
+    board.remove("missing")
+    assert board.top(5) == [(1, "a", 30), (1, "c", 30)]
+    assert board.rank("b") is None
+
+
+# ---------- LeaderboardStore ----------
+
+def test_concurrent_first_reads_share_one_load():
+    async def scenario():
+        store = server.LeaderboardStore(max_boards=10, refresh_seconds=300)
+        started = []
+        load = loader({"a": 10}, started)
+        boards = await asyncio.gather(*(store.get(("school", "", "all"), load) for _ in range(3)))
+        return boards, started
+
+    boards, started = asyncio.run(scenario())
+    assert len(started) == 1
+    assert boards[0] is boards[1] is boards[2]
+
+
+def test_xp_recorded_during_a_load_is_applied():
+    async def scenario():
+        store = server.LeaderboardStore(max_boards=10, refresh_seconds=300)
+        release = asyncio.Event()
+        key = ("class", "c1", "all")
+        task = asyncio.create_task(store.get(key, loader({"a": 10, "b": 20}, release=release)))
+        await asyncio.sleep(0)
+        store.record_xp("a", None, ["c1"], "all", 25)
+        release.set()
+        return await task
+
+    board = asyncio.run(scenario())
+    assert board.top(2) == [(1, "a", 25), (2, "b", 20)]
+
+
+def test_expired_board_is_served_while_one_reload_runs():
+    async def scenario():
+        store = server.LeaderboardStore(max_boards=10, refresh_seconds=60)
+        key = ("school", "", "all")
+        old = await store.get(key, loader({"a": 10}))
+        old.loaded_at = time.monotonic() - 120
+        release = asyncio.Event()
+        started = []
+        slow = loader({"a": 10, "b": 5}, started, release)
+        served = [await store.get(key, slow) for _ in range(3)]
+        await asyncio.sleep(0)
+        reloading = key in store.loading
+        release.set()
+        await asyncio.sleep(0.01)
+        return old, served, started, reloading, store.boards[key]
+
+    old, served, started, reloading, current = asyncio.run(scenario())
+    assert all(board is old for board in served)
+    assert reloading and len(started) == 1
+    assert current is not old and current.rank("b") == 2
+
+
+def test_discard_disowns_a_running_load():
+    async def scenario():
+        store = server.LeaderboardStore(max_boards=10, refresh_seconds=300)
+        release = asyncio.Event()
+        key = ("class", "c1", "all")
+        task = asyncio.create_task(store.get(key, loader({"a": 10}, release=release)))
+        await asyncio.sleep(0)
+        store.discard_class("c1")
+        release.set()
+        await task
+        return store
+
+    store = asyncio.run(scenario())
+    assert store.boards == {} and store.loading == {} and store.pending == {}
+
+
+def test_boards_are_evicted_least_recently_used():
+    async def scenario():
+        store = server.LeaderboardStore(max_boards=2, refresh_seconds=300)
+        for class_id in ("c1", "c2", "c1", "c3"):
+            await store.get(("class", class_id, "all"), loader({"a": 1}))
+        return list(store.boards)
+
+    assert asyncio.run(scenario()) == [("class", "c1", "all"), ("class", "c3", "all")]
+
+
+def test_change_grade_moves_student_between_boards():
+    async def scenario():
+        store = server.LeaderboardStore(max_boards=10, refresh_seconds=300)
+        await store.get(("school", "", "all"), loader({"a": 30, "b": 20, "c": 10}))
+        await store.get(("grade", "Year5", "all"), loader({"a": 30, "b": 20}))
+        await store.get(("grade", "Year6", "all"), loader({"c": 10}))
+        await store.get(("grade", "Year6", "2025-03-10"), loader({"c": 4}))
+        store.change_grade("b", "Year5", "Year6")
+        return store
+
+    store = asyncio.run(scenario())
+    assert store.boards[("grade", "Year5", "all")].top(5) == [(1, "a", 30)]
+    assert store.boards[("grade", "Year6", "all")].top(5) == [(1, "b", 20), (2, "c", 10)]
+    # No school board loaded for that week to copy from, so it is reloaded next time
+    assert ("grade", "Year6", "2025-03-10") not in store.boards
+
+
+# ---------- Routes ----------
+
+def board_names(seed_user, api, database, viewer, path):
+    async def scenario():
+        headers = {}
+        for user_id, role in (("s1", "student"), ("s2", "student"), ("s3", "student"), ("t1", "teacher"), ("t2", "teacher")):
+            headers[user_id] = await seed_user(user_id, role=role)
+        for xp, user_id in enumerate(("s1", "s2", "s3"), start=1):
+            await database.rewards.update_one({"user_id": user_id}, {"$set": {"xp": xp * 10, "grade": "Year5"}})
+        # s1 and s2 share t1's class; s3 is in t2's class
+        await database.classes.insert_many([
+            {"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_count": 0},
+            {"class_id": "k2", "teacher_id": "t2", "class_name": "K2", "student_count": 0},
+        ])
+        await server.add_class_members("k1", ["s1", "s2"])
+        await server.add_class_members("k2", ["s3"])
+        async with api() as client:
+            response = await client.get(path, headers=headers[viewer])
+        assert response.status_code == 200
+        return {entry["user_id"]: entry["name"] for entry in response.json()["entries"]}
+    return asyncio.run(scenario())
+
+
+def test_school_board_names_only_classmates(seed_user, api, database):
+    assert board_names(seed_user, api, database, "s1", "/api/leaderboard/school") == {"s3": None, "s2": "s2", "s1": "s1"}
+
+
+def test_grade_board_names_only_the_teachers_students(seed_user, api, database):
+    assert board_names(seed_user, api, database, "t2", "/api/leaderboard/grade/Year5") == {"s3": "s3", "s2": None, "s1": None}
+
+
+def test_class_board_names_everyone(seed_user, api, database):
+    assert board_names(seed_user, api, database, "t1", "/api/leaderboard/class/k1") == {"s2": "s2", "s1": "s1"}
@@ -0,0 +1,49 @@
+import asyncio
+from types import SimpleNamespace
+
+import metrics
+import server
+
+
+def command(name, body, request_id):
+    return SimpleNamespace(command_name=name, command=body, connection_id=("db", 27017), request_id=request_id)
+
+
+def finished(name, request_id):
+    return SimpleNamespace(command_name=name, connection_id=("db", 27017), request_id=request_id, duration_micros=1500)
+
+
+def test_cursor_batches_are_labelled_with_their_collection():
+    listener = metrics.MongoCommandMetrics()
+    listener.started(command("find", {"find": "content", "filter": {}}, 1))
+    listener.succeeded(finished("find", 1))
+    listener.started(command("getMore", {"getMore": 123456789, "collection": "quiz_answers"}, 2))
+    listener.succeeded(finished("getMore", 2))
+    listener.started(command("ping", {"ping": 1}, 3))
+    listener.failed(finished("ping", 3))
+
+    series = metrics.mongo_command_seconds.values
+    assert ("content", "find", "ok") in series
+    assert ("quiz_answers", "getMore", "ok") in series
+    assert ("", "ping", "error") in series
+    assert not listener.pending
+
+
+def test_metrics_need_a_configured_token(api, monkeypatch):
+    def scrape(headers):
+        async def scenario():
+            async with api() as client:
+                return await client.get("/api/metrics", headers=headers)
+        return asyncio.run(scenario())
+
+    monkeypatch.setattr(server, "METRICS_TOKEN", None)
+    assert scrape({}).status_code == 403
+    assert scrape({"Authorization": "Bearer "}).status_code == 403
+
+    monkeypatch.setattr(server, "METRICS_TOKEN", "s3cret")
+    assert scrape({}).status_code == 401
+    assert scrape({"Authorization": "Bearer wrong"}).status_code == 401
+    assert scrape({"Authorization": "Bearer s3cr\u00e9t".encode("latin-1")}).status_code == 401
+    allowed = scrape({"Authorization": "Bearer s3cret"})
+    assert allowed.status_code == 200
+    assert "mongo_command_duration_seconds" in allowed.text
@@ -0,0 +1,36 @@
+import asyncio
+
+import server
+
+
+def test_startup_backfills_rows_written_before_denormalization(database, seed_user, api):
+    async def scenario():
+        headers = await seed_user("t1", role="teacher")
+        await seed_user("s1")
+        await database.content.insert_many([
+            {"content_id": "c1", "grade": "Year5", "term": "T1", "topic": "Fractions", "difficulty": "easy"},
+            {"content_id": "c2", "grade": "Year5", "term": "T1", "topic": "Decimals", "difficulty": "hard"},
+        ])
+        await database.student_progress.insert_many([
+            {"user_id": "s1", "content_id": "c1", "attempts": 4, "correct_count": 3, "confidence_score": 0.7},
+            {"user_id": "s1", "content_id": "c2", "attempts": 2, "correct_count": 0, "confidence_score": 0.1},
+        ])
+        await database.classes.insert_one({"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_count": 0})
+        await server.add_class_members("k1", ["s1"])
+
+        await server.ensure_indexes()
+        version = await server.get_data_versions(["content"])
+        await server.ensure_indexes()
+        async with api() as client:
+            analytics = (await client.get("/api/teacher/analytics/k1", headers=headers)).json()
+        rows = await database.student_progress.find({}, {"_id": 0, "content_id": 1, "topic": 1, "difficulty": 1}).to_list(None)
+        return rows, analytics, version, await server.get_data_versions(["content"])
+
+    rows, analytics, version, version_after_restart = asyncio.run(scenario())
+    assert sorted((r["content_id"], r["topic"], r["difficulty"]) for r in rows) == [
+        ("c1", "Fractions", "easy"), ("c2", "Decimals", "hard")
+    ]
+    topics = {t["topic"]: t["total_attempts"] for t in analytics["topic_performance"]}
+    assert topics == {"Fractions": 4, "Decimals": 2}
+    # Recorded as done: a restart doesn't rewrite progress or invalidate content caches again
+    assert version == version_after_restart == (1,)
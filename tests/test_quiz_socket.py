@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import server
+
+
+@pytest.fixture
+def quiz(database, seed_user):
+    """A student with an open two-question quiz session; returns their auth headers"""
+    async def seed():
+        headers = await seed_user("s1")
+        await seed_user("t1", role="teacher")
+        await database.content.insert_many([
+            {"content_id": f"c{i}", "grade": "Year5", "term": "T1", "topic": "Fractions", "difficulty": "easy",
+             "question_text": f"question {i}", "answer_text": "three quarters", "explanation": "because",
+             "alternate_answers": []}
+            for i in (1, 2)
+        ])
+        await database.quiz_sessions.insert_one({
+            "session_id": "q1", "user_id": "s1", "content_ids": ["c1", "c2"], "score": 0, "total_questions": 2,
+            "started_at": datetime.now(timezone.utc).isoformat(), "completed_at": None,
+        })
+        return headers
+    return asyncio.run(seed())
+
+
+def close_code(client, url, **kwargs):
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect(url, **kwargs) as socket:
+            socket.receive_json()
+    return closed.value.code
+
+
+def test_foreign_origins_are_refused_before_accept(quiz, monkeypatch):
+    monkeypatch.setattr(server, "CORS_ORIGINS", ["*"])
+    client = TestClient(server.app)
+    # "*" allows cross-site fetches without credentials; it must not open cookie-authenticated sockets
+    assert close_code(client, "/api/ws/quiz/q1", headers={**quiz, "Origin": "https://evil.example"}) == 4403
+
+    monkeypatch.setattr(server, "CORS_ORIGINS", ["https://app.example"])
+    for origin in ("https://app.example", "http://testserver"):
+        with client.websocket_connect("/api/ws/quiz/q1", headers={**quiz, "Origin": origin}) as socket:
+            assert socket.receive_json()["type"] == "session"
+
+
+def test_tickets_are_single_use_and_expire(quiz, database):
+    client = TestClient(server.app)
+    ticket = client.post("/api/ws/ticket", headers=quiz).json()["ticket"]
+    with client.websocket_connect(f"/api/ws/quiz/q1?ticket={ticket}") as socket:
+        assert socket.receive_json()["session_id"] == "q1"
+    assert close_code(client, f"/api/ws/quiz/q1?ticket={ticket}") == 4401
+
+    expired = client.post("/api/ws/ticket", headers=quiz).json()["ticket"]
+    asyncio.run(database.ws_tickets.update_one(
+        {"ticket": expired}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+    ))
+    assert close_code(client, f"/api/ws/quiz/q1?ticket={expired}") == 4401
+
+
+def test_session_tokens_in_the_url_are_not_accepted(quiz):
+    client = TestClient(server.app)
+    assert close_code(client, "/api/ws/quiz/q1?token=token_s1") == 4401
+
+
+def test_only_the_owning_student_can_join(quiz, seed_user):
+    client = TestClient(server.app)
+    assert close_code(client, "/api/ws/quiz/q1", headers={"Authorization": "Bearer token_t1"}) == 4403
+    asyncio.run(seed_user("s2"))
+    assert close_code(client, "/api/ws/quiz/q1", headers={"Authorization": "Bearer token_s2"}) == 4404
+
+
+def test_answers_resume_and_complete(quiz):
+    client = TestClient(server.app)
+    with client.websocket_connect("/api/ws/quiz/q1", headers=quiz) as socket:
+        assert socket.receive_json()["answered"] == {}
+        socket.send_json({"type": "answer", "content_id": "c1", "user_answer": "three quarters"})
+        first = socket.receive_json()
+        socket.send_json({"type": "answer", "content_id": "nope", "user_answer": "x"})
+        error = socket.receive_json()
+        socket.send_json({"type": "ping"})
+        pong = socket.receive_json()
+
+    # Reconnecting resumes: the earlier answer is reported and re-sending it returns the recorded result
+    with client.websocket_connect("/api/ws/quiz/q1", headers=quiz) as socket:
+        resumed = socket.receive_json()
+        socket.send_json({"type": "answer", "content_id": "c1", "user_answer": "wrong now"})
+        resent = socket.receive_json()
+        socket.send_json({"type": "complete"})
+        completed = socket.receive_json()
+
+    assert first["type"] == "result" and first["correct"] is True
+    assert error == {"type": "error", "status": 400, "detail": "Answer must name a question in this session"}
+    assert pong == {"type": "pong"}
+    assert resumed["answered"] == {"c1": True} and resumed["score"] == 1
+    assert resent["correct"] is True
+    assert completed["type"] == "completed" and completed["score"] == 1
+    assert close_code(client, "/api/ws/quiz/q1", headers=quiz) == 4400
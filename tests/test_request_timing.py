@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+import pytest
+
+import server
+
+
+def app_sending(content_type):
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": [(b"content-type", content_type.encode())]})
+        await send({"type": "http.response.body", "body": b"data: {}\n\n"})
+    return app
+
+
+def call(middleware):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/api/teacher/class/k1/live", "headers": []}
+    asyncio.run(middleware(scope, None, send))
+    return {k.decode(): v.decode() for k, v in messages[0]["headers"]}
+
+
+@pytest.mark.parametrize("content_type,logged", [
+    ("application/json", True),
+    ("text/event-stream; charset=utf-8", False),
+])
+def test_slow_request_log_skips_event_streams(content_type, logged, monkeypatch, caplog):
+    monkeypatch.setattr(server, "SLOW_REQUEST_SECONDS", 0)
+    with caplog.at_level(logging.WARNING, logger=server.logger.name):
+        headers = call(server.RequestTimingMiddleware(app_sending(content_type)))
+    assert any("Slow request" in record.message for record in caplog.records) is logged
+    assert headers["server-timing"].startswith("db;dur=")
+    assert len(headers["x-request-id"]) == 12
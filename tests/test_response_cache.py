@@ -0,0 +1,153 @@
+import asyncio
+
+import server
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def counter(value="v"):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return f"{value}{len(calls)}"
+
+    return compute, calls
+
+
+# ---------- ResponseCache ----------
+
+def test_miss_then_hit():
+    async def scenario():
+        cache = server.ResponseCache(max_entries=10, stale_seconds=30)
+        compute, calls = counter()
+        first = await cache.get_or_compute("ep", ("a",), (1,), compute)
+        second = await cache.get_or_compute("ep", ("a",), (1,), compute)
+        return first, second, len(calls), cache.counters["ep"]
+
+    first, second, calls, counters = run(scenario())
+    assert first == second == ((1,), "v1")
+    assert calls == 1
+    assert counters == {"hits": 1, "stale_hits": 0, "misses": 1}
+
+
+def test_concurrent_misses_share_one_computation():
+    async def scenario():
+        cache = server.ResponseCache(max_entries=10, stale_seconds=30)
+        compute, calls = counter()
+        results = await asyncio.gather(*(cache.get_or_compute("ep", ("a",), (1,), compute) for _ in range(5)))
+        return results, len(calls)
+
+    results, calls = run(scenario())
+    assert calls == 1
+    assert all(result == ((1,), "v1") for result in results)
+
+
+def test_stale_entry_served_with_its_own_version_while_refreshing():
+    async def scenario():
+        cache = server.ResponseCache(max_entries=10, stale_seconds=30)
+        compute, calls = counter()
+        await cache.get_or_compute("ep", ("a",), (1,), compute)
+        stale = await cache.get_or_compute("ep", ("a",), (2,), compute)
+        await asyncio.sleep(0.01)
+        fresh = await cache.get_or_compute("ep", ("a",), (2,), compute)
+        return stale, fresh, len(calls)
+
+    stale, fresh, calls = run(scenario())
+    assert stale == ((1,), "v1")
+    assert fresh == ((2,), "v2")
+    assert calls == 2
+
+
+def test_expired_stale_entry_is_recomputed_inline():
+    async def scenario():
+        cache = server.ResponseCache(max_entries=10, stale_seconds=0)
+        compute, _ = counter()
+        await cache.get_or_compute("ep", ("a",), (1,), compute)
+        return await cache.get_or_compute("ep", ("a",), (2,), compute)
+
+    assert run(scenario()) == ((2,), "v2")
+
+
+def test_newer_version_does_not_join_older_inflight_computation():
+    async def scenario():
+        cache = server.ResponseCache(max_entries=10, stale_seconds=30)
+        release = asyncio.Event()
+
+        async def slow_old():
+            await release.wait()
+            return "old"
+
+        async def new():
+            return "new"
+
+        old_task = asyncio.create_task(cache.get_or_compute("ep", ("a",), (1,), slow_old))
+        await asyncio.sleep(0)
+        newer = await cache.get_or_compute("ep", ("a",), (2,), new)
+        release.set()
+        older = await old_task
+        return newer, older, cache.entries[("ep", "a")][:2]
+
+    newer, older, entry = run(scenario())
+    assert newer == ((2,), "new")
+    assert older == ((1,), "old")
+    # The slower, older computation must not overwrite the newer entry
+    assert entry == ((2,), "new")
+
+
+def test_lru_eviction():
+    async def scenario():
+        cache = server.ResponseCache(max_entries=2, stale_seconds=30)
+        compute, _ = counter()
+        for scope in ("a", "b"):
+            await cache.get_or_compute("ep", (scope,), (1,), compute)
+        await cache.get_or_compute("ep", ("a",), (1,), compute)
+        await cache.get_or_compute("ep", ("c",), (1,), compute)
+        return list(cache.entries)
+
+    assert run(scenario()) == [("ep", "a"), ("ep", "c")]
+
+
+def test_stats_hit_ratio():
+    async def scenario():
+        cache = server.ResponseCache(max_entries=10, stale_seconds=30)
+        compute, _ = counter()
+        for _ in range(4):
+            await cache.get_or_compute("ep", ("a",), (1,), compute)
+        return cache.stats()
+
+    stats = run(scenario())
+    assert stats["entries"] == 1
+    assert stats["endpoints"]["ep"]["hit_ratio"] == 0.75
+
+
+
+# ---------- student progress ----------
+
+def test_student_progress_pages_and_follows_content_uploads(database, seed_user, api):
+    async def scenario():
+        headers = await seed_user("t1", role="teacher")
+        await seed_user("s1")
+        await database.student_progress.insert_many([
+            {"user_id": "s1", "content_id": f"c{i}", "topic": "Fractions", "confidence_score": 0.5}
+            for i in range(5)
+        ])
+        async with api() as client:
+            first = (await client.get("/api/teacher/student/s1/progress", params={"limit": 3}, headers=headers)).json()
+            second = (await client.get(
+                "/api/teacher/student/s1/progress", params={"limit": 3, "cursor": first["next_cursor"]}, headers=headers
+            )).json()
+            # A re-upload rewrites the denormalized topic and bumps only the "content" version
+            await database.student_progress.update_many({"content_id": "c0"}, {"$set": {"topic": "Decimals"}})
+            await server.bump_data_versions(["content"])
+            again = (await client.get("/api/teacher/student/s1/progress", params={"limit": 3}, headers=headers)).json()
+        return first, second, again
+
+    first, second, again = asyncio.run(scenario())
+    assert [p["content_id"] for p in first["progress"]] == ["c0", "c1", "c2"]
+    assert [p["content_id"] for p in second["progress"]] == ["c3", "c4"]
+    assert second["next_cursor"] is None
+    assert again["progress"][0]["topic"] == "Decimals"
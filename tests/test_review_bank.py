@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import server
+
+
+def content(content_id, topic="Fractions"):
+    return {
+        "content_id": content_id, "grade": "Year5", "term": "T1", "topic": topic, "difficulty": "easy",
+        "question_text": f"question {content_id}", "answer_text": "a", "tags": [], "alternate_answers": [],
+    }
+
+
+def progress(content_id, last_seen, confidence=0.2, topic="Fractions"):
+    return {
+        "user_id": "s1", "content_id": content_id, "topic": topic, "difficulty": "easy",
+        "attempts": 2, "correct_count": 0, "confidence_score": confidence, "last_seen": last_seen,
+    }
+
+
+def test_cursor_round_trip_keeps_separators_in_the_last_part():
+    cursor = server.encode_cursor("2025-03-14T09:30:00+00:00", "id|with|bars")
+    assert server.decode_cursor(cursor, 2) == ["2025-03-14T09:30:00+00:00", "id|with|bars"]
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", server.encode_cursor("only-one-part")])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        server.decode_cursor(cursor, 2)
+    assert error.value.status_code == 400
+
+
+def test_pages_cover_every_item_once_across_last_seen_ties(database, seed_user, api):
+    async def scenario():
+        headers = await seed_user("s1")
+        ids = [f"c{i:02d}" for i in range(7)]
+        await database.content.insert_many([content(cid) for cid in ids])
+        # Three items share a last_seen, so the cursor has to break ties on content_id
+        times = ["2025-03-14T10:00", "2025-03-14T09:00", "2025-03-14T09:00", "2025-03-14T09:00",
+                 "2025-03-14T08:00", "2025-03-14T07:00", "2025-03-14T06:00"]
+        await database.student_progress.insert_many([progress(cid, t) for cid, t in zip(ids, times)])
+        await database.student_progress.insert_one(progress("mastered", "2025-03-14T11:00", confidence=0.9))
+        pages = []
+        cursor = None
+        async with api() as client:
+            while True:
+                params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+                page = (await client.get("/api/student/review-bank", params=params, headers=headers)).json()
+                pages.append([item["content_id"] for item in page["items"]])
+                cursor = page["next_cursor"]
+                if not cursor:
+                    return pages
+
+    assert asyncio.run(scenario()) == [["c00", "c03", "c02"], ["c01", "c04", "c05"], ["c06"]]
+
+
+def test_topic_filter_and_bad_cursor(database, seed_user, api):
+    async def scenario():
+        headers = await seed_user("s1")
+        await database.content.insert_many([content("c1"), content("c2", topic="Decimals")])
+        await database.student_progress.insert_many([
+            progress("c1", "2025-03-14T10:00"), progress("c2", "2025-03-14T09:00", topic="Decimals"),
+        ])
+        async with api() as client:
+            filtered = (await client.get("/api/student/review-bank", params={"topic": "Decimals"}, headers=headers)).json()
+            bad = await client.get("/api/student/review-bank", params={"cursor": "garbage"}, headers=headers)
+        return filtered, bad.status_code
+
+    filtered, status = asyncio.run(scenario())
+    assert [item["content_id"] for item in filtered["items"]] == ["c2"]
+    assert filtered["items"][0]["attempts"] == 2
+    assert status == 400
+
@@ -0,0 +1,80 @@
+import asyncio
+
+import server
+
+
+def test_parse_roster_emails_with_and_without_header():
+    assert server.parse_roster_emails("name,Email\nAda,ada@example.com\nBo,bo@example.com\n") == [
+        "ada@example.com", "bo@example.com"
+    ]
+    assert server.parse_roster_emails("ada@example.com\nbo@example.com,extra\n") == ["ada@example.com", "bo@example.com"]
+    assert server.parse_roster_emails("") == []
+
+
+def import_roster(database, seed_user, api, send):
+    async def scenario():
+        headers = await seed_user("t1", role="teacher")
+        for user_id in ("s1", "s2", "s3"):
+            await seed_user(user_id)
+        await database.classes.insert_one({"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_count": 0})
+        async with api() as client:
+            return [await send(client, headers) for _ in range(2)]
+    return asyncio.run(scenario())
+
+
+def test_json_import_matches_emails_case_insensitively(database, seed_user, api):
+    async def send(client, headers):
+        emails = ["S1@Example.com", "s1@example.com", " s2@example.com ", "nobody@example.com", "t1@example.com"]
+        return await client.post("/api/teacher/class/k1/import-roster", json={"emails": emails}, headers=headers)
+
+    first, second = import_roster(database, seed_user, api, send)
+    assert first.json() == {"added": 2, "already_in_class": 0, "unknown_emails": ["nobody@example.com", "t1@example.com"]}
+    assert second.json()["added"] == 0 and second.json()["already_in_class"] == 2
+    assert asyncio.run(database.classes.find_one({"class_id": "k1"}))["student_count"] == 2
+
+
+def test_multipart_and_csv_bodies(database, seed_user, api):
+    async def send(client, headers):
+        multipart = await client.post(
+            "/api/teacher/class/k1/import-roster",
+            files={"file": ("roster.csv", b"\xef\xbb\xbfemail\ns1@example.com\n", "text/csv")},
+            headers=headers,
+        )
+        csv_body = await client.post(
+            "/api/teacher/class/k1/import-roster",
+            content=b"s3@example.com\n",
+            headers={**headers, "Content-Type": "text/csv"},
+        )
+        return multipart.json()["added"], csv_body.json()["added"]
+
+    first, second = import_roster(database, seed_user, api, send)
+    assert first == (1, 1) and second == (0, 0)
+
+
+def test_malformed_rosters_are_client_errors(database, seed_user, api, monkeypatch):
+    monkeypatch.setattr(server, "MAX_ROSTER_IMPORT", 2)
+
+    async def send(client, headers):
+        url = "/api/teacher/class/k1/import-roster"
+        return [
+            # A plain form field where the file should be
+            (await client.post(url, data={"file": "s1@example.com"}, files={"other": ("x", b"")}, headers=headers)).status_code,
+            (await client.post(url, files={"roster": ("r.csv", b"s1@example.com")}, headers=headers)).status_code,
+            (await client.post(url, content=b"\xff\xfe", headers={**headers, "Content-Type": "text/csv"})).status_code,
+            (await client.post(url, json={"emails": "s1@example.com"}, headers=headers)).status_code,
+            (await client.post(url, json=["a@x", "b@x", "c@x"], headers=headers)).status_code,
+        ]
+
+    statuses, _ = import_roster(database, seed_user, api, send)
+    assert statuses == [400, 400, 400, 400, 413]
+
+
+def test_only_the_owning_teacher_can_import(database, seed_user, api):
+    async def scenario():
+        await seed_user("t1", role="teacher")
+        other = await seed_user("t2", role="teacher")
+        await database.classes.insert_one({"class_id": "k1", "teacher_id": "t1", "class_name": "K1", "student_count": 0})
+        async with api() as client:
+            return (await client.post("/api/teacher/class/k1/import-roster", json=[], headers=other)).status_code
+
+    assert asyncio.run(scenario()) == 404
@@ -0,0 +1,141 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import server
+
+NOW = datetime(2025, 3, 14, 9, 30, 20, tzinfo=timezone.utc)
+
+
+def progress(user_id, content_id, next_review, confidence=0.5):
+    return {
+        "user_id": user_id, "content_id": content_id, "attempts": 1, "correct_count": 1,
+        "next_review": next_review.isoformat(), "confidence_score": confidence,
+    }
+
+
+# ---------- due buckets ----------
+
+def test_due_bucket_is_the_minute():
+    assert server.due_bucket("2025-03-14T09:30:59.123+00:00") == "2025-03-14T09:30"
+    assert server.due_bucket(None) is None
+
+
+def test_current_minute_is_not_due_yet():
+    buckets = {"2025-03-14T09:29": 2, "2025-03-14T09:30": 3, "2025-03-15T00:00": 4}
+    assert server.split_due_buckets(buckets, NOW) == (2, ["2025-03-14T09:29"])
+
+
+def test_count_due_items_adds_overdue_and_never_goes_negative():
+    assert server.count_due_items({"overdue": 5, "due_buckets": {"2025-03-14T09:00": 1}}, NOW) == 6
+    assert server.count_due_items({"overdue": 0, "due_buckets": {"2025-03-14T09:00": -1}}, NOW) == 0
+
+
+def test_fold_moves_past_buckets_into_overdue(database):
+    past = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()[:16]
+    future = (datetime.now(timezone.utc) + timedelta(days=1)).isoformat()[:16]
+    summary = {"user_id": "s1", "overdue": 1, "due_buckets": {past: 2, future: 3}}
+
+    async def scenario():
+        await database.student_summary.insert_one(dict(summary))
+        await server.fold_due_buckets("s1", summary)
+        return await database.student_summary.find_one({"user_id": "s1"}, {"_id": 0})
+
+    folded = asyncio.run(scenario())
+    assert folded["overdue"] == 3
+    assert folded["due_buckets"] == {future: 3}
+
+
+def test_fold_skips_buckets_changed_since_read(database):
+    past = (datetime.now(timezone.utc) - timedelta(hours=1)).isoformat()[:16]
+    stale = {"user_id": "s1", "overdue": 0, "due_buckets": {past: 2}}
+
+    async def scenario():
+        # An answer moved one item out of the bucket after the dashboard read it
+        await database.student_summary.insert_one({"user_id": "s1", "overdue": 0, "due_buckets": {past: 1}})
+        await server.fold_due_buckets("s1", stale)
+        return await database.student_summary.find_one({"user_id": "s1"}, {"_id": 0})
+
+    summary = asyncio.run(scenario())
+    assert summary["overdue"] == 0 and summary["due_buckets"] == {past: 1}
+
+
+# ---------- rebuild ----------
+
+def test_rebuild_counts_progress(database):
+    now = datetime.now(timezone.utc)
+
+    async def scenario():
+        await database.student_progress.insert_many([
+            progress("s1", "c1", now - timedelta(days=1), confidence=0.9),
+            progress("s1", "c2", now - timedelta(hours=2)),
+            progress("s1", "c3", now + timedelta(days=3)),
+            progress("s2", "c1", now - timedelta(days=1)),
+        ])
+        return await server.rebuild_student_summary("s1")
+
+    summary = asyncio.run(scenario())
+    assert summary["total_items"] == 3
+    assert summary["mastered"] == 1
+    assert summary["overdue"] == 2
+    assert list(summary["due_buckets"].values()) == [1]
+    assert server.count_due_items(summary) == 2
+
+
+def test_answer_during_rebuild_is_not_lost(database, monkeypatch):
+    now = datetime.now(timezone.utc)
+    snapshot = server.student_summary_snapshot
+    snapshots = []
+
+    async def snapshot_then_answer(user_id):
+        summary = await snapshot(user_id)
+        snapshots.append(summary)
+        if len(snapshots) == 1:
+            # Lands after the snapshot was read but before it is written
+            doc = progress(user_id, "c2", now + timedelta(days=1))
+            await database.student_progress.insert_one(doc)
+            await server.apply_progress_to_summary(user_id, None, doc)
+        return summary
+
+    monkeypatch.setattr(server, "student_summary_snapshot", snapshot_then_answer)
+
+    async def scenario():
+        await database.student_progress.insert_one(progress("s1", "c1", now + timedelta(days=1)))
+        await server.rebuild_student_summary("s1")
+        return await database.student_summary.find_one({"user_id": "s1"}, {"_id": 0})
+
+    summary = asyncio.run(scenario())
+    assert len(snapshots) == 2
+    assert summary["total_items"] == 2
+    assert "rebuilding" not in summary
+
+
+def test_dashboard_rebuilds_a_summary_left_mid_rebuild(database, seed_user, api):
+    async def scenario():
+        headers = await seed_user("s1")
+        await database.student_progress.insert_one(progress("s1", "c1", datetime.now(timezone.utc) + timedelta(days=1)))
+        await database.student_summary.insert_one({"user_id": "s1", "rebuilding": True, "revision": 4, "total_items": 7})
+        async with api() as client:
+            return (await client.get("/api/student/dashboard", headers=headers)).json()
+
+    assert asyncio.run(scenario())["progress"]["total_items"] == 1
+
+
+def test_repeated_completion_records_the_quiz_once(database, seed_user, api):
+    async def scenario():
+        headers = await seed_user("s1")
+        await database.quiz_sessions.insert_one({
+            "session_id": "q1", "user_id": "s1", "started_at": datetime.now(timezone.utc).isoformat(),
+            "completed_at": None, "score": 3, "total_questions": 5,
+        })
+        async with api() as client:
+            await client.get("/api/student/dashboard", headers=headers)
+            first = (await client.post("/api/quiz/complete", params={"session_id": "q1"}, headers=headers)).json()
+            second = (await client.post("/api/quiz/complete", params={"session_id": "q1"}, headers=headers)).json()
+            dashboard = (await client.get("/api/student/dashboard", headers=headers)).json()
+        return first, second, dashboard
+
+    first, second, dashboard = asyncio.run(scenario())
+    assert first["xp_earned"] == 30
+    assert second["xp_earned"] == 0 and second["score"] == 3
+    assert len(dashboard["recent_quizzes"]) == 1
+    assert dashboard["rewards"]["xp"] == 30